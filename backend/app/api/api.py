@@ -1,11 +1,25 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 
-from app.api.routers import users, budgets, categories, accounts, transactions, auth
+from app.api.routers import (
+    users,
+    budgets,
+    categories,
+    accounts,
+    transactions,
+    auth,
+    batch,
+)
+from app.utils.rate_limit import limit_client
 
 api_router = APIRouter()
 
-# Auth routes
-api_router.include_router(auth.router, prefix="/auth", tags=["auth"])
+# Auth routes, rate limited by client address as most run before a user is known
+api_router.include_router(
+    auth.router,
+    prefix="/auth",
+    tags=["auth"],
+    dependencies=[Depends(limit_client)],
+)
 
 # Protected routes
 api_router.include_router(users.router, prefix="/users", tags=["users"])
@@ -15,3 +29,6 @@ api_router.include_router(accounts.router, prefix="/accounts", tags=["accounts"]
 api_router.include_router(
     transactions.router, prefix="/transactions", tags=["transactions"]
 )
+
+# Runs requests to the routers above in one round trip
+api_router.include_router(batch.router, prefix="/batch", tags=["batch"])
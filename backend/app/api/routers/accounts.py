@@ -1,11 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from typing import List, Optional
 from uuid import UUID
 from supabase import Client
 
 from app.models.account import Account, AccountCreate, AccountRead
-from app.db.deps import get_supabase
+from app.db.deps import get_loader, get_supabase
+from app.db.loader import Loader
+from app.db.reads import execute_read
+from app.db.rls import rls_enabled
 from app.utils.auth import get_current_user
+from app.utils.responses import fast_list_response, read_columns
+from app.utils.concurrency import parse_if_match, precondition_failed, set_etag
+from app.utils.events import changes
+from app.utils.money import decode_row, decode_rows, encode_amount
 
 router = APIRouter()
 
@@ -15,26 +22,25 @@ async def create_account(
     account_in: AccountCreate,
     current_user_id: str = Depends(get_current_user),
     db: Client = Depends(get_supabase),
+    loader: Loader = Depends(get_loader),
 ) -> AccountRead:
     """
     Create a new account for a budget.
     """
     try:
         # Check if budget exists and belongs to user
-        budget_result = (
-            db.table("budgets")
-            .select("id")
-            .eq("id", str(account_in.budget_id))
-            .eq("user_id", current_user_id)
-            .execute()
+        budget_result = await loader.budget_access(
+            str(account_in.budget_id), current_user_id
         )
 
-        if not budget_result.data:
+        if budget_result is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Budget not found or you don't have access to it",
             )
 
+        exponent = budget_result["currency_exponent"]
+
         # Create the account
         result = (
             db.table("accounts")
@@ -42,7 +48,7 @@ async def create_account(
                 {
                     "name": account_in.name,
                     "type": account_in.type,
-                    "balance": str(account_in.balance),
+                    "balance": encode_amount(account_in.balance, exponent),
                     "budget_id": str(account_in.budget_id),
                 }
             )
@@ -55,7 +61,10 @@ async def create_account(
                 detail="Failed to create account",
             )
 
-        return AccountRead(**result.data[0])
+        changes.publish(
+            str(account_in.budget_id), "account", result.data[0]["id"], "insert"
+        )
+        return AccountRead(**decode_row(result.data[0], ("balance",), exponent))
 
     except HTTPException:
         raise
@@ -70,47 +79,41 @@ async def get_accounts(
     budget_id: UUID = None,
     current_user_id: str = Depends(get_current_user),
     db: Client = Depends(get_supabase),
+    loader: Loader = Depends(get_loader),
 ) -> List[AccountRead]:
     """
     Get all accounts, optionally filtered by budget_id.
     """
     try:
-        query = db.table("accounts").select("*")
+        query = db.table("accounts").select(read_columns(AccountRead))
 
         if budget_id:
             # Verify budget belongs to user
-            budget_check = (
-                db.table("budgets")
-                .select("id")
-                .eq("id", str(budget_id))
-                .eq("user_id", current_user_id)
-                .execute()
-            )
+            budget_check = await loader.budget_access(str(budget_id), current_user_id)
 
-            if not budget_check.data:
+            if budget_check is None:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail="Budget not found or you don't have access to it",
                 )
 
+            exponents = {str(budget_id): budget_check["currency_exponent"]}
             query = query.eq("budget_id", str(budget_id))
         else:
             # Get all budgets for the user
-            budgets = (
-                db.table("budgets")
-                .select("id")
-                .eq("user_id", current_user_id)
-                .execute()
-            )
+            budgets = await loader.owned_budgets(current_user_id)
 
-            if not budgets.data:
+            if not budgets:
                 return []
 
-            budget_ids = [budget["id"] for budget in budgets.data]
-            query = query.in_("budget_id", budget_ids)
+            exponents = {
+                budget["id"]: budget["currency_exponent"] for budget in budgets
+            }
+            query = query.in_("budget_id", list(exponents))
 
-        result = query.execute()
-        return [AccountRead(**account) for account in result.data]
+        result = await execute_read(query)
+        decode_rows(result.data, ("balance",), exponents)
+        return fast_list_response(result.data, decimal_fields=("balance",))
 
     except HTTPException:
         raise
@@ -123,39 +126,37 @@ async def get_accounts(
 @router.get("/{account_id}", response_model=AccountRead)
 async def get_account(
     account_id: UUID,
+    response: Response,
     current_user_id: str = Depends(get_current_user),
     db: Client = Depends(get_supabase),
+    loader: Loader = Depends(get_loader),
 ) -> AccountRead:
     """
     Get a specific account by ID.
     """
     try:
         # First get the account
-        result = db.table("accounts").select("*").eq("id", str(account_id)).execute()
+        account = await loader.load("accounts", str(account_id))
 
-        if not result.data:
+        if account is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Account not found"
             )
 
-        account = result.data[0]
-
         # Now verify the budget belongs to the user
-        budget_check = (
-            db.table("budgets")
-            .select("id")
-            .eq("id", account["budget_id"])
-            .eq("user_id", current_user_id)
-            .execute()
-        )
+        budget_check = await loader.budget_access(account["budget_id"], current_user_id)
 
-        if not budget_check.data:
+        if budget_check is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Account not found or you don't have access to it",
             )
 
-        return AccountRead(**account)
+        account = AccountRead(
+            **decode_row(account, ("balance",), budget_check["currency_exponent"])
+        )
+        set_etag(response, account.version)
+        return account
 
     except HTTPException:
         raise
@@ -169,71 +170,121 @@ async def get_account(
 async def update_account(
     account_id: UUID,
     account_in: AccountCreate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
     current_user_id: str = Depends(get_current_user),
     db: Client = Depends(get_supabase),
+    loader: Loader = Depends(get_loader),
 ) -> AccountRead:
     """
     Update an account.
+
+    Send the account's version in an If-Match header to skip fetching it
+    first. The update fails with 412 if the account has changed since that
+    version was read.
     """
     try:
-        # First get the account
-        existing_result = (
-            db.table("accounts").select("*").eq("id", str(account_id)).execute()
-        )
+        expected_version = parse_if_match(if_match)
 
-        if not existing_result.data:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND, detail="Account not found"
-            )
+        if expected_version is None:
+            # First get the account
+            existing_account = await loader.load("accounts", str(account_id))
 
-        existing_account = existing_result.data[0]
+            if existing_account is None:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND, detail="Account not found"
+                )
 
-        # Verify the current budget belongs to the user
-        current_budget_check = (
-            db.table("budgets")
-            .select("id")
-            .eq("id", existing_account["budget_id"])
-            .eq("user_id", current_user_id)
-            .execute()
-        )
+            expected_version = existing_account["version"]
 
-        if not current_budget_check.data:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Account not found or you don't have access to it",
+            # Verify the current budget belongs to the user
+            current_budget_check = await loader.budget_access(
+                existing_account["budget_id"], current_user_id
             )
 
-        # Check if new budget_id belongs to user
-        if existing_account["budget_id"] != str(account_in.budget_id):
-            budget_check = (
-                db.table("budgets")
-                .select("id")
-                .eq("id", str(account_in.budget_id))
-                .eq("user_id", current_user_id)
-                .execute()
-            )
+            if current_budget_check is None:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Account not found or you don't have access to it",
+                )
+
+            owned_budget_ids = [existing_account["budget_id"]]
+            target_budget = current_budget_check
 
-            if not budget_check.data:
+            # Check if new budget_id belongs to user
+            if existing_account["budget_id"] != str(account_in.budget_id):
+                budget_check = await loader.budget_access(
+                    str(account_in.budget_id), current_user_id
+                )
+
+                if budget_check is None:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail="Invalid budget ID",
+                    )
+
+                target_budget = budget_check
+        else:
+            # Get all budgets for the user, covering both the current and new budget
+            budgets = await loader.owned_budgets(current_user_id)
+
+            owned_budgets = {budget["id"]: budget for budget in budgets}
+            owned_budget_ids = list(owned_budgets)
+            target_budget = owned_budgets.get(str(account_in.budget_id))
+
+            if target_budget is None:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid budget ID"
                 )
 
-        # Update the account
+        exponent = target_budget["currency_exponent"]
+
+        # Update the account only if nobody else has changed it
         result = (
             db.table("accounts")
             .update(
                 {
                     "name": account_in.name,
                     "type": account_in.type,
-                    "balance": str(account_in.balance),
+                    "balance": encode_amount(account_in.balance, exponent),
                     "budget_id": str(account_in.budget_id),
+                    "version": expected_version + 1,
                 }
             )
             .eq("id", str(account_id))
+            .in_("budget_id", owned_budget_ids)
+            .eq("version", expected_version)
             .execute()
         )
 
-        return AccountRead(**result.data[0])
+        if not result.data:
+            existing_result = (
+                db.table("accounts")
+                .select("id")
+                .eq("id", str(account_id))
+                .in_("budget_id", owned_budget_ids)
+                .execute()
+            )
+
+            if not existing_result.data:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Account not found or you don't have access to it",
+                )
+
+            raise precondition_failed()
+
+        # The row may have moved out of one of the budgets it was looked up in
+        changes.publish(
+            str(account_in.budget_id),
+            "account",
+            str(account_id),
+            "update",
+            moved_from=owned_budget_ids,
+        )
+        account = AccountRead(**decode_row(result.data[0], ("balance",), exponent))
+        set_etag(response, account.version)
+        return account
 
     except HTTPException:
         raise
@@ -248,33 +299,38 @@ async def delete_account(
     account_id: UUID,
     current_user_id: str = Depends(get_current_user),
     db: Client = Depends(get_supabase),
+    loader: Loader = Depends(get_loader),
 ) -> None:
     """
     Delete an account.
     """
     try:
+        if rls_enabled():
+            # RLS policies only let the user delete rows of their own budgets
+            result = db.table("accounts").delete().eq("id", str(account_id)).execute()
+            if not result.data:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND, detail="Account not found"
+                )
+            changes.publish(
+                result.data[0]["budget_id"], "account", str(account_id), "delete"
+            )
+            return
+
         # First get the account
-        existing_result = (
-            db.table("accounts").select("*").eq("id", str(account_id)).execute()
-        )
+        existing_account = await loader.load("accounts", str(account_id))
 
-        if not existing_result.data:
+        if existing_account is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Account not found"
             )
 
-        existing_account = existing_result.data[0]
-
         # Verify the budget belongs to the user
-        budget_check = (
-            db.table("budgets")
-            .select("id")
-            .eq("id", existing_account["budget_id"])
-            .eq("user_id", current_user_id)
-            .execute()
+        budget_check = await loader.budget_access(
+            existing_account["budget_id"], current_user_id
         )
 
-        if not budget_check.data:
+        if budget_check is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Account not found or you don't have access to it",
@@ -282,6 +338,9 @@ async def delete_account(
 
         # Delete the account
         db.table("accounts").delete().eq("id", str(account_id)).execute()
+        changes.publish(
+            existing_account["budget_id"], "account", str(account_id), "delete"
+        )
 
     except HTTPException:
         raise
@@ -1,20 +1,26 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Optional
 from supabase import Client
 from app.db.deps import get_supabase, get_supabase_admin
-from app.models.auth import UserLogin, UserRegister, Token
-from app.utils.auth import create_access_token
-from passlib.context import CryptContext
+from app.db.replica import recent_writers
+from app.db.rls import rls_enabled, user_clients
+from app.models.auth import (
+    UserLogin,
+    UserRegister,
+    Token,
+    TokenLogout,
+    TokenRefresh,
+    TokenRevoke,
+)
+from app.utils.auth import (
+    decode_token,
+    get_current_user,
+    issue_tokens,
+    oauth2_scheme,
+    revoke_token,
+)
 
 router = APIRouter()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
-
-
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
 
 
 @router.post("/register", response_model=Token)
@@ -50,9 +56,13 @@ async def register(
                 status_code=status.HTTP_400_BAD_REQUEST, detail="Failed to create user"
             )
 
-        # Create user in database using admin client to bypass RLS
+        # Create user in database, as the new user in RLS mode and otherwise
+        # using the admin client to bypass RLS
+        users_db = (
+            user_clients.get(auth_response.user.id) if rls_enabled() else admin_db
+        )
         result = (
-            admin_db.table("users")
+            users_db.table("users")
             .insert(
                 {
                     "id": auth_response.user.id,
@@ -69,10 +79,10 @@ async def register(
                 detail="Failed to create user profile",
             )
 
-        # Create access token
-        access_token = create_access_token(auth_response.user.id)
+        # The replica may not have the new user yet
+        recent_writers.record_write(auth_response.user.id)
 
-        return Token(access_token=access_token)
+        return await issue_tokens(db, auth_response.user.id)
 
     except HTTPException:
         raise
@@ -85,7 +95,7 @@ async def register(
 @router.post("/login", response_model=Token)
 async def login(user_in: UserLogin, db: Client = Depends(get_supabase)) -> Token:
     """
-    Login user and return access token.
+    Login user and return access and refresh tokens.
     """
     try:
         # Authenticate with Supabase
@@ -99,10 +109,94 @@ async def login(user_in: UserLogin, db: Client = Depends(get_supabase)) -> Token
                 detail="Incorrect email or password",
             )
 
-        # Create access token
-        access_token = create_access_token(auth_response.user.id)
+        return await issue_tokens(db, auth_response.user.id)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)
+        )
+
+
+@router.post("/refresh", response_model=Token)
+async def refresh(token_in: TokenRefresh, db: Client = Depends(get_supabase)) -> Token:
+    """
+    Exchange a refresh token for new access and refresh tokens.
+
+    The new access token lists the user's current budgets. The refresh token
+    is rotated, so each one can be used only once: it is revoked before new
+    tokens are issued, and a token another request or worker revoked first is
+    rejected.
+    """
+    try:
+        token_data = decode_token(token_in.refresh_token, typ="refresh")
+
+        if not revoke_token(token_data):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Could not validate credentials",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+
+        return await issue_tokens(db, token_data.sub)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)
+        )
+
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(
+    logout_in: Optional[TokenLogout] = None,
+    token: str = Depends(oauth2_scheme),
+    current_user_id: str = Depends(get_current_user),
+) -> None:
+    """
+    Revoke the access token of the request, and the refresh token if given.
+    """
+    try:
+        revoke_token(decode_token(token))
+
+        if logout_in is not None and logout_in.refresh_token:
+            refresh_data = decode_token(logout_in.refresh_token, typ="refresh")
+
+            if refresh_data.sub == current_user_id:
+                revoke_token(refresh_data)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)
+        )
+
+
+@router.post("/revoke", status_code=status.HTTP_204_NO_CONTENT)
+async def revoke(
+    revoke_in: TokenRevoke, current_user_id: str = Depends(get_current_user)
+) -> None:
+    """
+    Revoke one of the user's access or refresh tokens, e.g. one issued to
+    another device.
+    """
+    try:
+        try:
+            token_data = decode_token(revoke_in.token, typ=None)
+        except HTTPException:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid token"
+            )
+
+        if token_data.sub != current_user_id:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Token not found"
+            )
 
-        return Token(access_token=access_token)
+        revoke_token(token_data)
 
     except HTTPException:
         raise
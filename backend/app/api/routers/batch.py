@@ -0,0 +1,168 @@
+import asyncio
+import time
+from typing import List
+from urllib.parse import urlsplit
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from app.config.settings import settings
+from app.db.reads import request_deadline
+from app.models.batch import BatchItem, BatchItemResult, BatchRequest
+from app.utils.auth import get_current_user
+from app.utils.responses import FastJSONResponse
+
+router = APIRouter()
+
+# Routers a batch may call
+BATCH_PATHS = ("/api/budgets", "/api/categories", "/api/accounts", "/api/transactions")
+# Streaming routes, whose responses never complete
+STREAMING_SUFFIXES = ("/events",)
+# Headers of a sub-response returned in its result
+RESULT_HEADERS = ("etag", "retry-after", "idempotent-replayed")
+
+
+def _allowed(path: str) -> bool:
+    if path.rstrip("/").endswith(STREAMING_SUFFIXES):
+        return False
+    return any(
+        path == prefix or path.startswith(prefix + "/") for prefix in BATCH_PATHS
+    )
+
+
+def _result(status_code: int, detail: str) -> dict:
+    return {"status": status_code, "headers": {}, "body": {"detail": detail}}
+
+
+async def _dispatch(request: Request, item: BatchItem) -> dict:
+    """
+    Runs a sub-request through the whole application, as if it had been sent
+    on its own with the batch's credentials, and returns its result.
+    """
+    url = urlsplit(item.path)
+    if not _allowed(url.path):
+        return _result(status.HTTP_400_BAD_REQUEST, "Path cannot be used in a batch")
+
+    body = orjson.dumps(item.body) if item.body is not None else b""
+    headers = {
+        name.lower(): value
+        for name, value in item.headers.items()
+        if name.lower() not in ("authorization", "content-length", "host")
+    }
+    headers["authorization"] = request.headers.get("authorization", "")
+    headers["content-type"] = "application/json"
+    headers["content-length"] = str(len(body))
+    deadline = request_deadline.get()
+    if deadline is not None:
+        # Sub-requests share what is left of the batch's time budget
+        remaining_ms = max(0.0, (deadline - time.monotonic()) * 1000)
+        headers["x-request-timeout"] = f"{remaining_ms:.0f}"
+
+    scope = {
+        "type": "http",
+        "asgi": request.scope.get("asgi", {"version": "3.0"}),
+        "http_version": request.scope.get("http_version", "1.1"),
+        "method": item.method,
+        "scheme": request.url.scheme,
+        "server": request.scope.get("server"),
+        "client": request.scope.get("client"),
+        "root_path": request.scope.get("root_path", ""),
+        "path": url.path,
+        "raw_path": url.path.encode(),
+        "query_string": url.query.encode(),
+        "headers": [(name.encode(), value.encode()) for name, value in headers.items()],
+        "state": dict(request.scope.get("state") or {}),
+    }
+
+    sent = False
+    finished = asyncio.Event()
+
+    async def receive() -> dict:
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    response = {"status": 500, "headers": [], "body": []}
+
+    async def send(message: dict) -> None:
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = message.get("headers", [])
+        elif message["type"] == "http.response.body":
+            response["body"].append(message.get("body", b""))
+
+    try:
+        await request.app(scope, receive, send)
+    except Exception as e:
+        return _result(status.HTTP_500_INTERNAL_SERVER_ERROR, str(e))
+    finally:
+        finished.set()
+
+    result_headers = {}
+    content_type = ""
+    for name, value in response["headers"]:
+        name = name.decode("latin-1").lower()
+        if name in RESULT_HEADERS:
+            result_headers[name] = value.decode("latin-1")
+        elif name == "content-type":
+            content_type = value.decode("latin-1")
+
+    content = b"".join(response["body"])
+    if not content:
+        result_body = None
+    elif content_type.startswith("application/json"):
+        # Embedded as encoded, without parsing it again
+        result_body = orjson.Fragment(content)
+    else:
+        result_body = content.decode("utf-8", "replace")
+    return {
+        "status": response["status"],
+        "headers": result_headers,
+        "body": result_body,
+    }
+
+
+@router.post("/", response_model=List[BatchItemResult])
+async def batch(
+    request: Request,
+    batch_in: BatchRequest,
+    current_user_id: str = Depends(get_current_user),
+) -> FastJSONResponse:
+    """
+    Run several API requests in one round trip, returning their results in
+    order. Requests run concurrently, or one after the other in sequential
+    mode, where the requests after a failure are skipped with 424.
+    """
+    if len(batch_in.requests) > settings.BATCH_MAX_REQUESTS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A batch holds at most {settings.BATCH_MAX_REQUESTS} requests",
+        )
+
+    results: List[dict] = []
+    if batch_in.sequential:
+        failed = False
+        for item in batch_in.requests:
+            if failed:
+                results.append(
+                    _result(
+                        status.HTTP_424_FAILED_DEPENDENCY,
+                        "Skipped after an earlier request failed",
+                    )
+                )
+                continue
+            results.append(await _dispatch(request, item))
+            failed = results[-1]["status"] >= 400
+    else:
+        semaphore = asyncio.Semaphore(settings.BATCH_CONCURRENCY)
+
+        async def limited(item: BatchItem) -> dict:
+            async with semaphore:
+                return await _dispatch(request, item)
+
+        results = list(
+            await asyncio.gather(*(limited(item) for item in batch_in.requests))
+        )
+
+    return FastJSONResponse(results)
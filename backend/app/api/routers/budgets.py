@@ -1,13 +1,128 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Callable, List, Optional, Union
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response, status
+from fastapi.responses import StreamingResponse
+from postgrest.exceptions import APIError
 from supabase import Client
-from app.db.deps import get_supabase
-from app.models.budget import Budget, BudgetCreate, BudgetRead
-from app.utils.auth import get_current_user
+from app.config.settings import settings
+from app.db.deps import get_loader, get_supabase
+from app.db.loader import Loader
+from app.db.membership import membership_versions
+from app.db.reads import execute_read
+from app.db.purge import (
+    PURGE_TABLES,
+    UNFINISHED,
+    budget_purger,
+    get_deletion,
+    record_deletion,
+)
+from app.models.budget import (
+    Budget,
+    BudgetClone,
+    BudgetCreate,
+    BudgetDeletionStatus,
+    BudgetRead,
+    BudgetSummary,
+)
+from app.utils.auth import decode_token, get_current_user, oauth2_scheme
+from app.utils.responses import fast_list_response, read_columns
+from app.utils.concurrency import parse_if_match, precondition_failed, set_etag
+from app.utils.events import changes, stream_changes
+from app.utils.money import encode_amount, from_minor, stored_to_minor
 from uuid import UUID
 
 router = APIRouter()
 
+# Postgres error raised when the one-default-budget-per-user index is violated
+UNIQUE_VIOLATION = "23505"
+DEFAULT_CLAIM_ATTEMPTS = 3
+
+
+def _copy_budget_contents(
+    db: Client,
+    budget_id: str,
+    categories: List[dict],
+    accounts: List[dict],
+    clone_in: BudgetClone,
+    zero: Union[int, str],
+) -> None:
+    """
+    Copies categories and accounts into a cloned budget in bulk.
+    """
+    if categories:
+        db.table("categories").insert(
+            [
+                {
+                    "name": category["name"],
+                    "allocated": (
+                        category["allocated"] if clone_in.include_allocations else zero
+                    ),
+                    "budget_id": budget_id,
+                }
+                for category in categories
+            ]
+        ).execute()
+
+    if accounts:
+        db.table("accounts").insert(
+            [
+                {
+                    "name": account["name"],
+                    "type": account["type"],
+                    "balance": (
+                        account["balance"] if clone_in.include_balances else zero
+                    ),
+                    "budget_id": budget_id,
+                }
+                for account in accounts
+            ]
+        ).execute()
+
+
+def _discard_budget(db: Client, budget_id: str, user_id: str) -> None:
+    """
+    Soft-deletes a budget whose creation failed part way and queues it for
+    purging, like a deleted budget.
+    """
+    db.table("budgets").update(
+        {"deleted_at": datetime.now(timezone.utc).isoformat(), "is_default": False}
+    ).eq("id", budget_id).eq("user_id", user_id).execute()
+    record_deletion(budget_id, user_id)
+    budget_purger.notify()
+
+
+def _write_default_budget(
+    db: Client, current_user_id: str, write: Callable, budget_id: Optional[str] = None
+):
+    """
+    Run a write that marks a budget as the user's default.
+
+    A partial unique index allows only one default budget per user, so the
+    write is attempted first and the current default is cleared only when the
+    index rejects it. Concurrent requests serialise on the index instead of
+    racing to unset each other's defaults. Subscribers of a budget whose
+    default flag was cleared are sent an update.
+    """
+    for attempt in range(DEFAULT_CLAIM_ATTEMPTS):
+        try:
+            return write()
+        except APIError as e:
+            if e.code != UNIQUE_VIOLATION or attempt == DEFAULT_CLAIM_ATTEMPTS - 1:
+                raise
+
+        query = (
+            db.table("budgets")
+            .update({"is_default": False})
+            .eq("user_id", current_user_id)
+            .eq("is_default", True)
+        )
+        if budget_id is not None:
+            query = query.neq("id", budget_id)
+        for cleared in query.execute().data:
+            changes.publish(str(cleared["id"]), "budget", str(cleared["id"]), "update")
+
 
 @router.post("/", response_model=BudgetRead, status_code=status.HTTP_201_CREATED)
 async def create_budget(
@@ -19,24 +134,26 @@ async def create_budget(
     Create a new budget for the user.
     """
     try:
-        # If this is set as default, unset any existing default budget
-        if budget_in.is_default:
-            db.table("budgets").update({"is_default": False}).eq(
-                "user_id", current_user_id
-            ).execute()
-
         # Create the new budget
-        result = (
-            db.table("budgets")
-            .insert(
-                {
-                    "name": budget_in.name,
-                    "is_default": budget_in.is_default,
-                    "user_id": current_user_id,
-                }
+        def write():
+            return (
+                db.table("budgets")
+                .insert(
+                    {
+                        "name": budget_in.name,
+                        "is_default": budget_in.is_default,
+                        "currency_exponent": budget_in.currency_exponent,
+                        "user_id": current_user_id,
+                    }
+                )
+                .execute()
             )
-            .execute()
-        )
+
+        # If this is set as default, take over from any existing default budget
+        if budget_in.is_default:
+            result = _write_default_budget(db, current_user_id, write)
+        else:
+            result = write()
 
         if not result.data:
             raise HTTPException(
@@ -44,8 +161,13 @@ async def create_budget(
                 detail="Failed to create budget",
             )
 
+        # Issued tokens no longer list all of the user's budgets
+        membership_versions.forget(current_user_id)
+
         return BudgetRead(**result.data[0])
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)
@@ -60,11 +182,16 @@ async def get_budgets(
     Get all budgets for the user.
     """
     try:
-        result = (
-            db.table("budgets").select("*").eq("user_id", current_user_id).execute()
+        result = await execute_read(
+            db.table("budgets")
+            .select(read_columns(BudgetRead))
+            .eq("user_id", current_user_id)
+            .is_("deleted_at", "null")
         )
-        return [BudgetRead(**budget) for budget in result.data]
+        return fast_list_response(result.data)
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)
@@ -74,27 +201,25 @@ async def get_budgets(
 @router.get("/{budget_id}", response_model=BudgetRead)
 async def get_budget(
     budget_id: UUID,
+    response: Response,
     current_user_id: str = Depends(get_current_user),
     db: Client = Depends(get_supabase),
+    loader: Loader = Depends(get_loader),
 ) -> BudgetRead:
     """
     Get a specific budget by ID.
     """
     try:
-        result = (
-            db.table("budgets")
-            .select("*")
-            .eq("id", str(budget_id))
-            .eq("user_id", current_user_id)
-            .execute()
-        )
+        result = await loader.owned_budget(str(budget_id), current_user_id)
 
-        if not result.data:
+        if result is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Budget not found"
             )
 
-        return BudgetRead(**result.data[0])
+        budget = BudgetRead(**result)
+        set_etag(response, budget.version)
+        return budget
 
     except HTTPException:
         raise
@@ -108,42 +233,227 @@ async def get_budget(
 async def update_budget(
     budget_id: UUID,
     budget_in: BudgetCreate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
     current_user_id: str = Depends(get_current_user),
     db: Client = Depends(get_supabase),
+    loader: Loader = Depends(get_loader),
 ) -> BudgetRead:
     """
     Update a budget.
+
+    Send the budget's version in an If-Match header to skip the existence
+    check. The update fails with 412 if the budget has changed since that
+    version was read.
+    """
+    try:
+        expected_version = parse_if_match(if_match)
+        prefetched = expected_version is None
+
+        if prefetched:
+            # Check if budget exists and belongs to user
+            existing = await loader.owned_budget(str(budget_id), current_user_id)
+
+            if existing is None:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND, detail="Budget not found"
+                )
+
+            expected_version = existing["version"]
+
+        # Update the budget only if nobody else has changed it
+        def write():
+            return (
+                db.table("budgets")
+                .update(
+                    {
+                        "name": budget_in.name,
+                        "is_default": budget_in.is_default,
+                        "version": expected_version + 1,
+                    }
+                )
+                .eq("id", str(budget_id))
+                .eq("user_id", current_user_id)
+                .is_("deleted_at", "null")
+                .eq("version", expected_version)
+                .execute()
+            )
+
+        # If setting as default, take over from the other default budget
+        if budget_in.is_default:
+            result = _write_default_budget(
+                db, current_user_id, write, budget_id=str(budget_id)
+            )
+        else:
+            result = write()
+
+        if not result.data:
+            if not prefetched:
+                existing = await loader.owned_budget(str(budget_id), current_user_id)
+
+                if existing is None:
+                    raise HTTPException(
+                        status_code=status.HTTP_404_NOT_FOUND,
+                        detail="Budget not found",
+                    )
+
+            raise precondition_failed()
+
+        changes.publish(str(budget_id), "budget", str(budget_id), "update")
+        budget = BudgetRead(**result.data[0])
+        set_etag(response, budget.version)
+        return budget
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)
+        )
+
+
+@router.get("/{budget_id}/summary", response_model=BudgetSummary)
+async def get_budget_summary(
+    budget_id: UUID,
+    current_user_id: str = Depends(get_current_user),
+    db: Client = Depends(get_supabase),
+    loader: Loader = Depends(get_loader),
+) -> BudgetSummary:
+    """
+    Get the account and allocation totals of a budget.
+
+    Totals are computed on integer minor units so they are exact whichever
+    way amounts are stored.
     """
     try:
         # Check if budget exists and belongs to user
-        existing = (
-            db.table("budgets")
-            .select("*")
-            .eq("id", str(budget_id))
-            .eq("user_id", current_user_id)
-            .execute()
+        existing = await loader.budget_access(str(budget_id), current_user_id)
+
+        if existing is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Budget not found"
+            )
+
+        exponent = existing["currency_exponent"]
+
+        accounts = await execute_read(
+            db.table("accounts").select("balance").eq("budget_id", str(budget_id))
+        )
+        categories = await execute_read(
+            db.table("categories").select("allocated").eq("budget_id", str(budget_id))
         )
 
-        if not existing.data:
+        total_balance = sum(
+            [stored_to_minor(account["balance"], exponent) for account in accounts.data]
+        )
+        total_allocated = sum(
+            [
+                stored_to_minor(category["allocated"], exponent)
+                for category in categories.data
+            ]
+        )
+
+        return BudgetSummary(
+            budget_id=budget_id,
+            total_balance=from_minor(total_balance, exponent),
+            total_allocated=from_minor(total_allocated, exponent),
+            to_be_budgeted=from_minor(total_balance - total_allocated, exponent),
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)
+        )
+
+
+@router.post(
+    "/{budget_id}/clone",
+    response_model=BudgetRead,
+    status_code=status.HTTP_201_CREATED,
+)
+async def clone_budget(
+    budget_id: UUID,
+    clone_in: BudgetClone,
+    current_user_id: str = Depends(get_current_user),
+    db: Client = Depends(get_supabase),
+    loader: Loader = Depends(get_loader),
+) -> BudgetRead:
+    """
+    Create a new budget from an existing one.
+
+    Categories and accounts are copied with one multi-row insert each, so the
+    number of queries does not grow with the size of the source budget.
+    Allocations and account balances are only copied when requested.
+    """
+    try:
+        # Check if source budget exists and belongs to user
+        existing = await loader.budget_access(str(budget_id), current_user_id)
+
+        if existing is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Budget not found"
             )
 
-        # If setting as default, unset other defaults
-        if budget_in.is_default:
-            db.table("budgets").update({"is_default": False}).eq(
-                "user_id", current_user_id
-            ).neq("id", str(budget_id)).execute()
+        exponent = existing["currency_exponent"]
+        zero = encode_amount(Decimal("0.00"), exponent)
 
-        # Update the budget
-        result = (
-            db.table("budgets")
-            .update({"name": budget_in.name, "is_default": budget_in.is_default})
-            .eq("id", str(budget_id))
-            .eq("user_id", current_user_id)
+        categories = (
+            db.table("categories")
+            .select("name, allocated")
+            .eq("budget_id", str(budget_id))
+            .execute()
+        )
+        accounts = (
+            db.table("accounts")
+            .select("name, type, balance")
+            .eq("budget_id", str(budget_id))
             .execute()
         )
 
+        # Create the new budget
+        def write():
+            return (
+                db.table("budgets")
+                .insert(
+                    {
+                        "name": clone_in.name,
+                        "is_default": clone_in.is_default,
+                        "currency_exponent": exponent,
+                        "user_id": current_user_id,
+                    }
+                )
+                .execute()
+            )
+
+        # If this is set as default, take over from any existing default budget
+        if clone_in.is_default:
+            result = _write_default_budget(db, current_user_id, write)
+        else:
+            result = write()
+
+        if not result.data:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Failed to create budget",
+            )
+
+        new_budget_id = result.data[0]["id"]
+
+        try:
+            _copy_budget_contents(
+                db, new_budget_id, categories.data, accounts.data, clone_in, zero
+            )
+        except Exception:
+            # Leave no half-copied budget behind; the purger removes what was
+            # copied
+            _discard_budget(db, new_budget_id, current_user_id)
+            raise
+
+        # Issued tokens no longer list all of the user's budgets
+        membership_versions.forget(current_user_id)
+
         return BudgetRead(**result.data[0])
 
     except HTTPException:
@@ -154,34 +464,179 @@ async def update_budget(
         )
 
 
-@router.delete("/{budget_id}", status_code=status.HTTP_204_NO_CONTENT)
+@router.delete(
+    "/{budget_id}",
+    response_model=BudgetDeletionStatus,
+    status_code=status.HTTP_202_ACCEPTED,
+)
 async def delete_budget(
     budget_id: UUID,
+    request: Request,
+    response: Response,
     current_user_id: str = Depends(get_current_user),
     db: Client = Depends(get_supabase),
-) -> None:
+) -> BudgetDeletionStatus:
     """
     Delete a budget.
+
+    The budget is hidden immediately and its accounts, categories and
+    transactions are purged in the background. Poll the returned status
+    location for progress.
     """
     try:
-        # Check if budget exists and belongs to user
-        existing = (
+        # Mark the budget deleted, provided it exists and belongs to user
+        result = (
             db.table("budgets")
-            .select("*")
+            .update(
+                {
+                    "deleted_at": datetime.now(timezone.utc).isoformat(),
+                    "is_default": False,
+                }
+            )
             .eq("id", str(budget_id))
             .eq("user_id", current_user_id)
+            .is_("deleted_at", "null")
             .execute()
         )
 
-        if not existing.data:
+        if not result.data:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Budget not found"
             )
 
-        # Delete the budget
-        db.table("budgets").delete().eq("id", str(budget_id)).eq(
-            "user_id", current_user_id
-        ).execute()
+        membership_versions.forget(current_user_id)
+        changes.publish(str(budget_id), "budget", str(budget_id), "delete")
+        changes.close(str(budget_id))
+
+        record_deletion(str(budget_id), current_user_id)
+        budget_purger.notify()
+        response.headers["Location"] = str(
+            request.url_for("get_budget_deletion", budget_id=str(budget_id))
+        )
+
+        return BudgetDeletionStatus(budget_id=budget_id, status="pending")
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)
+        )
+
+
+@router.get("/{budget_id}/deletion", response_model=BudgetDeletionStatus)
+async def get_budget_deletion(
+    budget_id: UUID,
+    current_user_id: str = Depends(get_current_user),
+    db: Client = Depends(get_supabase),
+) -> BudgetDeletionStatus:
+    """
+    Get the progress of a budget deletion, as recorded in the database by
+    whichever worker is purging it.
+    """
+    try:
+        deletion = get_deletion(str(budget_id), current_user_id)
+
+        if deletion is None:
+            # The deletion may not have been recorded, so fall back to the budget row
+            existing = await execute_read(
+                db.table("budgets")
+                .select("id")
+                .eq("id", str(budget_id))
+                .eq("user_id", current_user_id)
+                .not_.is_("deleted_at", "null")
+            )
+
+            if not existing.data:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Budget deletion not found",
+                )
+
+            record_deletion(str(budget_id), current_user_id)
+            budget_purger.notify()
+            deletion = get_deletion(str(budget_id), current_user_id)
+
+        remaining = None
+        if deletion["status"] in UNFINISHED:
+            counts = await asyncio.gather(
+                *(
+                    execute_read(
+                        db.table(table)
+                        .select("id", count="exact")
+                        .eq("budget_id", str(budget_id))
+                        .limit(1)
+                    )
+                    for table in PURGE_TABLES
+                )
+            )
+            remaining = {
+                table: result.count or 0 for table, result in zip(PURGE_TABLES, counts)
+            }
+
+        return BudgetDeletionStatus(
+            budget_id=budget_id,
+            status=deletion["status"],
+            remaining=remaining,
+            error=deletion.get("error"),
+            started_at=deletion.get("started_at"),
+            finished_at=deletion.get("finished_at"),
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)
+        )
+
+
+@router.get("/{budget_id}/events")
+async def stream_budget_events(
+    budget_id: UUID,
+    token: str = Depends(oauth2_scheme),
+    current_user_id: str = Depends(get_current_user),
+    loader: Loader = Depends(get_loader),
+) -> StreamingResponse:
+    """
+    Stream the budget's changes as server-sent events.
+
+    Each change event carries the entity ("budget", "category", "account" or
+    "transaction"), its ID and the operation ("insert", "update" or
+    "delete"). The stream opens with a ready event, after which lists fetched
+    are kept current by the changes; it ends with an overflow event if the
+    client falls behind, and should then be reopened. It ends with a closed
+    event when the budget is deleted, or at the first heartbeat after the
+    access token expires or is revoked.
+    """
+    try:
+        # Check if budget exists and belongs to user
+        existing = await loader.budget_access(str(budget_id), current_user_id)
+
+        if existing is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Budget not found"
+            )
+
+        if len(changes) >= settings.EVENTS_MAX_SUBSCRIBERS:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many open event streams",
+                headers={"Retry-After": str(settings.EVENTS_RETRY_SECONDS)},
+            )
+
+        def authorized() -> bool:
+            try:
+                decode_token(token)
+            except HTTPException:
+                return False
+            return True
+
+        return StreamingResponse(
+            stream_changes(str(budget_id), authorized),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
 
     except HTTPException:
         raise
@@ -1,9 +1,16 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
 from supabase import Client
-from app.db.deps import get_supabase
+from app.db.deps import get_loader, get_supabase
+from app.db.loader import Loader
+from app.db.reads import execute_read
+from app.db.rls import rls_enabled
 from app.models.category import Category, CategoryCreate, CategoryRead
 from app.utils.auth import get_current_user
+from app.utils.responses import fast_list_response, read_columns
+from app.utils.concurrency import parse_if_match, precondition_failed, set_etag
+from app.utils.events import changes
+from app.utils.money import decode_row, decode_rows, encode_amount
 from uuid import UUID
 
 router = APIRouter()
@@ -14,33 +21,32 @@ async def create_category(
     category_in: CategoryCreate,
     current_user_id: str = Depends(get_current_user),
     db: Client = Depends(get_supabase),
+    loader: Loader = Depends(get_loader),
 ) -> CategoryRead:
     """
     Create a new category for a budget.
     """
     try:
         # Check if budget exists and belongs to user
-        budget_result = (
-            db.table("budgets")
-            .select("id")
-            .eq("id", str(category_in.budget_id))
-            .eq("user_id", current_user_id)
-            .execute()
+        budget_result = await loader.budget_access(
+            str(category_in.budget_id), current_user_id
         )
 
-        if not budget_result.data:
+        if budget_result is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Budget not found or you don't have access to it",
             )
 
+        exponent = budget_result["currency_exponent"]
+
         # Create the category
         result = (
             db.table("categories")
             .insert(
                 {
                     "name": category_in.name,
-                    "allocated": str(category_in.allocated),
+                    "allocated": encode_amount(category_in.allocated, exponent),
                     "budget_id": str(category_in.budget_id),
                 }
             )
@@ -53,7 +59,10 @@ async def create_category(
                 detail="Failed to create category",
             )
 
-        return CategoryRead(**result.data[0])
+        changes.publish(
+            str(category_in.budget_id), "category", result.data[0]["id"], "insert"
+        )
+        return CategoryRead(**decode_row(result.data[0], ("allocated",), exponent))
 
     except HTTPException:
         raise
@@ -68,47 +77,41 @@ async def get_categories(
     budget_id: UUID = None,
     current_user_id: str = Depends(get_current_user),
     db: Client = Depends(get_supabase),
+    loader: Loader = Depends(get_loader),
 ) -> List[CategoryRead]:
     """
     Get all categories, optionally filtered by budget_id.
     """
     try:
-        query = db.table("categories").select("*")
+        query = db.table("categories").select(read_columns(CategoryRead))
 
         if budget_id:
             # Verify budget belongs to user
-            budget_check = (
-                db.table("budgets")
-                .select("id")
-                .eq("id", str(budget_id))
-                .eq("user_id", current_user_id)
-                .execute()
-            )
+            budget_check = await loader.budget_access(str(budget_id), current_user_id)
 
-            if not budget_check.data:
+            if budget_check is None:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail="Budget not found or you don't have access to it",
                 )
 
+            exponents = {str(budget_id): budget_check["currency_exponent"]}
             query = query.eq("budget_id", str(budget_id))
         else:
             # Get all budgets for the user
-            budgets = (
-                db.table("budgets")
-                .select("id")
-                .eq("user_id", current_user_id)
-                .execute()
-            )
+            budgets = await loader.owned_budgets(current_user_id)
 
-            if not budgets.data:
+            if not budgets:
                 return []
 
-            budget_ids = [budget["id"] for budget in budgets.data]
-            query = query.in_("budget_id", budget_ids)
+            exponents = {
+                budget["id"]: budget["currency_exponent"] for budget in budgets
+            }
+            query = query.in_("budget_id", list(exponents))
 
-        result = query.execute()
-        return [CategoryRead(**category) for category in result.data]
+        result = await execute_read(query)
+        decode_rows(result.data, ("allocated",), exponents)
+        return fast_list_response(result.data, decimal_fields=("allocated",))
 
     except HTTPException:
         raise
@@ -121,39 +124,39 @@ async def get_categories(
 @router.get("/{category_id}", response_model=CategoryRead)
 async def get_category(
     category_id: UUID,
+    response: Response,
     current_user_id: str = Depends(get_current_user),
     db: Client = Depends(get_supabase),
+    loader: Loader = Depends(get_loader),
 ) -> CategoryRead:
     """
     Get a specific category by ID.
     """
     try:
         # First get the category
-        result = db.table("categories").select("*").eq("id", str(category_id)).execute()
+        category = await loader.load("categories", str(category_id))
 
-        if not result.data:
+        if category is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Category not found"
             )
 
-        category = result.data[0]
-
         # Now verify the budget belongs to the user
-        budget_check = (
-            db.table("budgets")
-            .select("id")
-            .eq("id", category["budget_id"])
-            .eq("user_id", current_user_id)
-            .execute()
+        budget_check = await loader.budget_access(
+            category["budget_id"], current_user_id
         )
 
-        if not budget_check.data:
+        if budget_check is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Category not found or you don't have access to it",
             )
 
-        return CategoryRead(**category)
+        category = CategoryRead(
+            **decode_row(category, ("allocated",), budget_check["currency_exponent"])
+        )
+        set_etag(response, category.version)
+        return category
 
     except HTTPException:
         raise
@@ -167,70 +170,120 @@ async def get_category(
 async def update_category(
     category_id: UUID,
     category_in: CategoryCreate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
     current_user_id: str = Depends(get_current_user),
     db: Client = Depends(get_supabase),
+    loader: Loader = Depends(get_loader),
 ) -> CategoryRead:
     """
     Update a category.
+
+    Send the category's version in an If-Match header to skip fetching it
+    first. The update fails with 412 if the category has changed since that
+    version was read.
     """
     try:
-        # First get the category
-        existing_result = (
-            db.table("categories").select("*").eq("id", str(category_id)).execute()
-        )
+        expected_version = parse_if_match(if_match)
 
-        if not existing_result.data:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND, detail="Category not found"
-            )
+        if expected_version is None:
+            # First get the category
+            existing_category = await loader.load("categories", str(category_id))
 
-        existing_category = existing_result.data[0]
+            if existing_category is None:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND, detail="Category not found"
+                )
 
-        # Verify the current budget belongs to the user
-        current_budget_check = (
-            db.table("budgets")
-            .select("id")
-            .eq("id", existing_category["budget_id"])
-            .eq("user_id", current_user_id)
-            .execute()
-        )
+            expected_version = existing_category["version"]
 
-        if not current_budget_check.data:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Category not found or you don't have access to it",
+            # Verify the current budget belongs to the user
+            current_budget_check = await loader.budget_access(
+                existing_category["budget_id"], current_user_id
             )
 
-        # Check if new budget_id belongs to user
-        if existing_category["budget_id"] != str(category_in.budget_id):
-            budget_check = (
-                db.table("budgets")
-                .select("id")
-                .eq("id", str(category_in.budget_id))
-                .eq("user_id", current_user_id)
-                .execute()
-            )
+            if current_budget_check is None:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Category not found or you don't have access to it",
+                )
+
+            owned_budget_ids = [existing_category["budget_id"]]
+            target_budget = current_budget_check
+
+            # Check if new budget_id belongs to user
+            if existing_category["budget_id"] != str(category_in.budget_id):
+                budget_check = await loader.budget_access(
+                    str(category_in.budget_id), current_user_id
+                )
+
+                if budget_check is None:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail="Invalid budget ID",
+                    )
+
+                target_budget = budget_check
+        else:
+            # Get all budgets for the user, covering both the current and new budget
+            budgets = await loader.owned_budgets(current_user_id)
 
-            if not budget_check.data:
+            owned_budgets = {budget["id"]: budget for budget in budgets}
+            owned_budget_ids = list(owned_budgets)
+            target_budget = owned_budgets.get(str(category_in.budget_id))
+
+            if target_budget is None:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid budget ID"
                 )
 
-        # Update the category
+        exponent = target_budget["currency_exponent"]
+
+        # Update the category only if nobody else has changed it
         result = (
             db.table("categories")
             .update(
                 {
                     "name": category_in.name,
-                    "allocated": str(category_in.allocated),
+                    "allocated": encode_amount(category_in.allocated, exponent),
                     "budget_id": str(category_in.budget_id),
+                    "version": expected_version + 1,
                 }
             )
             .eq("id", str(category_id))
+            .in_("budget_id", owned_budget_ids)
+            .eq("version", expected_version)
             .execute()
         )
 
-        return CategoryRead(**result.data[0])
+        if not result.data:
+            existing_result = (
+                db.table("categories")
+                .select("id")
+                .eq("id", str(category_id))
+                .in_("budget_id", owned_budget_ids)
+                .execute()
+            )
+
+            if not existing_result.data:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Category not found or you don't have access to it",
+                )
+
+            raise precondition_failed()
+
+        # The row may have moved out of one of the budgets it was looked up in
+        changes.publish(
+            str(category_in.budget_id),
+            "category",
+            str(category_id),
+            "update",
+            moved_from=owned_budget_ids,
+        )
+        category = CategoryRead(**decode_row(result.data[0], ("allocated",), exponent))
+        set_etag(response, category.version)
+        return category
 
     except HTTPException:
         raise
@@ -245,33 +298,40 @@ async def delete_category(
     category_id: UUID,
     current_user_id: str = Depends(get_current_user),
     db: Client = Depends(get_supabase),
+    loader: Loader = Depends(get_loader),
 ) -> None:
     """
     Delete a category.
     """
     try:
+        if rls_enabled():
+            # RLS policies only let the user delete rows of their own budgets
+            result = (
+                db.table("categories").delete().eq("id", str(category_id)).execute()
+            )
+            if not result.data:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND, detail="Category not found"
+                )
+            changes.publish(
+                result.data[0]["budget_id"], "category", str(category_id), "delete"
+            )
+            return
+
         # First get the category
-        existing_result = (
-            db.table("categories").select("*").eq("id", str(category_id)).execute()
-        )
+        existing_category = await loader.load("categories", str(category_id))
 
-        if not existing_result.data:
+        if existing_category is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Category not found"
             )
 
-        existing_category = existing_result.data[0]
-
         # Verify the budget belongs to the user
-        budget_check = (
-            db.table("budgets")
-            .select("id")
-            .eq("id", existing_category["budget_id"])
-            .eq("user_id", current_user_id)
-            .execute()
+        budget_check = await loader.budget_access(
+            existing_category["budget_id"], current_user_id
         )
 
-        if not budget_check.data:
+        if budget_check is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Category not found or you don't have access to it",
@@ -279,6 +339,9 @@ async def delete_category(
 
         # Delete the category
         db.table("categories").delete().eq("id", str(category_id)).execute()
+        changes.publish(
+            existing_category["budget_id"], "category", str(category_id), "delete"
+        )
 
     except HTTPException:
         raise
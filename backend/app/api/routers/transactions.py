@@ -1,76 +1,95 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
+import asyncio
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from typing import List, Optional, Tuple
 from uuid import UUID
 from supabase import Client
 
 from app.models.transaction import Transaction, TransactionCreate, TransactionRead
-from app.db.deps import get_supabase
+from app.db.deps import get_loader, get_supabase
+from app.db.loader import Loader
+from app.db.outbox import notify_outbox
+from app.db.reads import execute_read
+from app.db.rls import rls_enabled
 from app.utils.auth import get_current_user
+from app.utils.responses import fast_list_response, read_columns
+from app.utils.concurrency import parse_if_match, precondition_failed, set_etag
+from app.utils.events import changes
+from app.utils.money import decode_row, decode_rows, encode_amount
 
 router = APIRouter()
 
 
-@router.post("/", response_model=TransactionRead, status_code=status.HTTP_201_CREATED)
+async def _load_references(
+    loader: Loader, transaction_in: TransactionCreate
+) -> Tuple[Optional[dict], Optional[dict]]:
+    """
+    Loads a transaction's account and category (if provided) together, each
+    only if it belongs to the transaction's budget.
+    """
+    budget_id = str(transaction_in.budget_id)
+    lookups = [
+        loader.load_in_budget("accounts", str(transaction_in.account_id), budget_id)
+    ]
+    if transaction_in.category_id:
+        lookups.append(
+            loader.load_in_budget(
+                "categories", str(transaction_in.category_id), budget_id
+            )
+        )
+    account, *category = await asyncio.gather(*lookups)
+    return account, category[0] if category else None
+
+
+@router.post(
+    "/",
+    response_model=TransactionRead,
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(notify_outbox)],
+)
 async def create_transaction(
     transaction_in: TransactionCreate,
     current_user_id: str = Depends(get_current_user),
     db: Client = Depends(get_supabase),
+    loader: Loader = Depends(get_loader),
 ) -> TransactionRead:
     """
     Create a new transaction.
     """
     try:
-        # Check if budget exists and belongs to user
-        budget_result = (
-            db.table("budgets")
-            .select("id")
-            .eq("id", str(transaction_in.budget_id))
-            .eq("user_id", current_user_id)
-            .execute()
+        # Independent lookups, run together instead of one after another
+        budget_result, (account_result, category_result) = await asyncio.gather(
+            loader.budget_access(str(transaction_in.budget_id), current_user_id),
+            _load_references(loader, transaction_in),
         )
 
-        if not budget_result.data:
+        # Check if budget exists and belongs to user
+        if budget_result is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Budget not found or you don't have access to it",
             )
 
-        # Check if account exists and belongs to the budget
-        account_result = (
-            db.table("accounts")
-            .select("id")
-            .eq("id", str(transaction_in.account_id))
-            .eq("budget_id", str(transaction_in.budget_id))
-            .execute()
-        )
+        exponent = budget_result["currency_exponent"]
 
-        if not account_result.data:
+        # Check if account exists and belongs to the budget
+        if account_result is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Account not found or does not belong to this budget",
             )
 
         # Check if category exists and belongs to the budget (if provided)
-        if transaction_in.category_id:
-            category_result = (
-                db.table("categories")
-                .select("id")
-                .eq("id", str(transaction_in.category_id))
-                .eq("budget_id", str(transaction_in.budget_id))
-                .execute()
+        if transaction_in.category_id and category_result is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Category not found or does not belong to this budget",
             )
 
-            if not category_result.data:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="Category not found or does not belong to this budget",
-                )
-
         # Create the transaction
         transaction_data = {
             "date": transaction_in.date.isoformat(),
             "payee": transaction_in.payee,
-            "amount": str(transaction_in.amount),
+            "amount": encode_amount(transaction_in.amount, exponent),
             "budget_id": str(transaction_in.budget_id),
             "account_id": str(transaction_in.account_id),
             "cleared": transaction_in.cleared,
@@ -90,7 +109,10 @@ async def create_transaction(
                 detail="Failed to create transaction",
             )
 
-        return TransactionRead(**result.data[0])
+        changes.publish(
+            str(transaction_in.budget_id), "transaction", result.data[0]["id"], "insert"
+        )
+        return TransactionRead(**decode_row(result.data[0], ("amount",), exponent))
 
     except HTTPException:
         raise
@@ -107,45 +129,38 @@ async def get_transactions(
     category_id: UUID = None,
     current_user_id: str = Depends(get_current_user),
     db: Client = Depends(get_supabase),
+    loader: Loader = Depends(get_loader),
 ) -> List[TransactionRead]:
     """
     Get all transactions, with optional filtering by budget_id, account_id, or category_id.
     """
     try:
-        query = db.table("transactions").select("*")
+        query = db.table("transactions").select(read_columns(TransactionRead))
 
         # Apply filters if provided
         if budget_id:
             # Verify budget belongs to user
-            budget_check = (
-                db.table("budgets")
-                .select("id")
-                .eq("id", str(budget_id))
-                .eq("user_id", current_user_id)
-                .execute()
-            )
+            budget_check = await loader.budget_access(str(budget_id), current_user_id)
 
-            if not budget_check.data:
+            if budget_check is None:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail="Budget not found or you don't have access to it",
                 )
 
+            exponents = {str(budget_id): budget_check["currency_exponent"]}
             query = query.eq("budget_id", str(budget_id))
         else:
             # Get all budgets for the user
-            budgets = (
-                db.table("budgets")
-                .select("id")
-                .eq("user_id", current_user_id)
-                .execute()
-            )
+            budgets = await loader.owned_budgets(current_user_id)
 
-            if not budgets.data:
+            if not budgets:
                 return []
 
-            budget_ids = [budget["id"] for budget in budgets.data]
-            query = query.in_("budget_id", budget_ids)
+            exponents = {
+                budget["id"]: budget["currency_exponent"] for budget in budgets
+            }
+            query = query.in_("budget_id", list(exponents))
 
         # Apply account filter if provided
         if account_id:
@@ -155,8 +170,9 @@ async def get_transactions(
         if category_id:
             query = query.eq("category_id", str(category_id))
 
-        result = query.execute()
-        return [TransactionRead(**transaction) for transaction in result.data]
+        result = await execute_read(query)
+        decode_rows(result.data, ("amount",), exponents)
+        return fast_list_response(result.data, decimal_fields=("amount",))
 
     except HTTPException:
         raise
@@ -169,41 +185,39 @@ async def get_transactions(
 @router.get("/{transaction_id}", response_model=TransactionRead)
 async def get_transaction(
     transaction_id: UUID,
+    response: Response,
     current_user_id: str = Depends(get_current_user),
     db: Client = Depends(get_supabase),
+    loader: Loader = Depends(get_loader),
 ) -> TransactionRead:
     """
     Get a specific transaction by ID.
     """
     try:
         # First get the transaction
-        result = (
-            db.table("transactions").select("*").eq("id", str(transaction_id)).execute()
-        )
+        transaction = await loader.load("transactions", str(transaction_id))
 
-        if not result.data:
+        if transaction is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Transaction not found"
             )
 
-        transaction = result.data[0]
-
         # Now verify the budget belongs to the user
-        budget_check = (
-            db.table("budgets")
-            .select("id")
-            .eq("id", transaction["budget_id"])
-            .eq("user_id", current_user_id)
-            .execute()
+        budget_check = await loader.budget_access(
+            transaction["budget_id"], current_user_id
         )
 
-        if not budget_check.data:
+        if budget_check is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Transaction not found or you don't have access to it",
             )
 
-        return TransactionRead(**transaction)
+        transaction = TransactionRead(
+            **decode_row(transaction, ("amount",), budget_check["currency_exponent"])
+        )
+        set_etag(response, transaction.version)
+        return transaction
 
     except HTTPException:
         raise
@@ -213,99 +227,117 @@ async def get_transaction(
         )
 
 
-@router.put("/{transaction_id}", response_model=TransactionRead)
+@router.put(
+    "/{transaction_id}",
+    response_model=TransactionRead,
+    dependencies=[Depends(notify_outbox)],
+)
 async def update_transaction(
     transaction_id: UUID,
     transaction_in: TransactionCreate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
     current_user_id: str = Depends(get_current_user),
     db: Client = Depends(get_supabase),
+    loader: Loader = Depends(get_loader),
 ) -> TransactionRead:
     """
     Update a transaction.
+
+    Send the transaction's version in an If-Match header to skip fetching it
+    first. The update fails with 412 if the transaction has changed since
+    that version was read.
     """
     try:
-        # First get the transaction
-        existing_result = (
-            db.table("transactions").select("*").eq("id", str(transaction_id)).execute()
-        )
-
-        if not existing_result.data:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND, detail="Transaction not found"
+        expected_version = parse_if_match(if_match)
+
+        if expected_version is None:
+            # First get the transaction, along with the new budget, account and
+            # category, which do not depend on it
+            (
+                existing_transaction,
+                budget_check,
+                (account_check, category_check),
+            ) = await asyncio.gather(
+                loader.load("transactions", str(transaction_id)),
+                loader.budget_access(str(transaction_in.budget_id), current_user_id),
+                _load_references(loader, transaction_in),
             )
 
-        existing_transaction = existing_result.data[0]
+            if existing_transaction is None:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Transaction not found",
+                )
 
-        # Verify the current budget belongs to the user
-        current_budget_check = (
-            db.table("budgets")
-            .select("id")
-            .eq("id", existing_transaction["budget_id"])
-            .eq("user_id", current_user_id)
-            .execute()
-        )
+            expected_version = existing_transaction["version"]
 
-        if not current_budget_check.data:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Transaction not found or you don't have access to it",
+            # Verify the current budget belongs to the user
+            current_budget_check = await loader.budget_access(
+                existing_transaction["budget_id"], current_user_id
             )
 
-        # Check if new budget_id belongs to user
-        if existing_transaction["budget_id"] != str(transaction_in.budget_id):
-            budget_check = (
-                db.table("budgets")
-                .select("id")
-                .eq("id", str(transaction_in.budget_id))
-                .eq("user_id", current_user_id)
-                .execute()
+            if current_budget_check is None:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Transaction not found or you don't have access to it",
+                )
+
+            owned_budget_ids = [existing_transaction["budget_id"]]
+            target_budget = current_budget_check
+
+            # Check if new budget_id belongs to user
+            if existing_transaction["budget_id"] != str(transaction_in.budget_id):
+                if budget_check is None:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail="Invalid budget ID",
+                    )
+
+                target_budget = budget_check
+        else:
+            # Get all budgets for the user, covering both the current and new
+            # budget, along with the new account and category
+            budgets, (account_check, category_check) = await asyncio.gather(
+                loader.owned_budgets(current_user_id),
+                _load_references(loader, transaction_in),
             )
 
-            if not budget_check.data:
+            owned_budgets = {budget["id"]: budget for budget in budgets}
+            owned_budget_ids = list(owned_budgets)
+            target_budget = owned_budgets.get(str(transaction_in.budget_id))
+
+            if target_budget is None:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid budget ID"
                 )
 
-        # Check if new account belongs to the budget
-        account_check = (
-            db.table("accounts")
-            .select("id")
-            .eq("id", str(transaction_in.account_id))
-            .eq("budget_id", str(transaction_in.budget_id))
-            .execute()
-        )
+        exponent = target_budget["currency_exponent"]
 
-        if not account_check.data:
+        # Check if new account belongs to the budget
+        if account_check is None:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Account not found or does not belong to this budget",
             )
 
         # Check if new category belongs to the budget (if provided)
-        if transaction_in.category_id:
-            category_check = (
-                db.table("categories")
-                .select("id")
-                .eq("id", str(transaction_in.category_id))
-                .eq("budget_id", str(transaction_in.budget_id))
-                .execute()
+        if transaction_in.category_id and category_check is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Category not found or does not belong to this budget",
             )
 
-            if not category_check.data:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Category not found or does not belong to this budget",
-                )
-
         # Update the transaction
         transaction_data = {
             "date": transaction_in.date.isoformat(),
             "payee": transaction_in.payee,
-            "amount": str(transaction_in.amount),
+            "amount": encode_amount(transaction_in.amount, exponent),
             "budget_id": str(transaction_in.budget_id),
             "account_id": str(transaction_in.account_id),
             "cleared": transaction_in.cleared,
             "category_id": None,  # Default to null
+            "version": expected_version + 1,
         }
 
         # Add optional fields if provided
@@ -314,14 +346,46 @@ async def update_transaction(
         if transaction_in.note:
             transaction_data["note"] = transaction_in.note
 
+        # Only update if nobody else has changed it
         result = (
             db.table("transactions")
             .update(transaction_data)
             .eq("id", str(transaction_id))
+            .in_("budget_id", owned_budget_ids)
+            .eq("version", expected_version)
             .execute()
         )
 
-        return TransactionRead(**result.data[0])
+        if not result.data:
+            existing_result = (
+                db.table("transactions")
+                .select("id")
+                .eq("id", str(transaction_id))
+                .in_("budget_id", owned_budget_ids)
+                .execute()
+            )
+
+            if not existing_result.data:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Transaction not found or you don't have access to it",
+                )
+
+            raise precondition_failed()
+
+        # The row may have moved out of one of the budgets it was looked up in
+        changes.publish(
+            str(transaction_in.budget_id),
+            "transaction",
+            str(transaction_id),
+            "update",
+            moved_from=owned_budget_ids,
+        )
+        transaction = TransactionRead(
+            **decode_row(result.data[0], ("amount",), exponent)
+        )
+        set_etag(response, transaction.version)
+        return transaction
 
     except HTTPException:
         raise
@@ -331,38 +395,56 @@ async def update_transaction(
         )
 
 
-@router.delete("/{transaction_id}", status_code=status.HTTP_204_NO_CONTENT)
+@router.delete(
+    "/{transaction_id}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    dependencies=[Depends(notify_outbox)],
+)
 async def delete_transaction(
     transaction_id: UUID,
     current_user_id: str = Depends(get_current_user),
     db: Client = Depends(get_supabase),
+    loader: Loader = Depends(get_loader),
 ) -> None:
     """
     Delete a transaction.
     """
     try:
+        if rls_enabled():
+            # RLS policies only let the user delete rows of their own budgets
+            result = (
+                db.table("transactions")
+                .delete()
+                .eq("id", str(transaction_id))
+                .execute()
+            )
+            if not result.data:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Transaction not found",
+                )
+            changes.publish(
+                result.data[0]["budget_id"],
+                "transaction",
+                str(transaction_id),
+                "delete",
+            )
+            return
+
         # First get the transaction
-        existing_result = (
-            db.table("transactions").select("*").eq("id", str(transaction_id)).execute()
-        )
+        existing_transaction = await loader.load("transactions", str(transaction_id))
 
-        if not existing_result.data:
+        if existing_transaction is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Transaction not found"
             )
 
-        existing_transaction = existing_result.data[0]
-
         # Verify the budget belongs to the user
-        budget_check = (
-            db.table("budgets")
-            .select("id")
-            .eq("id", existing_transaction["budget_id"])
-            .eq("user_id", current_user_id)
-            .execute()
+        budget_check = await loader.budget_access(
+            existing_transaction["budget_id"], current_user_id
         )
 
-        if not budget_check.data:
+        if budget_check is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Transaction not found or you don't have access to it",
@@ -370,6 +452,12 @@ async def delete_transaction(
 
         # Delete the transaction
         db.table("transactions").delete().eq("id", str(transaction_id)).execute()
+        changes.publish(
+            existing_transaction["budget_id"],
+            "transaction",
+            str(transaction_id),
+            "delete",
+        )
 
     except HTTPException:
         raise
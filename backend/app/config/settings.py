@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import Dict, List, Optional
 import os
 
 
@@ -15,10 +15,155 @@ class Settings(BaseSettings):
     SUPABASE_KEY: str = os.getenv("SUPABASE_KEY", "")
     SUPABASE_SERVICE_KEY: str = os.getenv("SUPABASE_SERVICE_KEY", "")
 
+    # Row-level security mode: query Supabase as the end user, with a token
+    # signed by the project's JWT secret, so RLS policies enforce ownership
+    SUPABASE_RLS_MODE: bool = False
+    SUPABASE_JWT_SECRET: str = os.getenv("SUPABASE_JWT_SECRET", "")
+    RLS_TOKEN_TTL_SECONDS: int = 3600
+    RLS_CLIENT_POOL_SIZE: int = (
+        256  # per-user clients kept, least recently used evicted
+    )
+
+    # Optional read replica for GET requests; the key defaults to SUPABASE_KEY
+    SUPABASE_REPLICA_URL: str = os.getenv("SUPABASE_REPLICA_URL", "")
+    SUPABASE_REPLICA_KEY: str = os.getenv("SUPABASE_REPLICA_KEY", "")
+    # Seconds a user's reads stay on the primary after they write
+    READ_YOUR_WRITES_WINDOW: float = 5.0
+
+    # Cache shared by the worker processes of a host through a memory-mapped
+    # file (e.g. /dev/shm/spenny-cache), for membership versions and recent
+    # writers; unset keeps them in each process
+    SHARED_CACHE_PATH: Optional[str] = None
+    SHARED_CACHE_SLOTS: int = 65_536  # of 256 bytes each
+
+    # Storage backend: "supabase" (PostgREST over HTTP), "postgres" (direct
+    # connection to DATABASE_URL; Supabase is still used for auth) or "sqlite"
+    # (local file at SQLITE_PATH with local auth, ":memory:" for tests)
+    DB_BACKEND: str = "supabase"
+    SQLITE_PATH: str = "spenny.db"
+    DATABASE_URL: str = os.getenv("DATABASE_URL", "")
+    POSTGRES_POOL_MIN_SIZE: int = 2
+    POSTGRES_POOL_MAX_SIZE: int = 20
+    POSTGRES_STATEMENT_CACHE_SIZE: int = 100  # prepared statements per connection
+    POSTGRES_COMMAND_TIMEOUT: float = 10.0  # seconds
+
+    # Supabase HTTP connection pool, one per client (anon, admin and replica)
+    SUPABASE_HTTP2: bool = True
+    SUPABASE_POOL_MAX_CONNECTIONS: int = 20
+    SUPABASE_POOL_MAX_KEEPALIVE: int = 10
+    SUPABASE_POOL_KEEPALIVE_EXPIRY: float = 30.0  # seconds
+    SUPABASE_CONNECT_TIMEOUT: float = 5.0  # seconds
+    SUPABASE_READ_TIMEOUT: float = 10.0  # seconds
+    SUPABASE_WRITE_TIMEOUT: float = 10.0  # seconds
+    SUPABASE_POOL_TIMEOUT: float = 5.0  # seconds to wait for a free connection
+
+    # Circuit breaker for Supabase outages
+    DB_BREAKER_FAILURE_THRESHOLD: int = 5  # consecutive failures before opening
+    DB_BREAKER_BASE_BACKOFF: float = 1.0  # seconds, doubled on each reopen
+    DB_BREAKER_MAX_BACKOFF: float = 60.0  # seconds
+    DB_BREAKER_PROBE_TIMEOUT: float = 10.0  # seconds before another probe
+
+    # Reads: optional default deadline per request (clients can send
+    # X-Request-Timeout in ms) and hedging of slow reads
+    READ_DEFAULT_TIMEOUT_MS: Optional[float] = None
+    READ_HEDGE_ENABLED: bool = True
+    READ_HEDGE_PERCENTILE: float = 95.0  # latency percentile that triggers a hedge
+    READ_HEDGE_MIN_DELAY_MS: float = 20.0
+    READ_HEDGE_MIN_SAMPLES: int = 50  # per table, before hedging starts
+
     # JWT
     JWT_SECRET_KEY: str = os.getenv("JWT_SECRET_KEY", "")
     JWT_ALGORITHM: str = "HS256"
-    ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 7  # 7 days
+    ACCESS_TOKEN_EXPIRE_MINUTES: int = 15
+    REFRESH_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 7  # 7 days
+    # Seconds a user's membership version is trusted without a database read
+    MEMBERSHIP_CACHE_SECONDS: float = 30.0
+    # Revoked token IDs are kept in memory and refreshed from the database
+    TOKEN_REVOCATION_SYNC_SECONDS: float = 10.0
+    TOKEN_REVOCATION_CAPACITY: int = 100_000
+    TOKEN_REVOCATION_ERROR_RATE: float = 0.01
+    # Rows read per query while syncing; at most PostgREST's max-rows
+    TOKEN_REVOCATION_PAGE_SIZE: int = 1000
+
+    # Money storage: "decimal" (NUMERIC columns) or "minor_units" (BIGINT
+    # columns holding amounts in the budget currency's smallest unit)
+    MONEY_STORAGE: str = "decimal"
+
+    # Metrics
+    METRICS_ENABLED: bool = True
+    # Maximum database round trips per request, by "METHOD /route/template"
+    # (e.g. "PUT /api/transactions/{transaction_id}"), and for other routes
+    ROUND_TRIP_BUDGETS: Dict[str, int] = {}
+    ROUND_TRIP_BUDGET_DEFAULT: Optional[int] = None
+    # Fail requests over budget with 500 instead of logging, for tests
+    ROUND_TRIP_BUDGET_STRICT: bool = False
+
+    # Rate limiting: token buckets per user, and per client address for the
+    # auth routes; a request spends its route's cost (default 1) from
+    # RATE_LIMIT_COSTS, keyed like ROUND_TRIP_BUDGETS
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_USER_CAPACITY: float = 60.0  # tokens, the largest burst
+    RATE_LIMIT_USER_RATE: float = 10.0  # tokens refilled per second
+    RATE_LIMIT_IP_CAPACITY: float = 10.0
+    RATE_LIMIT_IP_RATE: float = 0.5
+    RATE_LIMIT_COSTS: Dict[str, float] = {
+        "GET /api/budgets/": 2.0,
+        "GET /api/categories/": 2.0,
+        "GET /api/accounts/": 2.0,
+        "GET /api/transactions/": 5.0,
+        "POST /api/budgets/{budget_id}/clone": 10.0,
+        # Password hashing
+        "POST /api/auth/register": 3.0,
+        "POST /api/auth/login": 3.0,
+    }
+    RATE_LIMIT_MAX_BUCKETS: int = 100_000  # per limiter
+    # Proxies in front of the API that append to X-Forwarded-For; the client
+    # address is the entry the outermost of them added. 0 uses the peer address
+    RATE_LIMIT_TRUSTED_PROXIES: int = 0
+
+    # Profiling: requests sending PROFILE_TOKEN in X-Profile are profiled
+    PROFILE_TOKEN: Optional[str] = None
+    PROFILE_ALL_REQUESTS: bool = False  # only with PROFILE_TOKEN set
+    PROFILE_SAMPLE_INTERVAL_MS: float = 5.0
+    PROFILE_STORE_SIZE: int = 50
+
+    # Outbox of change events for derived data, applied by a background
+    # worker; with several processes only the holder of the lease applies them.
+    # Off until a handler is registered, as events would only be deleted
+    OUTBOX_ENABLED: bool = False
+    OUTBOX_POLL_SECONDS: float = 1.0
+    OUTBOX_BATCH_SIZE: int = 200
+    OUTBOX_MAX_ATTEMPTS: int = 5
+    OUTBOX_RETRY_BASE_SECONDS: float = 1.0  # doubled on each failed attempt
+    # How long the lease lasts without being renewed; renewed every third of it
+    OUTBOX_LEASE_SECONDS: float = 30.0
+
+    # Budget change streams (server-sent events): events buffered per client
+    # before it is dropped, and the interval of keep-alive comments
+    EVENTS_BUFFER_SIZE: int = 256
+    EVENTS_HEARTBEAT_SECONDS: float = 15.0
+    EVENTS_MAX_SUBSCRIBERS: int = 10_000  # per process
+    EVENTS_RETRY_SECONDS: int = 5
+
+    # Batch endpoint: requests per batch, and how many of them run at once
+    BATCH_MAX_REQUESTS: int = 20
+    BATCH_CONCURRENCY: int = 8
+
+    # Idempotency-Key: responses to POST requests sent with a key are kept
+    # for TTL and replayed to retries with the same key; a retry arriving
+    # while the first request runs waits up to WAIT_SECONDS for it
+    IDEMPOTENCY_TTL_SECONDS: float = 24 * 60 * 60
+    IDEMPOTENCY_MAX_ENTRIES: int = 10_000
+    IDEMPOTENCY_MAX_BODY_BYTES: int = 64 * 1024
+    IDEMPOTENCY_WAIT_SECONDS: float = 10.0
+
+    # Budget deletion
+    BUDGET_PURGE_BATCH_SIZE: int = 500
+    BUDGET_PURGE_BATCH_DELAY_SECONDS: float = 0.05
+    # How often each worker looks for deletions to claim, and how long a claim
+    # lasts without being renewed before another worker may take it over
+    BUDGET_PURGE_POLL_SECONDS: float = 5.0
+    BUDGET_PURGE_CLAIM_SECONDS: float = 60.0
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,114 @@
+import random
+import threading
+import time
+from typing import Dict, Optional
+from app.config.settings import settings
+
+
+class CircuitOpenError(Exception):
+    """Exception raised while the database is considered unavailable"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Database circuit '{name}' is open")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker guarding calls to one Supabase client.
+
+    After DB_BREAKER_FAILURE_THRESHOLD consecutive failures the circuit opens
+    and calls fail immediately. Once the backoff has elapsed a single probe is
+    let through (half-open); its outcome closes the circuit or reopens it with
+    twice the previous backoff, up to DB_BREAKER_MAX_BACKOFF.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = self.CLOSED
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened = 0  # consecutive times the circuit has opened
+        self._retry_at = 0.0
+        self._probe_started: Optional[float] = None
+
+    def allow(self) -> None:
+        """
+        Checks whether a call may go ahead.
+
+        Raises:
+            CircuitOpenError: If the circuit is open, or half-open with a probe
+            already in flight
+        """
+        if self.state == self.CLOSED:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+
+            if self.state == self.OPEN:
+                if now < self._retry_at:
+                    raise CircuitOpenError(self.name, self._retry_at - now)
+                self.state = self.HALF_OPEN
+                self._probe_started = now
+                return
+
+            if self.state == self.HALF_OPEN:
+                # Let another probe through if the last one never reported back
+                if now - self._probe_started < settings.DB_BREAKER_PROBE_TIMEOUT:
+                    raise CircuitOpenError(self.name, settings.DB_BREAKER_BASE_BACKOFF)
+                self._probe_started = now
+
+    def record_success(self) -> None:
+        if self.state == self.CLOSED and not self._failures:
+            return
+
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+            self._opened = 0
+            self._probe_started = None
+
+    def record_failure(self, trip: bool = False) -> None:
+        """
+        Records a failed call.
+
+        Args:
+            trip: Open the circuit immediately instead of counting towards
+            the failure threshold
+        """
+        with self._lock:
+            self._failures += 1
+            if self.state == self.OPEN:
+                return
+            if (
+                trip
+                or self.state == self.HALF_OPEN
+                or self._failures >= settings.DB_BREAKER_FAILURE_THRESHOLD
+            ):
+                self._open()
+
+    def _open(self) -> None:
+        backoff = min(
+            settings.DB_BREAKER_BASE_BACKOFF * 2**self._opened,
+            settings.DB_BREAKER_MAX_BACKOFF,
+        )
+        # Jitter so that several workers do not probe in lockstep
+        backoff *= random.uniform(0.5, 1.0)
+
+        self.state = self.OPEN
+        self._opened += 1
+        self._retry_at = time.monotonic() + backoff
+        self._probe_started = None
+
+
+# Breakers by client name
+breakers: Dict[str, CircuitBreaker] = {
+    "anon": CircuitBreaker("anon"),
+    "admin": CircuitBreaker("admin"),
+    "replica": CircuitBreaker("replica"),
+}
@@ -1,7 +1,9 @@
-from typing import Optional
-from supabase import create_client, Client
+import threading
+from typing import Callable, Dict, Optional
+from supabase import create_client, Client, ClientOptions
 from app.config.settings import settings
-from functools import lru_cache
+from app.db.breaker import breakers
+from app.db.pool import create_http_client
 
 
 class DatabaseError(Exception):
@@ -16,24 +18,60 @@ class ConnectionError(DatabaseError):
     pass
 
 
-@lru_cache()
-def get_supabase_client() -> Client:
+# Clients created so far, by name, and the locks serialising their creation
+_clients: Dict[str, Client] = {}
+_client_locks: Dict[str, threading.Lock] = {
+    "anon": threading.Lock(),
+    "admin": threading.Lock(),
+    "replica": threading.Lock(),
+}
+
+
+def _get_or_create(name: str, create: Callable[[], Client]) -> Client:
     """
-    Creates and returns a cached Supabase client instance.
-    Uses lru_cache to maintain a single instance throughout the application.
+    Returns the client cached under name, creating it if needed.
 
-    Returns:
-        Client: Supabase client instance
+    Creation is single-flight: concurrent callers wait for the attempt in
+    progress instead of each connecting. A failed attempt opens the circuit
+    breaker, so callers fail fast until its backoff has elapsed and a single
+    caller is allowed to try again.
 
     Raises:
         ConnectionError: If connection to Supabase fails
+        CircuitOpenError: If a recent attempt failed and the backoff is running
     """
+    client = _clients.get(name)
+    if client is not None:
+        return client
+
+    breaker = breakers[name]
+    with _client_locks[name]:
+        client = _clients.get(name)
+        if client is not None:
+            return client
+
+        breaker.allow()
+        try:
+            client = create()
+        except ConnectionError:
+            breaker.record_failure(trip=True)
+            raise
+
+        breaker.record_success()
+        _clients[name] = client
+        return client
+
+
+def _create_supabase_client() -> Client:
+    http_client = create_http_client("anon")
     try:
         if not settings.SUPABASE_URL or not settings.SUPABASE_KEY:
             raise ConnectionError("Supabase credentials not properly configured")
 
         client = create_client(
-            supabase_url=settings.SUPABASE_URL, supabase_key=settings.SUPABASE_KEY
+            supabase_url=settings.SUPABASE_URL,
+            supabase_key=settings.SUPABASE_KEY,
+            options=ClientOptions(httpx_client=http_client),
         )
 
         # Test the connection
@@ -41,21 +79,12 @@ def get_supabase_client() -> Client:
         return client
 
     except Exception as e:
+        http_client.close()
         raise ConnectionError(f"Failed to connect to Supabase: {str(e)}")
 
 
-@lru_cache()
-def get_supabase_admin_client() -> Client:
-    """
-    Creates and returns a cached Supabase admin client with service role privileges.
-    This client bypasses RLS policies and should only be used for admin operations.
-
-    Returns:
-        Client: Supabase admin client instance with service role privileges
-
-    Raises:
-        ConnectionError: If connection to Supabase fails
-    """
+def _create_supabase_admin_client() -> Client:
+    http_client = create_http_client("admin")
     try:
         if not settings.SUPABASE_URL or not settings.SUPABASE_SERVICE_KEY:
             raise ConnectionError(
@@ -65,6 +94,7 @@ def get_supabase_admin_client() -> Client:
         client = create_client(
             supabase_url=settings.SUPABASE_URL,
             supabase_key=settings.SUPABASE_SERVICE_KEY,
+            options=ClientOptions(httpx_client=http_client),
         )
 
         # Test the connection
@@ -72,27 +102,150 @@ def get_supabase_admin_client() -> Client:
         return client
 
     except Exception as e:
+        http_client.close()
         raise ConnectionError(
             f"Failed to connect to Supabase with service role: {str(e)}"
         )
 
 
+def _create_supabase_replica_client() -> Client:
+    http_client = create_http_client("replica")
+    try:
+        client = create_client(
+            supabase_url=settings.SUPABASE_REPLICA_URL,
+            supabase_key=settings.SUPABASE_REPLICA_KEY or settings.SUPABASE_KEY,
+            options=ClientOptions(httpx_client=http_client),
+        )
+
+        # Test the connection
+        client.table("users").select("*").limit(1).execute()
+        return client
+
+    except Exception as e:
+        http_client.close()
+        raise ConnectionError(f"Failed to connect to Supabase replica: {str(e)}")
+
+
+def _create_postgres_database():
+    # Imported here so asyncpg is only needed by deployments using it
+    from app.db.postgres import PostgresDatabase
+
+    if not settings.DATABASE_URL:
+        raise ConnectionError("DATABASE_URL not configured")
+
+    try:
+        return PostgresDatabase(settings.DATABASE_URL, breaker=breakers["anon"])
+    except Exception as e:
+        raise ConnectionError(f"Failed to connect to Postgres: {str(e)}")
+
+
+def _create_sqlite_database():
+    from app.db.sqlite import SqliteDatabase
+
+    try:
+        return SqliteDatabase(settings.SQLITE_PATH)
+    except Exception as e:
+        raise ConnectionError(f"Failed to open SQLite database: {str(e)}")
+
+
+def get_supabase_client() -> Client:
+    """
+    Creates and returns a cached Supabase client instance.
+    Only one thread connects at a time and the result is shared by all callers.
+    Requests go through a connection pool configured in settings.
+
+    Returns:
+        Client: Supabase client instance
+
+    Raises:
+        ConnectionError: If connection to Supabase fails
+        CircuitOpenError: If Supabase was recently unreachable
+    """
+    return _get_or_create("anon", _create_supabase_client)
+
+
+def get_supabase_admin_client() -> Client:
+    """
+    Creates and returns a cached Supabase admin client with service role privileges.
+    This client bypasses RLS policies and should only be used for admin operations.
+
+    Returns:
+        Client: Supabase admin client instance with service role privileges
+
+    Raises:
+        ConnectionError: If connection to Supabase fails
+        CircuitOpenError: If Supabase was recently unreachable
+    """
+    return _get_or_create("admin", _create_supabase_admin_client)
+
+
+def get_supabase_replica_client() -> Client:
+    """
+    Creates and returns a cached Supabase client for the read replica.
+    It must only be used for reads.
+
+    Returns:
+        Client: Supabase client instance connected to the replica
+
+    Raises:
+        ConnectionError: If connection to the replica fails
+        CircuitOpenError: If the replica was recently unreachable
+    """
+    return _get_or_create("replica", _create_supabase_replica_client)
+
+
 # Global client instances
 supabase: Optional[Client] = None
 supabase_admin: Optional[Client] = None
+supabase_replica: Optional[Client] = None
+
+
+def get_postgres_database():
+    """
+    Creates and returns the cached direct Postgres database, used instead of
+    the Supabase client when DB_BACKEND is "postgres". It takes the place of
+    the anon client, including its circuit breaker.
+
+    Returns:
+        PostgresDatabase: Database with the Supabase client's query interface
+
+    Raises:
+        ConnectionError: If connection to Postgres fails
+        CircuitOpenError: If Postgres was recently unreachable
+    """
+    return _get_or_create("anon", _create_postgres_database)
+
+
+def get_sqlite_database():
+    """
+    Creates and returns the cached SQLite database, used instead of the
+    Supabase client when DB_BACKEND is "sqlite".
+
+    Returns:
+        SqliteDatabase: Database with the Supabase client's query interface
+
+    Raises:
+        ConnectionError: If the database file cannot be opened
+    """
+    return _get_or_create("anon", _create_sqlite_database)
 
 
 def get_db() -> Client:
     """
-    Returns the global Supabase client instance.
+    Returns the global database client instance for the configured backend.
     Creates a new instance if none exists.
 
     Returns:
-        Client: Supabase client instance
+        Client: Supabase client instance, or a client with the same interface
     """
     global supabase
     if supabase is None:
-        supabase = get_supabase_client()
+        if settings.DB_BACKEND == "postgres":
+            supabase = get_postgres_database()
+        elif settings.DB_BACKEND == "sqlite":
+            supabase = get_sqlite_database()
+        else:
+            supabase = get_supabase_client()
     return supabase
 
 
@@ -106,5 +259,30 @@ def get_admin_db() -> Client:
     """
     global supabase_admin
     if supabase_admin is None:
-        supabase_admin = get_supabase_admin_client()
+        if settings.DB_BACKEND in ("postgres", "sqlite"):
+            # A direct connection is not subject to RLS
+            supabase_admin = get_db()
+        else:
+            supabase_admin = get_supabase_admin_client()
     return supabase_admin
+
+
+def replica_configured() -> bool:
+    """
+    Whether a read replica is configured.
+    """
+    return settings.DB_BACKEND == "supabase" and bool(settings.SUPABASE_REPLICA_URL)
+
+
+def get_replica_db() -> Client:
+    """
+    Returns the global Supabase client instance for the read replica.
+    Creates a new instance if none exists.
+
+    Returns:
+        Client: Supabase client instance connected to the replica
+    """
+    global supabase_replica
+    if supabase_replica is None:
+        supabase_replica = get_supabase_replica_client()
+    return supabase_replica
@@ -1,28 +1,104 @@
-from typing import Generator
+import math
+from typing import Generator, Optional
 from supabase import Client
-from fastapi import Depends, HTTPException, status
-from app.db.client import get_db, get_admin_db
+from fastapi import Depends, HTTPException, Request, status
+from app.db.breaker import CircuitOpenError, breakers
+from app.db.loader import Loader
+from app.db.client import get_db, get_admin_db, get_replica_db, replica_configured
+from app.db.replica import recent_writers, request_user_id
+from app.db.rls import rls_enabled, user_clients, verified_user_id
 
+# Methods whose requests may be served by the read replica
+READ_METHODS = ("GET", "HEAD")
 
-def get_supabase() -> Generator[Client, None, None]:
+
+def _circuit_open(error: CircuitOpenError) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Database temporarily unavailable",
+        headers={"Retry-After": str(max(1, math.ceil(error.retry_after)))},
+    )
+
+
+def _replica_db() -> Optional[Client]:
+    """
+    Returns the replica client, or None if it is unavailable.
+    """
+    try:
+        db = get_replica_db()
+        breakers["replica"].allow()
+        return db
+    except Exception:
+        return None
+
+
+def get_supabase(request: Request) -> Generator[Client, None, None]:
     """
     FastAPI dependency that provides a Supabase client.
     Handles connection errors and yields a client instance.
 
+    In RLS mode, requests with a valid token get a client acting as the user,
+    so RLS policies apply to every query. Otherwise reads are served by the
+    replica when one is configured, except for users who wrote within
+    READ_YOUR_WRITES_WINDOW, whose reads stay on the primary. If the replica
+    is unavailable reads fall back to the primary.
+
     Yields:
         Client: Supabase client instance
 
     Raises:
-        HTTPException: If database connection fails
+        HTTPException: If database connection fails, or with a Retry-After
+        header while the circuit breaker is open
     """
+    if rls_enabled():
+        user_id = verified_user_id(request)
+        if user_id is not None:
+            # Only the token's signature has been checked; get_current_user
+            # still verifies that the user exists
+            try:
+                db = user_clients.get(user_id)
+                breakers["anon"].allow()
+            except CircuitOpenError as e:
+                raise _circuit_open(e)
+            except Exception as e:
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail=f"Database connection failed: {str(e)}",
+                )
+            yield db
+            return
+
+    user_id = request_user_id(request)
+    is_read = request.method in READ_METHODS
+
+    if is_read and replica_configured():
+        if user_id is None or not recent_writers.wrote_recently(user_id):
+            db = _replica_db()
+            if db is not None:
+                yield db
+                return
+
+    if not is_read and user_id is not None:
+        recent_writers.record_write(user_id)
+
     try:
         db = get_db()
-        yield db
+        breakers["anon"].allow()
+    except CircuitOpenError as e:
+        raise _circuit_open(e)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail=f"Database connection failed: {str(e)}",
         )
+    # Yield outside the try so errors raised by the endpoint are not reported
+    # as connection failures
+    try:
+        yield db
+    finally:
+        # Start the window once the write has been made
+        if not is_read and user_id is not None:
+            recent_writers.record_write(user_id)
 
 
 def get_supabase_admin() -> Generator[Client, None, None]:
@@ -34,13 +110,29 @@ def get_supabase_admin() -> Generator[Client, None, None]:
         Client: Supabase admin client with service role privileges
 
     Raises:
-        HTTPException: If database connection fails
+        HTTPException: If database connection fails, or with a Retry-After
+        header while the circuit breaker is open
     """
     try:
         db = get_admin_db()
-        yield db
+        breakers["admin"].allow()
+    except CircuitOpenError as e:
+        raise _circuit_open(e)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail=f"Admin database connection failed: {str(e)}",
         )
+    yield db
+
+
+def get_loader(db: Client = Depends(get_supabase)) -> Loader:
+    """
+    FastAPI dependency that provides the request's row loader.
+    FastAPI caches dependencies per request, so every dependency and the
+    endpoint share the same loader and its memoized rows.
+
+    Returns:
+        Loader: Loader reading through the request's Supabase client
+    """
+    return Loader(db)
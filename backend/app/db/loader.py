@@ -0,0 +1,145 @@
+import asyncio
+from typing import Any, Dict, List, Optional, Set, Tuple
+from app.db.reads import execute_read
+from app.utils.metrics import record_cache
+
+
+class Loader:
+    """
+    Request-scoped loader of rows by ID.
+
+    Lookups made in the same tick of the event loop (e.g. under
+    asyncio.gather) are batched into one in_ query per table, concurrent
+    lookups of the same row share a single query, and every row is memoized
+    for the rest of the request.
+
+    When the access token's budget claims are current, get_current_user sets
+    them as claims and budget ownership is answered without a query.
+    """
+
+    def __init__(self, db: Any):
+        self.db = db
+        # Owned budget IDs and their currency exponents, from the access token
+        self.claims: Optional[Dict[str, int]] = None
+        self._rows: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._batches: Dict[str, Dict[str, asyncio.Future]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def load(self, table: str, row_id: Any) -> Optional[dict]:
+        """
+        Loads a row by ID.
+
+        Args:
+            table: Table to read
+            row_id: ID of the row
+
+        Returns:
+            Optional[dict]: Copy of the row, or None if it does not exist
+        """
+        key = (table, str(row_id))
+        future = self._rows.get(key)
+        record_cache("loader", future is not None)
+
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._rows[key] = future
+
+            batch = self._batches.get(table)
+            if batch is None:
+                # Dispatch once the other lookups of this tick have joined
+                batch = self._batches[table] = {}
+                loop.call_soon(self._dispatch, table)
+            batch[key[1]] = future
+
+        row = await asyncio.shield(future)
+        # Callers convert rows in place, so never hand out the memoized one
+        return dict(row) if row is not None else None
+
+    async def owned_budget(self, budget_id: Any, user_id: str) -> Optional[dict]:
+        """
+        Loads a budget if it belongs to the user and has not been deleted.
+
+        Returns:
+            Optional[dict]: The budget row, or None
+        """
+        budget = await self.load("budgets", budget_id)
+        if (
+            budget is None
+            or budget["user_id"] != str(user_id)
+            or budget.get("deleted_at") is not None
+        ):
+            return None
+        return budget
+
+    async def budget_access(self, budget_id: Any, user_id: str) -> Optional[dict]:
+        """
+        Checks that a budget belongs to the user, using the token's claims when
+        they cover it.
+
+        Returns:
+            Optional[dict]: The budget's id and currency_exponent (the full row
+            when it had to be loaded), or None
+        """
+        if self.claims is not None:
+            exponent = self.claims.get(str(budget_id))
+            if exponent is not None:
+                return {"id": str(budget_id), "currency_exponent": exponent}
+        # The budget may have been created since the claims were read
+        return await self.owned_budget(budget_id, user_id)
+
+    async def owned_budgets(self, user_id: str) -> List[dict]:
+        """
+        Lists the id and currency_exponent of the user's budgets.
+        """
+        if self.claims is not None:
+            return [
+                {"id": budget_id, "currency_exponent": exponent}
+                for budget_id, exponent in self.claims.items()
+            ]
+
+        result = await execute_read(
+            self.db.table("budgets")
+            .select("id, currency_exponent")
+            .eq("user_id", str(user_id))
+            .is_("deleted_at", "null")
+        )
+        return result.data
+
+    async def load_in_budget(
+        self, table: str, row_id: Any, budget_id: Any
+    ) -> Optional[dict]:
+        """
+        Loads a row if it belongs to the given budget.
+
+        Returns:
+            Optional[dict]: The row, or None
+        """
+        row = await self.load(table, row_id)
+        if row is None or row["budget_id"] != str(budget_id):
+            return None
+        return row
+
+    def _dispatch(self, table: str) -> None:
+        batch = self._batches.pop(table)
+        # Keep a reference so the task is not collected before it finishes
+        task = asyncio.ensure_future(self._fetch(table, batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fetch(self, table: str, batch: Dict[str, asyncio.Future]) -> None:
+        try:
+            result = await execute_read(
+                self.db.table(table).select("*").in_("id", list(batch))
+            )
+        except Exception as e:
+            for row_id, future in batch.items():
+                # Forget the failure so a later lookup can try again
+                if self._rows.get((table, row_id)) is future:
+                    del self._rows[(table, row_id)]
+                future.set_exception(e)
+            return
+
+        rows = {str(row["id"]): row for row in result.data}
+        for row_id, future in batch.items():
+            future.set_result(rows.get(row_id))
@@ -0,0 +1,90 @@
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from app.config.settings import settings
+from app.db.shared_cache import shared_cache
+from app.utils.metrics import record_cache
+
+
+class MembershipVersions:
+    """
+    Cache of each user's budget membership version.
+
+    The version (users.membership_version) is bumped by database triggers
+    whenever one of the user's budgets is created or deleted. Tokens carry the
+    version their budget claims were issued at, so claims are only trusted
+    while it matches. Entries expire after MEMBERSHIP_CACHE_SECONDS and are
+    dropped immediately when the user's budgets change: in every worker on the
+    host when SHARED_CACHE_PATH is set, otherwise only in this process.
+
+    A version read from the database is only cached if the entry was not
+    dropped while it was being read: callers take a stamp() before the read
+    and pass it to set(), so a concurrent forget() is never undone by a stale
+    version.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions: Dict[str, Tuple[int, float]] = {}
+        # Bumped by every forget(); the stamp of the in-process cache
+        self._generation = 0
+
+    def get(self, user_id: str) -> Optional[int]:
+        shared = shared_cache()
+        if shared is not None:
+            value = shared.get(f"membership:{user_id}")
+            record_cache("membership", value is not None)
+            return int(value) if value is not None else None
+
+        entry = self._versions.get(user_id)
+        if (
+            entry is None
+            or time.monotonic() - entry[1] > settings.MEMBERSHIP_CACHE_SECONDS
+        ):
+            record_cache("membership", False)
+            return None
+        record_cache("membership", True)
+        return entry[0]
+
+    def stamp(self, user_id: str) -> int:
+        """
+        Returns the state of the user's entry, to take before reading the
+        version from the database.
+        """
+        shared = shared_cache()
+        if shared is not None:
+            return shared.version(f"membership:{user_id}")
+        return self._generation
+
+    def set(self, user_id: str, version: int, stamp: int) -> None:
+        """
+        Caches a version read from the database, unless the entry was
+        forgotten since stamp() was taken.
+        """
+        shared = shared_cache()
+        if shared is not None:
+            shared.set(
+                f"membership:{user_id}",
+                str(version).encode(),
+                settings.MEMBERSHIP_CACHE_SECONDS,
+                expected_version=stamp,
+            )
+            return
+
+        with self._lock:
+            # Any forget() in between may have been for this user
+            if self._generation == stamp:
+                self._versions[user_id] = (version, time.monotonic())
+
+    def forget(self, user_id: str) -> None:
+        shared = shared_cache()
+        if shared is not None:
+            shared.invalidate(f"membership:{user_id}")
+            return
+
+        with self._lock:
+            self._generation += 1
+            self._versions.pop(user_id, None)
+
+
+membership_versions = MembershipVersions()
@@ -0,0 +1,432 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+from datetime import datetime, timedelta, timezone
+from itertools import groupby
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+from uuid import uuid4
+
+from postgrest.exceptions import APIError
+
+from app.config.settings import settings
+from app.db.client import get_admin_db
+from app.utils.metrics import Counter, Gauge, registry
+
+logger = logging.getLogger(__name__)
+
+# Applies a run of consecutive outbox rows of one budget and table, in order
+Handler = Callable[[List[dict]], Awaitable[None]]
+
+# Row of outbox_lease naming the worker that applies the events
+LEASE_NAME = "outbox"
+# Share of the lease kept unused at the end of a batch, covering the time to
+# cancel the handlers and small clock differences between hosts
+LEASE_MARGIN = 0.1
+
+outbox_events = registry.register(
+    Counter(
+        "spenny_outbox_events_total",
+        "Outbox events by table and result (applied, retried or failed)",
+        ("table", "result"),
+    )
+)
+
+
+def _age_seconds(created_at: Any) -> float:
+    if not isinstance(created_at, datetime):
+        created_at = datetime.fromisoformat(str(created_at).replace("Z", "+00:00"))
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (datetime.now(timezone.utc) - created_at).total_seconds())
+
+
+class Outbox:
+    """
+    Background worker applying the change events of the outbox table to
+    derived data.
+
+    Database triggers add a row to the outbox whenever a transaction is
+    created, updated or deleted, in the same database transaction as the
+    change, so no event is lost and writes pay no extra round trip. The worker
+    polls the oldest events every OUTBOX_POLL_SECONDS, or as soon as notify()
+    is called after a write, and hands each budget's events in order to the
+    handler registered for their table. Budgets are applied concurrently;
+    events without a handler are simply consumed.
+
+    When a handler fails, the budget's remaining events are kept and retried
+    with exponential backoff, so its events are never applied out of order.
+    After OUTBOX_MAX_ATTEMPTS the failing events are marked failed and left
+    in the table for inspection, and the budget is blocked: its later events
+    wait until the failed ones are deleted, or have failed_at cleared to be
+    retried. Blocked budgets are reloaded from the table whenever the lease
+    is checked. Events are deleted once applied; a crash in between replays
+    them, so handlers must be idempotent.
+
+    With several API processes, only one applies events at a time: the
+    holder of the outbox lease, a row of outbox_lease that it renews every
+    third of OUTBOX_LEASE_SECONDS. The others keep trying to take it over,
+    which they can once it has expired, so a crashed holder is replaced
+    within OUTBOX_LEASE_SECONDS. The lease is renewed before each batch and
+    again before its results are written, and a batch still running when the
+    lease is about to lapse is cancelled and replayed later, so a new holder
+    never applies events alongside the old one. Per-budget ordering therefore
+    holds across processes too.
+    """
+
+    def __init__(self):
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+        self._leader = False
+        self._lease_checked_at: Optional[float] = None
+        # Monotonic time until which the lease is held
+        self._lease_until = 0.0
+        self._handlers: Dict[str, Handler] = {}
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        # Per budget: failed attempts and when to try again
+        self._attempts: Dict[str, int] = {}
+        self._retry_at: Dict[str, float] = {}
+        # Budgets with failed events, whose later events are held back
+        self._blocked: Set[str] = set()
+        # Creation time of the oldest event not applied at the last poll, and
+        # of the first event of each budget waiting to retry
+        self._oldest_created_at: Optional[Any] = None
+        self._stuck_since: Dict[str, Any] = {}
+
+    def register(self, table: str, handler: Handler) -> None:
+        """
+        Sets the handler applying the events of a table.
+        """
+        self._handlers[table] = handler
+
+    def start(self) -> None:
+        if not settings.OUTBOX_ENABLED:
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        if self._leader:
+            self._leader = False
+            self._lease_checked_at = None
+            try:
+                await asyncio.to_thread(self._release_lease)
+            except Exception:
+                logger.warning("Failed to release the outbox lease", exc_info=True)
+
+    def notify(self) -> None:
+        """
+        Wakes the worker after a write added events, instead of waiting for
+        the next poll.
+        """
+        self._wake.set()
+
+    def lag_seconds(self) -> float:
+        """
+        Returns the age of the oldest event waiting to be applied, as of the
+        last poll, or 0 if none was waiting.
+        """
+        pending = list(self._stuck_since.values())
+        if self._oldest_created_at is not None:
+            pending.append(self._oldest_created_at)
+        return max((_age_seconds(created_at) for created_at in pending), default=0.0)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "lag_seconds": round(self.lag_seconds(), 3),
+            "retrying_budgets": sum(1 for at in self._retry_at.values() if at > now),
+            "blocked_budgets": len(self._blocked),
+            "leader": self._leader,
+            "handlers": sorted(self._handlers),
+        }
+
+    async def _run(self) -> None:
+        while True:
+            self._wake.clear()
+            fetched = 0
+            try:
+                if await self._hold_lease():
+                    fetched = await self.process_batch()
+            except Exception:
+                logger.exception("Failed to process outbox events")
+
+            # A full batch means more are probably waiting
+            if fetched < settings.OUTBOX_BATCH_SIZE:
+                try:
+                    await asyncio.wait_for(
+                        self._wake.wait(), settings.OUTBOX_POLL_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _hold_lease(self) -> bool:
+        """
+        Returns whether this worker holds the lease, taking or renewing it if
+        a third of OUTBOX_LEASE_SECONDS has passed since the last attempt.
+        """
+        now = time.monotonic()
+        if (
+            self._lease_checked_at is None
+            or now - self._lease_checked_at >= settings.OUTBOX_LEASE_SECONDS / 3
+        ):
+            if await self._renew_lease():
+                self._blocked = await asyncio.to_thread(self._failed_budgets)
+        return self._leader
+
+    async def _renew_lease(self) -> bool:
+        """
+        Takes or renews the lease now, noting until when it is held.
+        """
+        started = time.monotonic()
+        self._lease_checked_at = started
+        self._leader = False
+        self._leader = await asyncio.to_thread(self._acquire_lease)
+        if self._leader:
+            self._lease_until = started + settings.OUTBOX_LEASE_SECONDS
+        return self._leader
+
+    def _acquire_lease(self) -> bool:
+        """
+        Renews the lease if this worker holds it, or takes it if it has
+        expired or was never taken. Each step is a single conditional write,
+        so of several workers trying at once only one succeeds.
+        """
+        db = get_admin_db()
+        now = datetime.now(timezone.utc)
+        values = {
+            "holder": self.holder,
+            "expires_at": (
+                now + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS)
+            ).isoformat(),
+        }
+
+        renewed = (
+            db.table("outbox_lease")
+            .update(values)
+            .eq("name", LEASE_NAME)
+            .eq("holder", self.holder)
+            .execute()
+        )
+        if renewed.data:
+            return True
+
+        taken = (
+            db.table("outbox_lease")
+            .update(values)
+            .eq("name", LEASE_NAME)
+            .lt("expires_at", now.isoformat())
+            .execute()
+        )
+        if not taken.data:
+            try:
+                db.table("outbox_lease").insert(
+                    {"name": LEASE_NAME, **values}
+                ).execute()
+            except APIError as e:
+                # Held by another worker
+                if e.code == "23505":
+                    return False
+                raise
+        logger.info("Outbox lease taken by %s", self.holder)
+        return True
+
+    @staticmethod
+    def _failed_budgets() -> Set[str]:
+        result = (
+            get_admin_db()
+            .table("outbox")
+            .select("budget_id")
+            .not_.is_("failed_at", "null")
+            .execute()
+        )
+        return {str(row["budget_id"]) for row in result.data}
+
+    def _release_lease(self) -> None:
+        """
+        Expires the lease, so another worker takes over without waiting.
+        """
+        get_admin_db().table("outbox_lease").update(
+            {"expires_at": datetime.now(timezone.utc).isoformat()}
+        ).eq("name", LEASE_NAME).eq("holder", self.holder).execute()
+
+    async def process_batch(self) -> int:
+        """
+        Applies the oldest pending events, skipping budgets waiting to retry
+        and blocked budgets.
+
+        Returns:
+            int: Number of events fetched
+        """
+        db = get_admin_db()
+        now = time.monotonic()
+        self._retry_at = {
+            budget: at for budget, at in self._retry_at.items() if at > now
+        }
+
+        query = db.table("outbox").select("*").is_("failed_at", "null")
+        skipped = set(self._retry_at) | self._blocked
+        if skipped:
+            query = query.not_.in_("budget_id", list(skipped))
+        query = query.order("id").limit(settings.OUTBOX_BATCH_SIZE)
+        rows = (await asyncio.to_thread(query.execute)).data
+        if not rows:
+            self._oldest_created_at = None
+            return 0
+
+        budgets: Dict[str, List[dict]] = {}
+        for row in sorted(rows, key=lambda row: row["id"]):
+            budgets.setdefault(row["budget_id"], []).append(row)
+
+        # Applying must end while the lease is still held
+        if not await self._renew_lease():
+            return 0
+        remaining_lease = (
+            self._lease_until
+            - time.monotonic()
+            - settings.OUTBOX_LEASE_SECONDS * LEASE_MARGIN
+        )
+        try:
+            results = await asyncio.wait_for(
+                asyncio.gather(
+                    *(
+                        self._apply(budget_id, events)
+                        for budget_id, events in budgets.items()
+                    )
+                ),
+                max(0.0, remaining_lease),
+            )
+        except asyncio.TimeoutError:
+            logger.warning(
+                "Outbox batch of %d events outlasted the lease; it will be replayed",
+                len(rows),
+            )
+            self._lease_checked_at = None
+            return len(rows)
+
+        # The results are only written by the holder
+        if not await self._renew_lease():
+            return len(rows)
+
+        applied = [row_id for done, _ in results for row_id in done]
+        if applied:
+            await asyncio.to_thread(
+                lambda: db.table("outbox").delete().in_("id", applied).execute()
+            )
+
+        finished = set(applied)
+        for budget_id, (_, failed) in zip(budgets, results):
+            if failed is not None:
+                ids, error = failed
+                finished.update(ids)
+                self._blocked.add(str(budget_id))
+                await asyncio.to_thread(
+                    lambda: db.table("outbox")
+                    .update(
+                        {
+                            "failed_at": datetime.now(timezone.utc).isoformat(),
+                            "attempts": settings.OUTBOX_MAX_ATTEMPTS,
+                            "last_error": error,
+                        }
+                    )
+                    .in_("id", ids)
+                    .execute()
+                )
+
+        remaining = [row for row in rows if row["id"] not in finished]
+        self._oldest_created_at = (
+            min(row["created_at"] for row in remaining) if remaining else None
+        )
+        return len(rows)
+
+    async def _apply(
+        self, budget_id: str, events: List[dict]
+    ) -> Tuple[List[int], Optional[Tuple[List[int], str]]]:
+        """
+        Applies a budget's events in order, stopping at the first failure.
+
+        Returns:
+            The IDs of the applied events, and the IDs of the events to mark
+            failed with the error, if they have run out of attempts
+        """
+        done: List[int] = []
+        for table, run in groupby(events, key=lambda event: event["table_name"]):
+            run = list(run)
+            handler = self._handlers.get(table)
+            try:
+                if handler is not None:
+                    await handler(run)
+            except Exception as e:
+                attempts = self._attempts.get(budget_id, 0) + 1
+                ids = [event["id"] for event in run]
+
+                if attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+                    logger.exception(
+                        "Giving up on %d outbox events of budget %s",
+                        len(run),
+                        budget_id,
+                    )
+                    self._attempts.pop(budget_id, None)
+                    self._stuck_since.pop(budget_id, None)
+                    outbox_events.inc(table, "failed", amount=len(run))
+                    return done, (ids, str(e))
+
+                logger.warning(
+                    "Outbox events of budget %s failed (attempt %d): %s",
+                    budget_id,
+                    attempts,
+                    e,
+                )
+                self._attempts[budget_id] = attempts
+                self._stuck_since.setdefault(budget_id, run[0]["created_at"])
+                self._retry_at[budget_id] = time.monotonic() + (
+                    settings.OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+                )
+                outbox_events.inc(table, "retried", amount=len(run))
+                return done, None
+
+            done.extend(event["id"] for event in run)
+            outbox_events.inc(table, "applied", amount=len(run))
+
+        self._attempts.pop(budget_id, None)
+        self._stuck_since.pop(budget_id, None)
+        return done, None
+
+
+outbox = Outbox()
+
+registry.register(
+    Gauge(
+        "spenny_outbox_lag_seconds",
+        "Age of the oldest outbox event waiting to be applied",
+        lambda: {(): outbox.lag_seconds()},
+    )
+)
+
+
+async def notify_outbox() -> AsyncIterator[None]:
+    """
+    FastAPI dependency for routes that change rows with outbox triggers; wakes
+    the worker once the handler has run.
+    """
+    yield
+    outbox.notify()
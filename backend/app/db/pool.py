@@ -0,0 +1,188 @@
+import threading
+import time
+from typing import Dict, Optional, Tuple
+import httpx
+from app.config.settings import settings
+from app.db.breaker import CircuitBreaker, breakers
+from app.utils.metrics import Gauge, record_db_call, registry
+
+# Gateway responses meaning Supabase itself is unavailable
+UNAVAILABLE_STATUS_CODES = (502, 503, 504)
+
+# PostgREST operation of each HTTP method
+OPERATIONS = {
+    "GET": "select",
+    "HEAD": "select",
+    "POST": "insert",
+    "PATCH": "update",
+    "PUT": "upsert",
+    "DELETE": "delete",
+}
+
+
+def _describe(request: httpx.Request) -> Tuple[str, str]:
+    """
+    Returns the table and operation of a Supabase request, for metrics.
+    """
+    parts = request.url.path.strip("/").split("/")
+    if parts[:2] == ["rest", "v1"] and len(parts) > 2:
+        if parts[2] == "rpc" and len(parts) > 3:
+            return parts[3], "rpc"
+        return parts[2], OPERATIONS.get(request.method, request.method.lower())
+    # Auth and other Supabase services
+    return parts[0] if parts[0] else "unknown", request.method.lower()
+
+
+class PooledTransport(httpx.HTTPTransport):
+    """
+    HTTP transport that can report the state of its connection pool.
+    Outcomes of requests are fed to the client's circuit breaker.
+    """
+
+    def __init__(self, name: str, breaker: Optional[CircuitBreaker] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.name = name
+        self.breaker = breaker
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        try:
+            response = super().handle_request(request)
+        except httpx.TransportError:
+            record_db_call(
+                self.name, *_describe(request), time.perf_counter() - started, True
+            )
+            if self.breaker is not None:
+                self.breaker.record_failure()
+            raise
+
+        record_db_call(
+            self.name,
+            *_describe(request),
+            time.perf_counter() - started,
+            response.status_code >= 400,
+        )
+
+        if self.breaker is not None:
+            if response.status_code in UNAVAILABLE_STATUS_CODES:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+        return response
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns a snapshot of the connection pool.
+
+        Returns:
+            Dict[str, int]: Open, active and idle connections, requests
+            waiting for a connection and the circuit breaker state
+        """
+        pool = self._pool
+        connections = list(pool.connections)
+        idle = sum(1 for connection in connections if connection.is_idle())
+        # httpcore keeps every in-progress request here, queued or not
+        requests = list(getattr(pool, "_requests", []))
+        waiting = sum(1 for request in requests if request.is_queued())
+
+        return {
+            "connections": len(connections),
+            "active": len(connections) - idle,
+            "idle": idle,
+            "waiting": waiting,
+            "max_connections": settings.SUPABASE_POOL_MAX_CONNECTIONS,
+            "circuit": self.breaker.state if self.breaker is not None else None,
+        }
+
+
+# Transports by client name, for reporting
+_transports: Dict[str, PooledTransport] = {}
+_transports_lock = threading.Lock()
+
+
+def _create_transport(name: str, breaker: Optional[CircuitBreaker]) -> PooledTransport:
+    transport = PooledTransport(
+        name,
+        breaker=breaker,
+        http2=settings.SUPABASE_HTTP2,
+        limits=httpx.Limits(
+            max_connections=settings.SUPABASE_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.SUPABASE_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=settings.SUPABASE_POOL_KEEPALIVE_EXPIRY,
+        ),
+    )
+    _transports[name] = transport
+    return transport
+
+
+def _http_client(transport: PooledTransport) -> httpx.Client:
+    return httpx.Client(
+        transport=transport,
+        timeout=httpx.Timeout(
+            connect=settings.SUPABASE_CONNECT_TIMEOUT,
+            read=settings.SUPABASE_READ_TIMEOUT,
+            write=settings.SUPABASE_WRITE_TIMEOUT,
+            pool=settings.SUPABASE_POOL_TIMEOUT,
+        ),
+        follow_redirects=True,
+    )
+
+
+def create_http_client(name: str) -> httpx.Client:
+    """
+    Creates an HTTP client with the pooling and timeouts configured in settings.
+
+    Args:
+        name: Name the pool is reported under, e.g. "anon" or "admin"
+
+    Returns:
+        httpx.Client: Client to hand to the Supabase client options
+    """
+    return _http_client(_create_transport(name, breakers.get(name)))
+
+
+def shared_http_client(
+    name: str, breaker: Optional[CircuitBreaker] = None
+) -> httpx.Client:
+    """
+    Creates an HTTP client on the connection pool registered under name,
+    creating the pool on first use.
+
+    Each caller gets its own httpx.Client, so headers set on one never reach
+    another, while connections are shared. Do not close the returned client:
+    that would close the shared pool.
+
+    Args:
+        name: Name the pool is reported under
+        breaker: Circuit breaker fed by the pool when it is created
+    """
+    transport = _transports.get(name)
+    if transport is None:
+        with _transports_lock:
+            transport = _transports.get(name) or _create_transport(name, breaker)
+    return _http_client(transport)
+
+
+def pool_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Returns connection pool statistics for every Supabase client created so far.
+    """
+    return {name: transport.stats() for name, transport in _transports.items()}
+
+
+def _pool_connections() -> Dict[Tuple[str, ...], float]:
+    values = {}
+    for name, stats in pool_stats().items():
+        for state in ("active", "idle", "waiting"):
+            values[(name, state)] = stats[state]
+    return values
+
+
+registry.register(
+    Gauge(
+        "spenny_db_pool_connections",
+        "Connections of each Supabase pool by state",
+        _pool_connections,
+        ("pool", "state"),
+    )
+)
@@ -0,0 +1,153 @@
+import asyncio
+import threading
+from datetime import datetime, timezone
+from typing import Any, Coroutine, List, Optional
+import asyncpg
+from postgrest.exceptions import APIError
+from supabase import create_client
+from app.config.settings import settings
+from app.db.breaker import CircuitBreaker
+from app.db.sql import Dialect, Query, QueryResult
+
+
+class PostgresDialect(Dialect):
+    def placeholder(self, index: int) -> str:
+        return f"${index}"
+
+    def in_list(self, column: str, values: List[Any], params: List[Any]) -> str:
+        # A single array parameter keeps one prepared statement per query shape
+        # whatever the number of values
+        params.append(values)
+        return f"{column} = ANY({self.placeholder(len(params))})"
+
+    def adapt(self, column_type: str, value: Any) -> Any:
+        # asyncpg rejects aware datetimes for TIMESTAMP columns and reads naive
+        # ones as UTC for TIMESTAMPTZ, so timestamps are sent as naive UTC
+        if isinstance(value, datetime) and value.tzinfo is not None:
+            return value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+
+DIALECT = PostgresDialect()
+
+# Errors meaning the server could not be reached, as opposed to a failed query
+CONNECTION_ERRORS = (OSError, asyncio.TimeoutError, asyncpg.InterfaceError)
+
+
+class PostgresDatabase:
+    """
+    Database connecting to Postgres directly instead of through PostgREST.
+
+    It offers the same table(...).select(...).eq(...).execute() interface as
+    the Supabase client, so routers work unchanged. Queries run on an asyncpg
+    pool owned by a background event loop, since the routers execute them
+    synchronously; asyncpg prepares and caches every statement per connection.
+    Authentication is still handled by Supabase Auth.
+    """
+
+    def __init__(self, dsn: str, breaker: Optional[CircuitBreaker] = None):
+        self.breaker = breaker
+        self._auth = None
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="postgres", daemon=True
+        )
+        self._thread.start()
+
+        try:
+            self._pool: asyncpg.Pool = self._run(self._create_pool(dsn))
+        except Exception:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            raise
+
+    async def _create_pool(self, dsn: str) -> asyncpg.Pool:
+        # Created on the background loop, which the pool binds to
+        return await asyncpg.create_pool(
+            dsn,
+            min_size=settings.POSTGRES_POOL_MIN_SIZE,
+            max_size=settings.POSTGRES_POOL_MAX_SIZE,
+            statement_cache_size=settings.POSTGRES_STATEMENT_CACHE_SIZE,
+            command_timeout=settings.POSTGRES_COMMAND_TIMEOUT,
+        )
+
+    def _run(self, coroutine: Coroutine) -> Any:
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def table(self, name: str) -> Query:
+        return Query(self, name)
+
+    @property
+    def auth(self):
+        """
+        Supabase Auth client, created on first use.
+        """
+        if self._auth is None:
+            self._auth = create_client(
+                settings.SUPABASE_URL, settings.SUPABASE_KEY
+            ).auth
+        return self._auth
+
+    def execute(self, query: Query) -> QueryResult:
+        """
+        Executes a query on the pool.
+
+        Raises:
+            APIError: If Postgres rejects the query, with its SQLSTATE as code
+        """
+        try:
+            result = self._run(self._execute(query))
+        except asyncpg.PostgresError as e:
+            raise APIError(
+                {
+                    "code": e.sqlstate,
+                    "message": str(e),
+                    "details": getattr(e, "detail", None),
+                    "hint": getattr(e, "hint", None),
+                }
+            )
+        except CONNECTION_ERRORS:
+            if self.breaker is not None:
+                self.breaker.record_failure()
+            raise
+
+        if self.breaker is not None:
+            self.breaker.record_success()
+        return result
+
+    async def _execute(self, query: Query) -> QueryResult:
+        statements = query.compile(DIALECT)
+        rows = []
+        count = None
+
+        async with self._pool.acquire() as connection:
+            if len(statements) == 1:
+                sql, params = statements[0]
+                rows = await connection.fetch(sql, *params)
+            else:
+                async with connection.transaction():
+                    for sql, params in statements:
+                        rows.extend(await connection.fetch(sql, *params))
+
+            if query.count:
+                sql, params = query.compile_count(DIALECT)
+                count = await connection.fetchval(sql, *params)
+
+        return QueryResult(query.convert_rows(DIALECT, rows), count)
+
+    def stats(self) -> dict:
+        """
+        Returns a snapshot of the connection pool.
+        """
+        size = self._pool.get_size()
+        idle = self._pool.get_idle_size()
+        return {
+            "connections": size,
+            "active": size - idle,
+            "idle": idle,
+            "max_connections": self._pool.get_max_size(),
+            "circuit": self.breaker.state if self.breaker is not None else None,
+        }
+
+    def close(self) -> None:
+        self._run(self._pool.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
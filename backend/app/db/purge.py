@@ -0,0 +1,320 @@
+import asyncio
+import logging
+import os
+import socket
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
+from uuid import uuid4
+
+from postgrest.exceptions import APIError
+from supabase import Client
+
+from app.config.settings import settings
+from app.db.client import get_admin_db
+
+logger = logging.getLogger(__name__)
+
+# Dependent tables in the order they must be emptied. Transactions reference
+# accounts and categories, so they always go first.
+PURGE_TABLES: Tuple[str, ...] = ("transactions", "categories", "accounts")
+
+# Statuses of a deletion still to be carried out
+UNFINISHED = ("pending", "running")
+
+# How long completed deletions are kept for status polling
+FINISHED_RETENTION = timedelta(days=1)
+
+# Unclaimed deletions read per poll, in case others claim the first ones
+CLAIM_CANDIDATES = 10
+
+# Postgres error raised when the deletion was already recorded
+UNIQUE_VIOLATION = "23505"
+
+
+class PurgeLost(Exception):
+    """
+    Raised when another worker took over a deletion this worker was running.
+    """
+
+
+def record_deletion(budget_id: str, user_id: str) -> None:
+    """
+    Records that a soft-deleted budget is to be purged, unless it already is.
+
+    Args:
+        budget_id: ID of the soft-deleted budget
+        user_id: ID of the budget owner, used to authorise status polling
+    """
+    now = datetime.now(timezone.utc).isoformat()
+    try:
+        get_admin_db().table("budget_deletions").insert(
+            {
+                "budget_id": budget_id,
+                "user_id": user_id,
+                "status": "pending",
+                # Claimable straight away
+                "claimed_until": now,
+            }
+        ).execute()
+    except APIError as e:
+        if e.code != UNIQUE_VIOLATION:
+            raise
+
+
+def get_deletion(budget_id: str, user_id: str) -> Optional[dict]:
+    """
+    Returns the user's deletion of a budget, or None if there is none.
+    """
+    result = (
+        get_admin_db()
+        .table("budget_deletions")
+        .select("*")
+        .eq("budget_id", budget_id)
+        .eq("user_id", user_id)
+        .execute()
+    )
+    return result.data[0] if result.data else None
+
+
+class BudgetPurger:
+    """
+    Background worker that removes the rows belonging to soft-deleted budgets.
+
+    Deleting a budget marks it deleted and records it in budget_deletions.
+    Every API process runs a worker that polls that table every
+    BUDGET_PURGE_POLL_SECONDS, or as soon as notify() is called, and claims
+    one unclaimed deletion at a time by setting its claimed_by and
+    claimed_until in a single conditional update, so each budget is purged by
+    one worker only. The claim is renewed before every batch; if the worker
+    dies, another one takes the deletion over once its claim has lapsed,
+    BUDGET_PURGE_CLAIM_SECONDS later. The budget's transactions, categories
+    and accounts are deleted in batches of BUDGET_PURGE_BATCH_SIZE rows before
+    the budget itself.
+    """
+
+    def __init__(self):
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._current: Optional[str] = None
+
+    def start(self) -> None:
+        """
+        Starts the worker task, which also picks up deletions left unfinished
+        by a previous run.
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Stops the worker task, releasing the deletion in progress so another
+        worker resumes it without waiting for the claim to lapse.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        if self._current is not None:
+            budget_id, self._current = self._current, None
+            try:
+                await asyncio.to_thread(self._release, budget_id)
+            except Exception:
+                logger.warning("Failed to release budget deletion", exc_info=True)
+
+    def notify(self) -> None:
+        """
+        Wakes the worker after a budget was deleted, instead of waiting for
+        the next poll.
+        """
+        self._wake.set()
+
+    async def _run(self) -> None:
+        while True:
+            self._wake.clear()
+            purged = False
+            try:
+                purged = await self.purge_next()
+            except Exception:
+                logger.exception("Failed to purge deleted budgets")
+
+            # Look for the next one straight away after a purge
+            if not purged:
+                try:
+                    await asyncio.wait_for(
+                        self._wake.wait(), settings.BUDGET_PURGE_POLL_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    pass
+
+    async def purge_next(self) -> bool:
+        """
+        Claims and purges the oldest unclaimed deletion, if any.
+
+        Returns:
+            bool: Whether a deletion was claimed
+        """
+        db = get_admin_db()
+        now = datetime.now(timezone.utc)
+        await asyncio.to_thread(
+            lambda: db.table("budget_deletions")
+            .delete()
+            .eq("status", "completed")
+            .lt("finished_at", (now - FINISHED_RETENTION).isoformat())
+            .execute()
+        )
+
+        candidates = await asyncio.to_thread(
+            lambda: db.table("budget_deletions")
+            .select("budget_id")
+            .in_("status", list(UNFINISHED))
+            .lt("claimed_until", now.isoformat())
+            .order("created_at")
+            .limit(CLAIM_CANDIDATES)
+            .execute()
+        )
+        for candidate in candidates.data:
+            budget_id = str(candidate["budget_id"])
+            # Another worker may claim it first
+            if not await asyncio.to_thread(self._claim, budget_id):
+                continue
+
+            self._current = budget_id
+            try:
+                await self._purge(budget_id)
+                await asyncio.to_thread(self._finish, budget_id, "completed", None)
+            except PurgeLost:
+                logger.warning("Purge of budget %s was taken over", budget_id)
+            except Exception as e:
+                logger.exception("Failed to purge budget %s", budget_id)
+                await asyncio.to_thread(self._finish, budget_id, "failed", str(e))
+            # Left set when cancelled, for stop() to release
+            self._current = None
+            return True
+        return False
+
+    def _claim_values(self) -> dict:
+        claimed_until = datetime.now(timezone.utc) + timedelta(
+            seconds=settings.BUDGET_PURGE_CLAIM_SECONDS
+        )
+        return {"claimed_by": self.holder, "claimed_until": claimed_until.isoformat()}
+
+    def _claim(self, budget_id: str) -> bool:
+        """
+        Claims a deletion if its claim has lapsed; of several workers trying
+        at once only one succeeds.
+        """
+        now = datetime.now(timezone.utc)
+        result = (
+            get_admin_db()
+            .table("budget_deletions")
+            .update({**self._claim_values(), "status": "running"})
+            .eq("budget_id", budget_id)
+            .in_("status", list(UNFINISHED))
+            .lt("claimed_until", now.isoformat())
+            .execute()
+        )
+        if not result.data:
+            return False
+        if result.data[0].get("started_at") is None:
+            get_admin_db().table("budget_deletions").update(
+                {"started_at": now.isoformat()}
+            ).eq("budget_id", budget_id).eq("claimed_by", self.holder).execute()
+        return True
+
+    def _renew(self, budget_id: str) -> None:
+        """
+        Extends this worker's claim on a deletion.
+
+        Raises:
+            PurgeLost: If the claim has passed to another worker
+        """
+        result = (
+            get_admin_db()
+            .table("budget_deletions")
+            .update(self._claim_values())
+            .eq("budget_id", budget_id)
+            .eq("claimed_by", self.holder)
+            .eq("status", "running")
+            .execute()
+        )
+        if not result.data:
+            raise PurgeLost(budget_id)
+
+    def _release(self, budget_id: str) -> None:
+        get_admin_db().table("budget_deletions").update(
+            {"claimed_until": datetime.now(timezone.utc).isoformat()}
+        ).eq("budget_id", budget_id).eq("claimed_by", self.holder).eq(
+            "status", "running"
+        ).execute()
+
+    def _finish(self, budget_id: str, status: str, error: Optional[str]) -> None:
+        get_admin_db().table("budget_deletions").update(
+            {
+                "status": status,
+                "error": error,
+                "finished_at": datetime.now(timezone.utc).isoformat(),
+            }
+        ).eq("budget_id", budget_id).eq("claimed_by", self.holder).execute()
+
+    async def _purge(self, budget_id: str) -> None:
+        db = get_admin_db()
+
+        for table in PURGE_TABLES:
+            while True:
+                await asyncio.to_thread(self._renew, budget_id)
+                deleted = await asyncio.to_thread(
+                    self._delete_batch, db, table, budget_id
+                )
+                if not deleted:
+                    break
+                await asyncio.sleep(settings.BUDGET_PURGE_BATCH_DELAY_SECONDS)
+
+        await asyncio.to_thread(self._renew, budget_id)
+        await asyncio.to_thread(
+            lambda: db.table("budgets")
+            .delete()
+            .eq("id", budget_id)
+            .not_.is_("deleted_at", "null")
+            .execute()
+        )
+
+    @staticmethod
+    def _delete_batch(db: Client, table: str, budget_id: str) -> int:
+        """
+        Deletes up to BUDGET_PURGE_BATCH_SIZE rows of a budget.
+
+        Returns:
+            int: Number of rows deleted, 0 once none are left
+
+        Raises:
+            RuntimeError: If rows were found but none could be deleted, which
+            would otherwise repeat forever
+        """
+        batch = (
+            db.table(table)
+            .select("id")
+            .eq("budget_id", budget_id)
+            .limit(settings.BUDGET_PURGE_BATCH_SIZE)
+            .execute()
+        )
+        if not batch.data:
+            return 0
+
+        ids = [row["id"] for row in batch.data]
+        deleted = (
+            db.table(table).delete().in_("id", ids).eq("budget_id", budget_id).execute()
+        )
+        if not deleted.data:
+            raise RuntimeError(
+                f"None of {len(ids)} {table} rows of budget {budget_id} "
+                "could be deleted"
+            )
+        return len(deleted.data)
+
+
+budget_purger = BudgetPurger()
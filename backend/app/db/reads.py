@@ -0,0 +1,191 @@
+import asyncio
+import contextvars
+import time
+from collections import defaultdict, deque
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Optional
+from fastapi import HTTPException, status
+from app.config.settings import settings
+
+# Absolute deadline (time.monotonic()) of the request being handled, if any
+request_deadline: ContextVar[Optional[float]] = ContextVar(
+    "request_deadline", default=None
+)
+
+
+def start_deadline(timeout_header: Optional[str]) -> contextvars.Token:
+    """
+    Sets the deadline of the current request.
+
+    Args:
+        timeout_header: Remaining time budget in milliseconds sent by the
+        caller, or None to use READ_DEFAULT_TIMEOUT_MS
+
+    Returns:
+        contextvars.Token: Token to reset the deadline with
+    """
+    timeout_ms: Optional[float] = settings.READ_DEFAULT_TIMEOUT_MS
+    if timeout_header:
+        try:
+            timeout_ms = max(0.0, float(timeout_header))
+        except ValueError:
+            pass
+
+    deadline = None
+    if timeout_ms is not None:
+        deadline = time.monotonic() + timeout_ms / 1000
+    return request_deadline.set(deadline)
+
+
+class ReadLatencies:
+    """
+    Rolling window of read latencies per table, used to decide when to hedge.
+    """
+
+    WINDOW = 512
+    RECOMPUTE_EVERY = 32
+
+    def __init__(self):
+        self._samples: Dict[str, Deque[float]] = defaultdict(
+            lambda: deque(maxlen=self.WINDOW)
+        )
+        self._thresholds: Dict[str, float] = {}
+        self._since_recompute: Dict[str, int] = defaultdict(int)
+
+    def record(self, table: str, seconds: float) -> None:
+        samples = self._samples[table]
+        samples.append(seconds)
+        self._since_recompute[table] += 1
+
+        if (
+            len(samples) >= settings.READ_HEDGE_MIN_SAMPLES
+            and self._since_recompute[table] >= self.RECOMPUTE_EVERY
+        ) or table not in self._thresholds:
+            ordered = sorted(samples)
+            index = int(len(ordered) * settings.READ_HEDGE_PERCENTILE / 100)
+            self._thresholds[table] = ordered[min(index, len(ordered) - 1)]
+            self._since_recompute[table] = 0
+
+    def hedge_delay(self, table: str) -> Optional[float]:
+        """
+        Returns how long to wait before hedging a read, or None if there are
+        not enough samples yet.
+        """
+        if len(self._samples[table]) < settings.READ_HEDGE_MIN_SAMPLES:
+            return None
+        return max(
+            self._thresholds.get(table, 0.0), settings.READ_HEDGE_MIN_DELAY_MS / 1000
+        )
+
+
+latencies = ReadLatencies()
+
+# Hedged reads sent, and how many of them answered first, per table
+hedges_fired: Dict[str, int] = defaultdict(int)
+hedges_won: Dict[str, int] = defaultdict(int)
+
+
+def hedge_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Returns hedging counters and current hedge delays per table.
+    """
+    return {
+        table: {
+            "hedges_fired": hedges_fired[table],
+            "hedges_won": hedges_won[table],
+            "hedge_delay_ms": (
+                round(delay * 1000, 3)
+                if (delay := latencies.hedge_delay(table)) is not None
+                else None
+            ),
+        }
+        for table in list(latencies._samples)
+    }
+
+
+def _table_of(query: Any) -> str:
+    path = getattr(getattr(query, "request", None), "path", None)
+    if path is None:
+        return getattr(query, "table", "unknown")
+    return str(path).rstrip("/").rsplit("/", 1)[-1]
+
+
+def _deadline_exceeded() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+        detail="Request deadline exceeded",
+    )
+
+
+async def execute_read(query: Any) -> Any:
+    """
+    Executes a read query without blocking the event loop.
+
+    The read is bounded by the request deadline. If it takes longer than the
+    READ_HEDGE_PERCENTILE latency of earlier reads on the same table, an
+    identical read is sent and whichever answers first is used.
+
+    Args:
+        query: Query builder to execute; must be free of side effects
+
+    Returns:
+        The query response
+
+    Raises:
+        HTTPException: 504 if the request deadline passes first
+    """
+    loop = asyncio.get_running_loop()
+    table = _table_of(query)
+    deadline = request_deadline.get()
+    started = time.monotonic()
+
+    def remaining() -> Optional[float]:
+        return None if deadline is None else deadline - time.monotonic()
+
+    def submit() -> asyncio.Future:
+        # Copy the context so per-request state is visible in the worker thread
+        context = contextvars.copy_context()
+        future = loop.run_in_executor(None, context.run, query.execute)
+        # The losing read may still fail later; make sure that is not reported
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        return future
+
+    if deadline is not None and remaining() <= 0:
+        raise _deadline_exceeded()
+
+    primary = submit()
+    pending = {primary}
+    hedge: Optional[asyncio.Future] = None
+    delay = latencies.hedge_delay(table) if settings.READ_HEDGE_ENABLED else None
+
+    if delay is not None and (deadline is None or remaining() > delay):
+        done, pending = await asyncio.wait(pending, timeout=delay)
+        if not done:
+            hedge = submit()
+            hedges_fired[table] += 1
+            pending.add(hedge)
+
+    while pending:
+        done, pending = await asyncio.wait(
+            pending, timeout=remaining(), return_when=asyncio.FIRST_COMPLETED
+        )
+        if not done:
+            raise _deadline_exceeded()
+
+        # A failed read waits for the other; of two successful reads finished
+        # together, the primary is preferred
+        succeeded = [future for future in done if future.exception() is None]
+        if not succeeded:
+            continue
+        winner = primary if primary in succeeded else succeeded[0]
+
+        if winner is hedge:
+            hedges_won[table] += 1
+        latencies.record(table, time.monotonic() - started)
+        return winner.result()
+
+    # Reached when the query finished before the hedge delay, or every read
+    # failed; the primary's error is raised
+    if primary.exception() is None:
+        latencies.record(table, time.monotonic() - started)
+    return primary.result()
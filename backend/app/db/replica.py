@@ -0,0 +1,68 @@
+import threading
+import time
+from typing import Dict, Optional
+from fastapi import Request
+from jose import JWTError, jwt
+from app.config.settings import settings
+from app.db.shared_cache import shared_cache
+
+
+class RecentWriters:
+    """
+    Remembers which users wrote recently so that their reads are served by
+    the primary until the replica has caught up.
+
+    With SHARED_CACHE_PATH set, writes are recorded in the cache shared by
+    the workers on the host. Otherwise state is kept per process, so with
+    several workers a user's next read only sticks to the primary on the
+    worker that handled the write.
+    """
+
+    # Expired entries are swept once this many users are tracked
+    SWEEP_THRESHOLD = 10_000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._until: Dict[str, float] = {}
+
+    def record_write(self, user_id: str) -> None:
+        shared = shared_cache()
+        if shared is not None:
+            shared.set(f"writer:{user_id}", b"", settings.READ_YOUR_WRITES_WINDOW)
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            self._until[user_id] = now + settings.READ_YOUR_WRITES_WINDOW
+            if len(self._until) > self.SWEEP_THRESHOLD:
+                self._until = {
+                    user: until for user, until in self._until.items() if until > now
+                }
+
+    def wrote_recently(self, user_id: str) -> bool:
+        shared = shared_cache()
+        if shared is not None:
+            return shared.get(f"writer:{user_id}") is not None
+
+        until = self._until.get(user_id)
+        return until is not None and until > time.monotonic()
+
+
+recent_writers = RecentWriters()
+
+
+def request_user_id(request: Request) -> Optional[str]:
+    """
+    Returns the subject of the request's bearer token without verifying it.
+
+    Only used to route reads; the token is still verified by get_current_user.
+    """
+    authorization = request.headers.get("Authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+
+    try:
+        return jwt.get_unverified_claims(token).get("sub")
+    except JWTError:
+        return None
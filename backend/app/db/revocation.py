@@ -0,0 +1,246 @@
+import asyncio
+import hashlib
+import logging
+import math
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from postgrest.exceptions import APIError
+
+from app.config.settings import settings
+from app.db.client import get_admin_db
+
+logger = logging.getLogger(__name__)
+
+# Postgres error raised when the token was already revoked
+UNIQUE_VIOLATION = "23505"
+# Incremental syncs re-read the rows created this long before the newest one
+# seen, so rows committed out of order of their created_at are not missed
+SYNC_OVERLAP = timedelta(minutes=1)
+
+
+class BloomFilter:
+    """
+    Fixed-size set membership test with no false negatives.
+
+    Sized for `capacity` items at the given false positive rate; a positive
+    answer must be confirmed against the exact set.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        capacity = max(1, capacity)
+        self.capacity = capacity
+        # Items added, including any no longer in the set
+        self.count = 0
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str) -> Iterable[int]:
+        # Double hashing: two 64-bit halves of one digest give every position
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, item: str) -> None:
+        self.count += 1
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
+
+
+def _parse_time(value: Any) -> datetime:
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+class RevocationList:
+    """
+    In-memory copy of the revoked_tokens table, checked on every request.
+
+    Token IDs (jti) are tested against a Bloom filter first, so tokens that
+    were never revoked cost a few hashes and no query; the rare positive is
+    confirmed against an exact set. Revocations made by this worker apply
+    immediately, those made by other workers once the list is next synced,
+    every TOKEN_REVOCATION_SYNC_SECONDS. Rows are dropped once the token they
+    revoke has expired.
+
+    The first sync loads every unexpired row; later ones only read the rows
+    created since the newest seen. Rows are read in pages of
+    TOKEN_REVOCATION_PAGE_SIZE ordered by jti, so none are lost to the row
+    limit of a PostgREST response.
+    """
+
+    def __init__(self):
+        # Revoked token IDs and when the tokens expire
+        self._revoked: Dict[str, datetime] = {}
+        self._filter = BloomFilter(
+            settings.TOKEN_REVOCATION_CAPACITY, settings.TOKEN_REVOCATION_ERROR_RATE
+        )
+        # Held while adding to the list and while sync() swaps it, as sync runs
+        # in a thread and revocations on the event loop must not be lost
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.synced_at: Optional[datetime] = None
+        # Newest created_at read, by the database's clock
+        self._cursor: Optional[datetime] = None
+
+    def start(self) -> None:
+        """
+        Starts the task that loads and periodically refreshes the list.
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def is_revoked(self, jti: Optional[str]) -> bool:
+        if jti is None or jti not in self._filter:
+            return False
+        return jti in self._revoked
+
+    def _add(self, jti: str, expires_at: datetime) -> None:
+        # Called with the lock held
+        self._revoked[jti] = expires_at
+        self._filter.add(jti)
+
+    def revoke(self, jti: str, user_id: str, expires_at: datetime) -> bool:
+        """
+        Records a token as revoked until it expires.
+
+        Returns:
+            bool: False if the token had already been revoked, by this or any
+            other worker
+
+        Raises:
+            APIError: If the revocation could not be stored
+        """
+        revoked = True
+        try:
+            get_admin_db().table("revoked_tokens").insert(
+                {
+                    "jti": jti,
+                    "user_id": user_id,
+                    "expires_at": expires_at.isoformat(),
+                }
+            ).execute()
+        except APIError as e:
+            if e.code != UNIQUE_VIOLATION:
+                raise
+            revoked = False
+        with self._lock:
+            self._add(jti, expires_at)
+        return revoked
+
+    def _fetch(self, now: datetime, since: Optional[datetime]) -> List[dict]:
+        """
+        Reads the unexpired rows of revoked_tokens, those created since the
+        given time if any, one page at a time.
+        """
+        db = get_admin_db()
+        rows: List[dict] = []
+        after: Optional[str] = None
+        while True:
+            query = (
+                db.table("revoked_tokens")
+                .select("jti, expires_at, created_at")
+                .gt("expires_at", now.isoformat())
+            )
+            if since is not None:
+                query = query.gte("created_at", since.isoformat())
+            if after is not None:
+                query = query.gt("jti", after)
+            page = (
+                query.order("jti").limit(settings.TOKEN_REVOCATION_PAGE_SIZE).execute()
+            ).data
+            rows.extend(page)
+            if len(page) < settings.TOKEN_REVOCATION_PAGE_SIZE:
+                return rows
+            after = page[-1]["jti"]
+
+    def sync(self) -> None:
+        """
+        Adds the revocations stored since the last sync, forgets the expired
+        ones and deletes their rows.
+        """
+        now = datetime.now(timezone.utc)
+        since = self._cursor - SYNC_OVERLAP if self._cursor is not None else None
+        rows = self._fetch(now, since)
+        fetched = {row["jti"]: _parse_time(row["expires_at"]) for row in rows}
+        cursor = max(
+            (_parse_time(row["created_at"]) for row in rows), default=self._cursor
+        )
+
+        with self._lock:
+            current = dict(self._revoked)
+        revoked = {jti: until for jti, until in current.items() if until > now}
+        revoked.update(fetched)
+
+        # Expired IDs stay in the filter, where they only cost an exact check,
+        # until it is rebuilt: on the first sync or once it is full
+        bloom = None
+        if since is None or self._filter.count + len(fetched) > self._filter.capacity:
+            # Leave headroom so revocations until the next rebuild stay accurate
+            bloom = BloomFilter(
+                max(settings.TOKEN_REVOCATION_CAPACITY, 2 * len(revoked)),
+                settings.TOKEN_REVOCATION_ERROR_RATE,
+            )
+            for jti in revoked:
+                bloom.add(jti)
+
+        with self._lock:
+            # Revocations made while the query ran are not in its result yet
+            pending = [
+                (jti, expires_at)
+                for jti, expires_at in self._revoked.items()
+                if jti not in revoked and expires_at > now
+            ]
+            self._revoked = revoked
+            if bloom is not None:
+                self._filter = bloom
+            else:
+                for jti in fetched:
+                    self._filter.add(jti)
+            for jti, expires_at in pending:
+                self._add(jti, expires_at)
+        self._cursor = cursor
+        self.synced_at = now
+
+        get_admin_db().table("revoked_tokens").delete().lt(
+            "expires_at", now.isoformat()
+        ).execute()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.sync)
+            except Exception:
+                logger.exception("Could not sync revoked tokens")
+            await asyncio.sleep(settings.TOKEN_REVOCATION_SYNC_SECONDS)
+
+    def stats(self) -> dict:
+        return {
+            "revoked": len(self._revoked),
+            "filter_bits": self._filter.size,
+            "filter_hashes": self._filter.hashes,
+            "synced_at": self.synced_at,
+        }
+
+
+revoked_tokens = RevocationList()
@@ -0,0 +1,139 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from fastapi import Request
+from jose import JWTError, jwt
+from postgrest import SyncPostgrestClient
+from app.config.settings import settings
+from app.db.breaker import breakers
+from app.db.client import ConnectionError
+from app.db.pool import shared_http_client
+from app.utils.metrics import record_cache
+
+# Per-user tokens are re-minted when they have less than this many seconds left
+TOKEN_REFRESH_MARGIN = 60
+
+
+def rls_enabled() -> bool:
+    """
+    Whether queries run as the end user so RLS policies enforce ownership.
+    """
+    return settings.SUPABASE_RLS_MODE and settings.DB_BACKEND == "supabase"
+
+
+def verified_user_id(request: Request) -> Optional[str]:
+    """
+    Returns the subject of the request's bearer token if its signature and
+    expiry are valid and it is not a refresh token, otherwise None.
+    """
+    authorization = request.headers.get("Authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+
+    try:
+        payload = jwt.decode(
+            token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM]
+        )
+    except JWTError:
+        return None
+    if payload.get("typ") == "refresh":
+        return None
+    return payload.get("sub")
+
+
+def mint_user_token(user_id: str) -> Tuple[str, float]:
+    """
+    Creates a Supabase access token for a user, as Supabase Auth would.
+
+    Returns:
+        Tuple[str, float]: The token and its expiry as a Unix timestamp
+    """
+    now = int(time.time())
+    expires_at = now + settings.RLS_TOKEN_TTL_SECONDS
+    claims = {
+        "sub": user_id,
+        "role": "authenticated",
+        "aud": "authenticated",
+        "iat": now,
+        "exp": expires_at,
+    }
+    return (
+        jwt.encode(claims, settings.SUPABASE_JWT_SECRET, algorithm="HS256"),
+        expires_at,
+    )
+
+
+class UserClientPool:
+    """
+    Bounded pool of PostgREST clients authenticated as individual users,
+    evicting the least recently used.
+
+    Clients share one connection pool but each has its own HTTP client and
+    headers, so one user's token is never sent on another user's behalf.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients: "OrderedDict[str, Tuple[SyncPostgrestClient, float]]" = (
+            OrderedDict()
+        )
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id: str) -> SyncPostgrestClient:
+        """
+        Returns a client acting as the user, creating it if needed.
+
+        Raises:
+            ConnectionError: If SUPABASE_JWT_SECRET is not configured
+        """
+        with self._lock:
+            entry = self._clients.get(user_id)
+            if entry is not None and entry[1] - time.time() > TOKEN_REFRESH_MARGIN:
+                self._clients.move_to_end(user_id)
+                self.hits += 1
+                record_cache("rls_clients", True)
+                return entry[0]
+
+        record_cache("rls_clients", False)
+        client, expires_at = self._create(user_id)
+
+        with self._lock:
+            self.misses += 1
+            self._clients[user_id] = (client, expires_at)
+            self._clients.move_to_end(user_id)
+            while len(self._clients) > settings.RLS_CLIENT_POOL_SIZE:
+                self._clients.popitem(last=False)
+                self.evictions += 1
+        return client
+
+    @staticmethod
+    def _create(user_id: str) -> Tuple[SyncPostgrestClient, float]:
+        if not settings.SUPABASE_JWT_SECRET:
+            raise ConnectionError("SUPABASE_JWT_SECRET not configured")
+
+        token, expires_at = mint_user_token(user_id)
+        client = SyncPostgrestClient(
+            f"{settings.SUPABASE_URL}/rest/v1",
+            headers={
+                "apikey": settings.SUPABASE_KEY,
+                "Authorization": f"Bearer {token}",
+            },
+            http_client=shared_http_client("rls", breaker=breakers["anon"]),
+        )
+        return client, expires_at
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "clients": len(self._clients),
+            "max_clients": settings.RLS_CLIENT_POOL_SIZE,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+user_clients = UserClientPool()
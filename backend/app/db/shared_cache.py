@@ -0,0 +1,274 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional, Tuple
+from app.config.settings import settings
+
+MAGIC = b"SPNYSHC1"
+# Magic, slot count and the last version handed out
+HEADER = struct.Struct("<8sQQ")
+HEADER_SIZE = 64
+VERSION_OFFSET = 16
+# Seqlock counter, key hash, version, expiry (epoch seconds), key and value
+# lengths; followed by the key and value bytes
+SLOT_HEADER = struct.Struct("<QQQdHH")
+SEQ = struct.Struct("<Q")
+SLOT_SIZE = 256
+MAX_KEY_SIZE = 92
+MAX_VALUE_SIZE = SLOT_SIZE - SLOT_HEADER.size - MAX_KEY_SIZE
+# Slots a key may occupy, starting from its hash
+PROBE_WINDOW = 8
+# Reads racing a write are retried this many times before counting as a miss
+READ_ATTEMPTS = 100
+
+
+class SharedCache:
+    """
+    Hash table in a memory-mapped file, shared by every process on the host
+    that opens the same path (e.g. the uvicorn workers).
+
+    Each key lives in one of PROBE_WINDOW slots from its hash; when all are
+    taken, the entry closest to expiring is replaced. Every write stamps the
+    entry with a version from a table-wide counter, and invalidate() leaves a
+    tombstone with a new version, so an invalidation made by one worker is
+    seen by the next lookup in any other.
+
+    Writers lock the slots of the key's window with fcntl range locks (and a
+    thread lock, as fcntl locks are per process); readers take no lock and
+    retry if a slot's seqlock counter shows it changed under them.
+
+    Args:
+        path: File backing the table; created, or reset if its layout differs
+        slots: Number of slots, of SLOT_SIZE bytes each
+    """
+
+    def __init__(self, path: str, slots: int):
+        self.path = path
+        self.slots = slots
+        self._lock = threading.Lock()
+        size = HEADER_SIZE + (slots + PROBE_WINDOW) * SLOT_SIZE
+
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, HEADER_SIZE, 0)
+        try:
+            header = os.pread(self._fd, HEADER.size, 0)
+            if (
+                os.fstat(self._fd).st_size != size
+                or header[:8] != MAGIC
+                or HEADER.unpack(header)[1] != slots
+            ):
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, size)
+                os.pwrite(self._fd, HEADER.pack(MAGIC, slots, 0), 0)
+            self._map = mmap.mmap(self._fd, size)
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, HEADER_SIZE, 0)
+
+    def close(self) -> None:
+        self._map.close()
+        os.close(self._fd)
+
+    def _locate(self, key: bytes) -> Tuple[int, int]:
+        """
+        Returns the key's hash (never 0, which marks an empty slot) and the
+        first slot of its window.
+        """
+        digest = hashlib.blake2b(key, digest_size=8).digest()
+        key_hash = int.from_bytes(digest, "little") or 1
+        return key_hash, key_hash % self.slots
+
+    def _offset(self, index: int) -> int:
+        return HEADER_SIZE + index * SLOT_SIZE
+
+    def _read(self, index: int) -> Optional[Tuple[int, int, float, bytes, bytes]]:
+        """
+        Returns the slot's key hash, version, expiry, key and value, or None
+        if it kept changing while being read.
+        """
+        offset = self._offset(index)
+        for _ in range(READ_ATTEMPTS):
+            seq = SEQ.unpack_from(self._map, offset)[0]
+            if seq & 1:
+                continue
+            _, key_hash, version, expires, key_size, value_size = (
+                SLOT_HEADER.unpack_from(self._map, offset)
+            )
+            start = offset + SLOT_HEADER.size
+            key = self._map[start : start + key_size]
+            start += MAX_KEY_SIZE
+            value = self._map[start : start + value_size]
+            if SEQ.unpack_from(self._map, offset)[0] == seq:
+                return key_hash, version, expires, key, value
+        return None
+
+    def _find(self, key: bytes) -> Optional[Tuple[int, int, float, bytes]]:
+        key_hash, first = self._locate(key)
+        for index in range(first, first + PROBE_WINDOW):
+            # Peek at the hash before a consistent read of the whole slot
+            peeked = SEQ.unpack_from(self._map, self._offset(index) + SEQ.size)[0]
+            if peeked == 0:
+                # Slots are filled in order and never emptied again
+                return None
+            if peeked != key_hash:
+                continue
+            slot = self._read(index)
+            if slot is not None and slot[0] == key_hash and slot[3] == key:
+                return index, slot[1], slot[2], slot[4]
+        return None
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        Returns the value stored for the key, or None if it is missing,
+        expired or invalidated.
+        """
+        found = self._find(key.encode())
+        if found is None or found[2] <= time.time():
+            return None
+        return found[3]
+
+    def version(self, key: str) -> int:
+        """
+        Returns the version of the key's last write or invalidation, or 0 if
+        the table has no trace of it.
+        """
+        found = self._find(key.encode())
+        return found[1] if found is not None else 0
+
+    def set(
+        self,
+        key: str,
+        value: bytes,
+        ttl: float,
+        expected_version: Optional[int] = None,
+    ) -> int:
+        """
+        Stores a value for ttl seconds.
+
+        Args:
+            expected_version: Only store the value if the key is still at this
+            version, as returned by version() before the value was computed;
+            a write or invalidation in between wins over a stale value
+
+        Returns:
+            int: The entry's new version, or 0 if it was not at
+            expected_version and nothing was written
+        """
+        return self._write(key.encode(), value, time.time() + ttl, expected_version)
+
+    def invalidate(self, key: str) -> None:
+        """
+        Drops the key's value for every process sharing the table.
+
+        A tombstone is written even if the key is not in the table, so that
+        a value computed before the invalidation is refused by set() with
+        expected_version.
+        """
+        self._write(key.encode(), b"", 0.0)
+
+    @contextmanager
+    def _window_locked(self, first: int) -> Iterator[None]:
+        offset = self._offset(first)
+        length = PROBE_WINDOW * SLOT_SIZE
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, length, offset)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, length, offset)
+
+    def _next_version(self) -> int:
+        # Called with a window locked, so the thread lock is held
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, SEQ.size, VERSION_OFFSET)
+        try:
+            version = SEQ.unpack_from(self._map, VERSION_OFFSET)[0] + 1
+            SEQ.pack_into(self._map, VERSION_OFFSET, version)
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, SEQ.size, VERSION_OFFSET)
+        return version
+
+    def _write(
+        self,
+        key: bytes,
+        value: bytes,
+        expires: float,
+        expected_version: Optional[int] = None,
+    ) -> int:
+        if len(key) > MAX_KEY_SIZE or len(value) > MAX_VALUE_SIZE:
+            raise ValueError(
+                f"Shared cache keys are limited to {MAX_KEY_SIZE} bytes and "
+                f"values to {MAX_VALUE_SIZE}"
+            )
+        key_hash, first = self._locate(key)
+
+        with self._window_locked(first):
+            # Slots in the window cannot change while it is locked
+            slots = [
+                (index, self._read(index))
+                for index in range(first, first + PROBE_WINDOW)
+            ]
+            target = next(
+                (i for i, slot in slots if slot[0] == key_hash and slot[3] == key),
+                None,
+            )
+            if expected_version is not None:
+                current = slots[target - first][1][1] if target is not None else 0
+                if current != expected_version:
+                    return 0
+            if target is None:
+                # An empty slot, else the entry closest to expiring; expired
+                # entries and tombstones go first
+                target = min(slots, key=lambda item: (item[1][0] != 0, item[1][2]))[0]
+
+            version = self._next_version()
+            offset = self._offset(target)
+            seq = SEQ.unpack_from(self._map, offset)[0]
+            SEQ.pack_into(self._map, offset, seq + 1)
+            SLOT_HEADER.pack_into(
+                self._map,
+                offset,
+                seq + 1,
+                key_hash,
+                version,
+                expires,
+                len(key),
+                len(value),
+            )
+            start = offset + SLOT_HEADER.size
+            self._map[start : start + len(key)] = key
+            start += MAX_KEY_SIZE
+            self._map[start : start + len(value)] = value
+            SEQ.pack_into(self._map, offset, seq + 2)
+        return version
+
+
+_cache: Optional[SharedCache] = None
+_cache_pid: Optional[int] = None
+_cache_lock = threading.Lock()
+
+
+def shared_cache() -> Optional[SharedCache]:
+    """
+    Returns the host's shared cache, or None when SHARED_CACHE_PATH is not
+    set and caches stay in each process.
+
+    The file is mapped again after a fork, so workers forked from a process
+    that had already opened it get their own file descriptor and locks.
+    """
+    global _cache, _cache_pid
+    if not settings.SHARED_CACHE_PATH:
+        return None
+
+    pid = os.getpid()
+    if _cache is None or _cache_pid != pid:
+        with _cache_lock:
+            if _cache is None or _cache_pid != pid:
+                _cache = SharedCache(
+                    settings.SHARED_CACHE_PATH, settings.SHARED_CACHE_SLOTS
+                )
+                _cache_pid = pid
+    return _cache
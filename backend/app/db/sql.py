@@ -0,0 +1,433 @@
+import time
+from abc import ABC, abstractmethod
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+from uuid import UUID
+from postgrest.exceptions import APIError
+from app.config.settings import settings
+from app.utils.metrics import record_db_call
+from app.utils.money import minor_units_enabled
+
+# Column types of every table the API reads or writes. Values received from
+# the routers are strings (as they would be sent to PostgREST) and are
+# converted according to these types before reaching a driver.
+SCHEMA: Dict[str, Dict[str, str]] = {
+    "users": {
+        "id": "uuid",
+        "email": "text",
+        "name": "text",
+        "membership_version": "int",
+        "created_at": "timestamp",
+    },
+    "revoked_tokens": {
+        "jti": "text",
+        "user_id": "uuid",
+        "expires_at": "timestamp",
+        "created_at": "timestamp",
+    },
+    "outbox": {
+        "id": "int",
+        "budget_id": "uuid",
+        "table_name": "text",
+        "row_id": "uuid",
+        "operation": "text",
+        "attempts": "int",
+        "last_error": "text",
+        "failed_at": "timestamp",
+        "created_at": "timestamp",
+    },
+    "budget_deletions": {
+        "budget_id": "uuid",
+        "user_id": "uuid",
+        "status": "text",
+        "error": "text",
+        "claimed_by": "text",
+        "claimed_until": "timestamp",
+        "started_at": "timestamp",
+        "finished_at": "timestamp",
+        "created_at": "timestamp",
+    },
+    "outbox_lease": {
+        "name": "text",
+        "holder": "text",
+        "expires_at": "timestamp",
+    },
+    "budgets": {
+        "id": "uuid",
+        "user_id": "uuid",
+        "name": "text",
+        "is_default": "bool",
+        "currency_exponent": "int",
+        "deleted_at": "timestamp",
+        "created_at": "timestamp",
+        "version": "int",
+    },
+    "categories": {
+        "id": "uuid",
+        "budget_id": "uuid",
+        "name": "text",
+        "allocated": "money",
+        "created_at": "timestamp",
+        "version": "int",
+    },
+    "accounts": {
+        "id": "uuid",
+        "budget_id": "uuid",
+        "name": "text",
+        "type": "text",
+        "balance": "money",
+        "created_at": "timestamp",
+        "version": "int",
+    },
+    "transactions": {
+        "id": "uuid",
+        "budget_id": "uuid",
+        "account_id": "uuid",
+        "category_id": "uuid",
+        "date": "date",
+        "payee": "text",
+        "amount": "money",
+        "note": "text",
+        "cleared": "bool",
+        "created_at": "timestamp",
+        "version": "int",
+    },
+}
+
+
+# SQL operator of each comparison filter, and of its negation
+COMPARISONS: Dict[str, Tuple[str, str]] = {
+    "eq": ("=", "<>"),
+    "neq": ("<>", "="),
+    "lt": ("<", ">="),
+    "gt": (">", "<="),
+    "gte": (">=", "<"),
+}
+
+
+def to_python(column_type: str, value: Any) -> Any:
+    """
+    Convert a value received from the routers to the Python type of a column.
+    """
+    if value is None:
+        return None
+    if column_type == "uuid":
+        return value if isinstance(value, UUID) else UUID(str(value))
+    if column_type == "int":
+        return int(value)
+    if column_type == "bool":
+        if isinstance(value, str):
+            return value.lower() == "true"
+        return bool(value)
+    if column_type == "money":
+        return int(value) if minor_units_enabled() else Decimal(str(value))
+    if column_type == "date":
+        return value if isinstance(value, date) else date.fromisoformat(value)
+    if column_type == "timestamp":
+        if isinstance(value, datetime):
+            return value
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    return value
+
+
+def to_json(value: Any) -> Any:
+    """
+    Convert a value read from a driver to the shape PostgREST would return.
+    Amounts are kept as Decimal so they stay exact.
+    """
+    if isinstance(value, UUID):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+class QueryResult:
+    """Result of a query, mirroring the attributes of a PostgREST response"""
+
+    def __init__(self, data: List[dict], count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+
+class Dialect(ABC):
+    """
+    SQL differences between the databases a Query can be compiled for.
+    """
+
+    @abstractmethod
+    def placeholder(self, index: int) -> str:
+        """
+        Returns the placeholder of the index-th parameter, counted from 1.
+        """
+
+    @abstractmethod
+    def in_list(self, column: str, values: List[Any], params: List[Any]) -> str:
+        """
+        Returns the SQL testing column against a list of values, appending
+        the values to params.
+        """
+
+    def adapt(self, column_type: str, value: Any) -> Any:
+        """
+        Convert a Python value to a query parameter.
+        """
+        return value
+
+    def convert(self, column_type: str, value: Any) -> Any:
+        """
+        Convert a value read from the database to its JSON shape.
+        """
+        return to_json(value)
+
+
+def quote(identifier: str) -> str:
+    return f'"{identifier}"'
+
+
+class Query:
+    """
+    Query builder with the subset of the PostgREST builder API used by the
+    routers, compiled to parameterised SQL.
+
+    Filters are only ever sent as parameters and column names are checked
+    against SCHEMA, so values cannot alter the statement.
+    """
+
+    def __init__(self, database: Any, table: str):
+        if table not in SCHEMA:
+            raise APIError(
+                {"code": "42P01", "message": f'relation "{table}" does not exist'}
+            )
+        self.database = database
+        self.table = table
+        self.columns = SCHEMA[table]
+        self.operation = "select"
+        self.selected: Optional[List[str]] = None
+        self.count: Optional[str] = None
+        self.values: List[dict] = []
+        self.filters: List[Tuple[str, str, Any, bool]] = []
+        self.row_limit: Optional[int] = None
+        self.ordering: List[Tuple[str, bool]] = []
+        self._negate_next = False
+
+    # Operations
+
+    def select(self, columns: str = "*", count: Optional[str] = None) -> "Query":
+        self.operation = "select"
+        self.count = count
+        if columns.strip() != "*":
+            self.selected = [self._column(c.strip()) for c in columns.split(",")]
+        return self
+
+    def insert(self, values: Union[dict, List[dict]]) -> "Query":
+        self.operation = "insert"
+        self.values = values if isinstance(values, list) else [values]
+        return self
+
+    def update(self, values: dict) -> "Query":
+        self.operation = "update"
+        self.values = [values]
+        return self
+
+    def delete(self) -> "Query":
+        self.operation = "delete"
+        return self
+
+    # Filters
+
+    @property
+    def not_(self) -> "Query":
+        self._negate_next = True
+        return self
+
+    def _filter(self, operator: str, column: str, value: Any) -> "Query":
+        self.filters.append((operator, self._column(column), value, self._negate_next))
+        self._negate_next = False
+        return self
+
+    def eq(self, column: str, value: Any) -> "Query":
+        return self._filter("eq", column, value)
+
+    def neq(self, column: str, value: Any) -> "Query":
+        return self._filter("neq", column, value)
+
+    def lt(self, column: str, value: Any) -> "Query":
+        return self._filter("lt", column, value)
+
+    def gt(self, column: str, value: Any) -> "Query":
+        return self._filter("gt", column, value)
+
+    def gte(self, column: str, value: Any) -> "Query":
+        return self._filter("gte", column, value)
+
+    def is_(self, column: str, value: str) -> "Query":
+        return self._filter("is", column, value)
+
+    def in_(self, column: str, values: Sequence[Any]) -> "Query":
+        return self._filter("in", column, list(values))
+
+    def order(self, column: str, *, desc: bool = False) -> "Query":
+        self.ordering.append((self._column(column), desc))
+        return self
+
+    def limit(self, size: int) -> "Query":
+        self.row_limit = size
+        return self
+
+    def execute(self) -> QueryResult:
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = self.database.execute(self)
+            failed = False
+            return result
+        finally:
+            record_db_call(
+                settings.DB_BACKEND,
+                self.table,
+                self.operation,
+                time.perf_counter() - started,
+                failed,
+            )
+
+    # Compilation
+
+    def _column(self, column: str) -> str:
+        if column not in self.columns:
+            raise APIError(
+                {
+                    "code": "42703",
+                    "message": f"column {self.table}.{column} does not exist",
+                }
+            )
+        return column
+
+    def _where(self, dialect: Dialect, params: List[Any]) -> str:
+        clauses = []
+        for operator, column, value, negated in self.filters:
+            column_type = self.columns[column]
+            name = quote(column)
+
+            if operator == "is":
+                keyword = {"null": "NULL", "true": "TRUE", "false": "FALSE"}[
+                    str(value).lower()
+                ]
+                clause = f"{name} IS {'NOT ' if negated else ''}{keyword}"
+            elif operator == "in":
+                adapted = [
+                    dialect.adapt(column_type, to_python(column_type, v)) for v in value
+                ]
+                clause = dialect.in_list(name, adapted, params)
+                if negated:
+                    clause = f"NOT ({clause})"
+            else:
+                params.append(dialect.adapt(column_type, to_python(column_type, value)))
+                comparison = COMPARISONS[operator][negated]
+                clause = f"{name} {comparison} {dialect.placeholder(len(params))}"
+            clauses.append(clause)
+
+        return f" WHERE {' AND '.join(clauses)}" if clauses else ""
+
+    def _returning(self) -> str:
+        if self.selected is None:
+            return "*"
+        return ", ".join(quote(c) for c in self.selected)
+
+    def compile(self, dialect: Dialect) -> List[Tuple[str, List[Any]]]:
+        """
+        Compiles the query into statements and their parameters.
+
+        Inserts of rows with different columns become one statement per set of
+        columns; every other operation is a single statement.
+        """
+        table = quote(self.table)
+        statements = []
+
+        if self.operation == "select":
+            params: List[Any] = []
+            sql = (
+                f"SELECT {self._returning()} FROM {table}{self._where(dialect, params)}"
+            )
+            if self.ordering:
+                sql += " ORDER BY " + ", ".join(
+                    f"{quote(column)}{' DESC' if desc else ''}"
+                    for column, desc in self.ordering
+                )
+            if self.row_limit is not None:
+                params.append(int(self.row_limit))
+                sql += f" LIMIT {dialect.placeholder(len(params))}"
+            statements.append((sql, params))
+
+        elif self.operation == "insert":
+            groups: Dict[Tuple[str, ...], List[dict]] = {}
+            for row in self.values:
+                columns = tuple(self._column(c) for c in row)
+                groups.setdefault(columns, []).append(row)
+
+            for columns, rows in groups.items():
+                params = []
+                tuples = []
+                for row in rows:
+                    placeholders = []
+                    for column in columns:
+                        column_type = self.columns[column]
+                        params.append(
+                            dialect.adapt(
+                                column_type, to_python(column_type, row[column])
+                            )
+                        )
+                        placeholders.append(dialect.placeholder(len(params)))
+                    tuples.append(f"({', '.join(placeholders)})")
+                names = ", ".join(quote(c) for c in columns)
+                statements.append(
+                    (
+                        f"INSERT INTO {table} ({names}) VALUES {', '.join(tuples)} "
+                        f"RETURNING {self._returning()}",
+                        params,
+                    )
+                )
+
+        elif self.operation == "update":
+            params = []
+            assignments = []
+            for column, value in self.values[0].items():
+                column_type = self.columns[self._column(column)]
+                params.append(dialect.adapt(column_type, to_python(column_type, value)))
+                assignments.append(
+                    f"{quote(column)} = {dialect.placeholder(len(params))}"
+                )
+            sql = (
+                f"UPDATE {table} SET {', '.join(assignments)}"
+                f"{self._where(dialect, params)} RETURNING {self._returning()}"
+            )
+            statements.append((sql, params))
+
+        elif self.operation == "delete":
+            params = []
+            sql = f"DELETE FROM {table}{self._where(dialect, params)} RETURNING {self._returning()}"
+            statements.append((sql, params))
+
+        return statements
+
+    def compile_count(self, dialect: Dialect) -> Tuple[str, List[Any]]:
+        """
+        Compiles a statement counting the rows matched by the filters, for
+        select(count="exact").
+        """
+        params: List[Any] = []
+        where = self._where(dialect, params)
+        return f"SELECT count(*) FROM {quote(self.table)}{where}", params
+
+    def convert_rows(self, dialect: Dialect, rows: List[Any]) -> List[dict]:
+        """
+        Converts driver rows to dicts shaped like PostgREST results.
+        """
+        return [
+            {
+                key: dialect.convert(self.columns.get(key, "text"), value)
+                for key, value in dict(row).items()
+            }
+            for row in rows
+        ]
@@ -0,0 +1,357 @@
+import sqlite3
+import threading
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+from postgrest.exceptions import APIError
+from app.config.settings import settings
+from app.db.sql import SCHEMA, Dialect, Query, QueryResult
+from app.utils.auth import get_password_hash, verify_password
+from app.utils.money import minor_units_enabled
+
+# Random version 4 UUID, as gen_random_uuid() would give in Postgres
+UUID_DEFAULT = (
+    "(lower(hex(randomblob(4))) || '-' || lower(hex(randomblob(2))) || '-4' || "
+    "substr(lower(hex(randomblob(2))), 2) || '-' || "
+    "substr('89ab', 1 + (abs(random()) % 4), 1) || "
+    "substr(lower(hex(randomblob(2))), 2) || '-' || lower(hex(randomblob(6))))"
+)
+NOW_DEFAULT = "(strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now'))"
+
+# Constraints of each column, following the data model in the README
+CONSTRAINTS: Dict[str, Dict[str, str]] = {
+    "users": {
+        "id": f"PRIMARY KEY DEFAULT {UUID_DEFAULT}",
+        "email": "NOT NULL UNIQUE",
+        "name": "NOT NULL",
+        "membership_version": "NOT NULL DEFAULT 0",
+    },
+    "revoked_tokens": {
+        "jti": "PRIMARY KEY",
+        "user_id": "NOT NULL REFERENCES users(id) ON DELETE CASCADE",
+        "expires_at": "NOT NULL",
+    },
+    "outbox": {
+        "id": "PRIMARY KEY AUTOINCREMENT",
+        "budget_id": "NOT NULL",
+        "table_name": "NOT NULL",
+        "row_id": "NOT NULL",
+        "operation": "NOT NULL",
+        "attempts": "NOT NULL DEFAULT 0",
+    },
+    "budget_deletions": {
+        "budget_id": "PRIMARY KEY",
+        "user_id": "NOT NULL REFERENCES users(id) ON DELETE CASCADE",
+        "status": "NOT NULL",
+        "claimed_until": "NOT NULL",
+    },
+    "outbox_lease": {
+        "name": "PRIMARY KEY",
+        "holder": "NOT NULL",
+        "expires_at": "NOT NULL",
+    },
+    "budgets": {
+        "user_id": "NOT NULL REFERENCES users(id) ON DELETE CASCADE",
+        "name": "NOT NULL",
+        "is_default": "NOT NULL DEFAULT 0",
+        "currency_exponent": "NOT NULL DEFAULT 2",
+    },
+    "categories": {
+        "budget_id": "NOT NULL REFERENCES budgets(id) ON DELETE CASCADE",
+        "name": "NOT NULL",
+        "allocated": "NOT NULL DEFAULT 0",
+    },
+    "accounts": {
+        "budget_id": "NOT NULL REFERENCES budgets(id) ON DELETE CASCADE",
+        "name": "NOT NULL",
+        "type": "NOT NULL",
+        "balance": "NOT NULL DEFAULT 0",
+    },
+    "transactions": {
+        "budget_id": "NOT NULL REFERENCES budgets(id) ON DELETE CASCADE",
+        "account_id": "NOT NULL REFERENCES accounts(id) ON DELETE CASCADE",
+        "category_id": "REFERENCES categories(id) ON DELETE SET NULL",
+        "date": "NOT NULL",
+        "payee": "NOT NULL",
+        "amount": "NOT NULL",
+        "cleared": "NOT NULL DEFAULT 0",
+    },
+}
+
+INDEXES = (
+    "CREATE INDEX IF NOT EXISTS budgets_user_id ON budgets (user_id)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS budgets_one_default "
+    "ON budgets (user_id) WHERE is_default",
+    "CREATE INDEX IF NOT EXISTS categories_budget_id ON categories (budget_id)",
+    "CREATE INDEX IF NOT EXISTS accounts_budget_id ON accounts (budget_id)",
+    # Also serves lookups on budget_id alone
+    "CREATE INDEX IF NOT EXISTS transactions_budget_id_date "
+    "ON transactions (budget_id, date)",
+    "CREATE INDEX IF NOT EXISTS transactions_account_id ON transactions (account_id)",
+    "CREATE INDEX IF NOT EXISTS transactions_category_id ON transactions (category_id)",
+    "CREATE INDEX IF NOT EXISTS outbox_pending ON outbox (id) WHERE failed_at IS NULL",
+)
+
+# Bump users.membership_version whenever a budget is added or removed
+MEMBERSHIP_TRIGGERS = (
+    "CREATE TRIGGER IF NOT EXISTS budgets_membership_insert "
+    "AFTER INSERT ON budgets FOR EACH ROW BEGIN "
+    "UPDATE users SET membership_version = membership_version + 1 "
+    "WHERE id = NEW.user_id; END",
+    "CREATE TRIGGER IF NOT EXISTS budgets_membership_update "
+    "AFTER UPDATE OF deleted_at ON budgets FOR EACH ROW "
+    "WHEN NEW.deleted_at IS NOT OLD.deleted_at BEGIN "
+    "UPDATE users SET membership_version = membership_version + 1 "
+    "WHERE id = NEW.user_id; END",
+    "CREATE TRIGGER IF NOT EXISTS budgets_membership_delete "
+    "AFTER DELETE ON budgets FOR EACH ROW BEGIN "
+    "UPDATE users SET membership_version = membership_version + 1 "
+    "WHERE id = OLD.user_id; END",
+)
+
+# Record every change to a transaction in the outbox, in the same transaction;
+# only installed while the outbox worker is enabled to consume the rows
+OUTBOX_OPERATIONS = (("insert", "NEW"), ("update", "NEW"), ("delete", "OLD"))
+OUTBOX_TRIGGERS = tuple(
+    f"CREATE TRIGGER IF NOT EXISTS transactions_outbox_{operation} "
+    f"AFTER {operation.upper()} ON transactions FOR EACH ROW BEGIN "
+    f"INSERT INTO outbox (budget_id, table_name, row_id, operation) "
+    f"VALUES ({row}.budget_id, 'transactions', {row}.id, '{operation}'); END"
+    for operation, row in OUTBOX_OPERATIONS
+)
+
+# Local replacement for Supabase Auth
+CREDENTIALS_DDL = """
+CREATE TABLE IF NOT EXISTS credentials (
+    user_id TEXT PRIMARY KEY DEFAULT {uuid},
+    email TEXT NOT NULL UNIQUE,
+    password_hash TEXT NOT NULL
+)
+""".format(uuid=UUID_DEFAULT)
+
+
+def column_type_sql(column_type: str) -> str:
+    if column_type in ("int", "bool"):
+        return "INTEGER"
+    if column_type == "money":
+        # Decimal amounts are stored as text so they stay exact
+        return "INTEGER" if minor_units_enabled() else "TEXT"
+    return "TEXT"
+
+
+def schema_ddl() -> List[str]:
+    """
+    Returns the statements creating the tables, indexes and version triggers.
+    """
+    statements = []
+    for table, columns in SCHEMA.items():
+        constraints = CONSTRAINTS.get(table, {})
+        definitions = []
+        for column, column_type in columns.items():
+            if column == "id":
+                constraint = constraints.get(
+                    column, f"PRIMARY KEY DEFAULT {UUID_DEFAULT}"
+                )
+            elif column == "created_at":
+                constraint = f"NOT NULL DEFAULT {NOW_DEFAULT}"
+            elif column == "version":
+                constraint = "NOT NULL DEFAULT 1"
+            else:
+                constraint = constraints.get(column, "")
+            definitions.append(
+                f'"{column}" {column_type_sql(column_type)} {constraint}'.rstrip()
+            )
+        statements.append(
+            f'CREATE TABLE IF NOT EXISTS "{table}" ({", ".join(definitions)})'
+        )
+
+        if "version" in columns:
+            # Same effect as the bump_version() trigger in Postgres, for updates
+            # that do not set the version themselves
+            statements.append(
+                f"CREATE TRIGGER IF NOT EXISTS {table}_version "
+                f"AFTER UPDATE ON {table} FOR EACH ROW "
+                f"WHEN NEW.version = OLD.version BEGIN "
+                f"UPDATE {table} SET version = OLD.version + 1 WHERE id = NEW.id; "
+                f"END"
+            )
+
+    statements.extend(MEMBERSHIP_TRIGGERS)
+    if settings.OUTBOX_ENABLED:
+        statements.extend(OUTBOX_TRIGGERS)
+    else:
+        statements.extend(
+            f"DROP TRIGGER IF EXISTS transactions_outbox_{operation}"
+            for operation, _ in OUTBOX_OPERATIONS
+        )
+    statements.extend(INDEXES)
+    statements.append(CREDENTIALS_DDL)
+    return statements
+
+
+class SqliteDialect(Dialect):
+    def placeholder(self, index: int) -> str:
+        return "?"
+
+    def in_list(self, column: str, values: List[Any], params: List[Any]) -> str:
+        if not values:
+            return "0 = 1"
+        params.extend(values)
+        return f"{column} IN ({', '.join('?' * len(values))})"
+
+    def adapt(self, column_type: str, value: Any) -> Any:
+        if value is None:
+            return None
+        if column_type == "bool":
+            return int(value)
+        if column_type in ("uuid", "date", "timestamp"):
+            return value.isoformat() if hasattr(value, "isoformat") else str(value)
+        if column_type == "money" and not minor_units_enabled():
+            return str(value)
+        return value
+
+    def convert(self, column_type: str, value: Any) -> Any:
+        if value is None:
+            return None
+        if column_type == "bool":
+            return bool(value)
+        if column_type == "money" and not minor_units_enabled():
+            return Decimal(value)
+        return value
+
+
+DIALECT = SqliteDialect()
+
+# SQLite constraint messages and the Postgres SQLSTATE they correspond to
+CONSTRAINT_CODES = (
+    ("UNIQUE", "23505"),
+    ("FOREIGN KEY", "23503"),
+    ("NOT NULL", "23502"),
+    ("CHECK", "23514"),
+)
+
+
+def _api_error(error: sqlite3.Error) -> APIError:
+    code = "SQLITE"
+    if isinstance(error, sqlite3.IntegrityError):
+        for fragment, sqlstate in CONSTRAINT_CODES:
+            if fragment in str(error):
+                code = sqlstate
+                break
+    return APIError({"code": code, "message": str(error)})
+
+
+class LocalUser:
+    def __init__(self, id: str, email: str):
+        self.id = id
+        self.email = email
+
+
+class LocalAuthResponse:
+    """Response of LocalAuth, with the attributes the auth router reads"""
+
+    def __init__(self, user: Optional[LocalUser]):
+        self.user = user
+
+
+class LocalAuth:
+    """
+    Email and password authentication stored alongside the data, offering the
+    sign_up and sign_in_with_password calls used from Supabase Auth.
+    """
+
+    def __init__(self, database: "SqliteDatabase"):
+        self.database = database
+
+    def sign_up(self, credentials: dict) -> LocalAuthResponse:
+        row = self.database.fetch_one(
+            "INSERT INTO credentials (email, password_hash) VALUES (?, ?) "
+            "RETURNING user_id",
+            (credentials["email"], get_password_hash(credentials["password"])),
+        )
+        return LocalAuthResponse(LocalUser(row["user_id"], credentials["email"]))
+
+    def sign_in_with_password(self, credentials: dict) -> LocalAuthResponse:
+        row = self.database.fetch_one(
+            "SELECT user_id, password_hash FROM credentials WHERE email = ?",
+            (credentials["email"],),
+        )
+        if row is None or not verify_password(
+            credentials["password"], row["password_hash"]
+        ):
+            return LocalAuthResponse(None)
+        return LocalAuthResponse(LocalUser(row["user_id"], credentials["email"]))
+
+
+class SqliteDatabase:
+    """
+    Database stored in a local SQLite file, for single-node deployments and
+    tests. It offers the same query interface as the Supabase client and
+    authenticates users locally, so the API runs without any network access.
+
+    The file is opened in WAL mode with one connection per thread, so reads
+    proceed while a write is in progress. Requires SQLite 3.35+ for RETURNING.
+    """
+
+    def __init__(self, path: str):
+        if path == ":memory:":
+            # Shared between the connections of all threads; lives as long as
+            # the first connection
+            self.path, self.uri = "file:spenny?mode=memory&cache=shared", True
+        else:
+            self.path, self.uri = path, False
+
+        self._local = threading.local()
+        self.auth = LocalAuth(self)
+
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        with connection:
+            for statement in schema_ddl():
+                connection.execute(statement)
+        self._keepalive = connection
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.path, uri=self.uri, timeout=5.0, check_same_thread=False
+            )
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA foreign_keys=ON")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def table(self, name: str) -> Query:
+        return Query(self, name)
+
+    def fetch_one(self, sql: str, params: tuple) -> Optional[sqlite3.Row]:
+        connection = self._connection()
+        try:
+            with connection:
+                return connection.execute(sql, params).fetchone()
+        except sqlite3.Error as e:
+            raise _api_error(e)
+
+    def execute(self, query: Query) -> QueryResult:
+        """
+        Executes a query in a transaction.
+
+        Raises:
+            APIError: If SQLite rejects the query, with the matching SQLSTATE
+            for constraint violations
+        """
+        connection = self._connection()
+        rows = []
+        count = None
+        try:
+            with connection:
+                for sql, params in query.compile(DIALECT):
+                    rows.extend(connection.execute(sql, params).fetchall())
+                if query.count:
+                    sql, params = query.compile_count(DIALECT)
+                    count = connection.execute(sql, params).fetchone()[0]
+        except sqlite3.Error as e:
+            raise _api_error(e)
+
+        return QueryResult(query.convert_rows(DIALECT, rows), count)
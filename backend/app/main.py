@@ -1,12 +1,148 @@
-from fastapi import FastAPI
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import FastAPI, Header, HTTPException, Request, Response, status
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.api.api import api_router
 from app.config.settings import settings
+from app.db import client
+from app.db.outbox import outbox
+from app.db.pool import pool_stats
+from app.db.purge import budget_purger
+from app.db.revocation import revoked_tokens
+from app.db.rls import rls_enabled, user_clients
+from app.db.reads import hedge_stats, request_deadline, start_deadline
+from app.utils.idempotency import idempotent
+from app.utils.metrics import (
+    http_request_db_calls,
+    http_request_duration,
+    registry,
+    route_template,
+)
+from app.utils.profiler import (
+    SamplingProfiler,
+    profile_token_valid,
+    profiles,
+    profiling_requested,
+)
+from app.utils.responses import TimedJSONResponse
+from app.utils.timing import RequestTimings, request_timings
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Background workers
+    budget_purger.start()
+    revoked_tokens.start()
+    outbox.start()
+    yield
+    await outbox.stop()
+    await revoked_tokens.stop()
+    await budget_purger.stop()
+
+
+app = FastAPI(
+    title="Spenny API", lifespan=lifespan, default_response_class=TimedJSONResponse
+)
+
+
+@app.middleware("http")
+async def idempotency_middleware(request: Request, call_next):
+    # Innermost, so replayed responses are still timed and profiled
+    return await idempotent(request, call_next)
+
+
+@app.middleware("http")
+async def request_deadline_middleware(request: Request, call_next):
+    # Bound reads made while handling the request by the caller's time budget
+    token = start_deadline(request.headers.get("X-Request-Timeout"))
+    try:
+        return await call_next(request)
+    finally:
+        request_deadline.reset(token)
+
+
+def _round_trip_budget(method: str, route: str) -> Optional[int]:
+    return settings.ROUND_TRIP_BUDGETS.get(
+        f"{method} {route}", settings.ROUND_TRIP_BUDGET_DEFAULT
+    )
+
+
+@app.middleware("http")
+async def request_timing_middleware(request: Request, call_next):
+    # Set when the request is a sub-request of a batch
+    outer = request_timings.get()
+    timings = RequestTimings()
+    token = request_timings.set(timings)
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    except Exception:
+        if settings.METRICS_ENABLED:
+            http_request_duration.observe(
+                time.perf_counter() - started,
+                request.method,
+                route_template(request),
+                "500",
+            )
+        raise
+    finally:
+        request_timings.reset(token)
+        if outer is not None:
+            outer.add(timings)
+
+    elapsed = time.perf_counter() - started
+    route = route_template(request)
+    response.headers["Server-Timing"] = timings.server_timing(elapsed)
 
-app = FastAPI(title="Spenny API")
+    budget = _round_trip_budget(request.method, route)
+    if budget is not None and timings.db_calls > budget:
+        message = (
+            f"{request.method} {route} made {timings.db_calls} database round "
+            f"trips, over its budget of {budget}"
+        )
+        if settings.ROUND_TRIP_BUDGET_STRICT:
+            response = JSONResponse(
+                status_code=500,
+                content={"detail": message},
+                headers={"Server-Timing": response.headers["Server-Timing"]},
+            )
+        else:
+            logger.warning(message)
 
-# Set up CORS
+    if settings.METRICS_ENABLED:
+        http_request_duration.observe(
+            elapsed, request.method, route, str(response.status_code)
+        )
+        http_request_db_calls.observe(timings.db_calls, request.method, route)
+
+    return response
+
+
+@app.middleware("http")
+async def profiling_middleware(request: Request, call_next):
+    if not profiling_requested(request.headers.get("X-Profile")):
+        return await call_next(request)
+
+    profiler = SamplingProfiler(settings.PROFILE_SAMPLE_INTERVAL_MS / 1000)
+    profiler.start()
+    try:
+        response = await call_next(request)
+    finally:
+        profiler.stop()
+
+    response.headers["X-Profile-Id"] = profiles.add(profiler)
+    return response
+
+
+# Set up CORS; added last so it is outermost and also covers the responses
+# the middlewares above build themselves
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.CORS_ORIGINS,
@@ -21,3 +157,57 @@ app.include_router(api_router, prefix="/api")
 @app.get("/")
 async def root():
     return {"message": "Welcome to Spenny API"}
+
+
+@app.get("/health/pool")
+async def health_pool():
+    """
+    Report the state of the database connection pools.
+    """
+    stats = pool_stats()
+    if settings.DB_BACKEND == "postgres" and client.supabase is not None:
+        stats["postgres"] = client.supabase.stats()
+    if rls_enabled():
+        stats["rls"] = user_clients.stats()
+    return stats
+
+
+@app.get("/health/reads")
+async def health_reads():
+    """
+    Report hedged read counters per table.
+    """
+    return hedge_stats()
+
+
+@app.get("/health/outbox")
+async def health_outbox():
+    """
+    Report how far the derived data maintained from the outbox lags behind.
+    """
+    return outbox.stats()
+
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Report request, database and cache metrics in the Prometheus text format.
+    """
+    return Response(
+        registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.get("/debug/profiles/{profile_id}", response_class=PlainTextResponse)
+async def get_profile(profile_id: str, x_profile: Optional[str] = Header(None)):
+    """
+    Download a request profile as collapsed stacks, for flamegraph.pl or
+    speedscope. Requires PROFILE_TOKEN in X-Profile, so without a token set
+    no profile can be read.
+    """
+    profile = profiles.get(profile_id)
+    if profile is None or not profile_token_valid(x_profile):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found"
+        )
+    return PlainTextResponse(profile)
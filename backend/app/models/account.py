@@ -18,12 +18,14 @@ class AccountRead(AccountBase):
     id: UUID4
     budget_id: UUID4
     created_at: datetime
+    version: int = 1
 
 
 class Account(AccountBase):
     id: UUID4
     budget_id: UUID4
     created_at: datetime
+    version: int = 1
 
     class Config:
         from_attributes = True
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, constr
-from typing import Optional
+from typing import Dict, Optional
 
 
 class UserLogin(BaseModel):
@@ -14,8 +14,25 @@ class UserRegister(UserLogin):
 class Token(BaseModel):
     access_token: str
     token_type: str = "bearer"
+    refresh_token: Optional[str] = None
+
+
+class TokenRefresh(BaseModel):
+    refresh_token: str
+
+
+class TokenLogout(BaseModel):
+    refresh_token: Optional[str] = None
+
+
+class TokenRevoke(BaseModel):
+    token: str
 
 
 class TokenPayload(BaseModel):
     sub: str  # user_id
     exp: int  # expiration timestamp
+    typ: str = "access"  # "access" or "refresh"
+    jti: Optional[str] = None  # token ID, used to revoke it
+    bud: Optional[Dict[str, int]] = None  # owned budget IDs and currency exponents
+    mv: Optional[int] = None  # membership version the budget claims were read at
@@ -0,0 +1,23 @@
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Literal, Optional
+
+
+class BatchItem(BaseModel):
+    method: Literal["GET", "POST", "PUT", "DELETE"]
+    # Path of an API route, with its query string, e.g. "/api/accounts/?budget_id=..."
+    path: str
+    body: Optional[Any] = None
+    # Extra headers such as If-Match; the batch's Authorization is always used
+    headers: Dict[str, str] = Field(default_factory=dict)
+
+
+class BatchRequest(BaseModel):
+    requests: List[BatchItem]
+    # Run the requests in order, skipping the rest after the first failure
+    sequential: bool = False
+
+
+class BatchItemResult(BaseModel):
+    status: int
+    headers: Dict[str, str] = Field(default_factory=dict)
+    body: Optional[Any] = None
@@ -1,6 +1,7 @@
-from pydantic import BaseModel, UUID4
+from pydantic import BaseModel, Field, UUID4
 from datetime import datetime
-from typing import Optional
+from decimal import Decimal
+from typing import Dict, Optional
 
 
 class BudgetBase(BaseModel):
@@ -9,19 +10,48 @@ class BudgetBase(BaseModel):
 
 
 class BudgetCreate(BudgetBase):
-    pass
+    # Decimal places of the budget's currency; fixed once the budget exists
+    currency_exponent: int = Field(2, ge=0, le=4)
+
+
+class BudgetClone(BaseModel):
+    name: str
+    is_default: bool = False
+    include_allocations: bool = False
+    include_balances: bool = False
 
 
 class BudgetRead(BudgetBase):
     id: UUID4
     user_id: UUID4
+    currency_exponent: int = 2
     created_at: datetime
+    version: int = 1
 
 
 class Budget(BudgetBase):
     id: UUID4
     user_id: UUID4
+    currency_exponent: int = 2
     created_at: datetime
+    version: int = 1
 
     class Config:
         from_attributes = True
+
+
+class BudgetSummary(BaseModel):
+    budget_id: UUID4
+    total_balance: Decimal
+    total_allocated: Decimal
+    to_be_budgeted: Decimal
+
+
+class BudgetDeletionStatus(BaseModel):
+    budget_id: UUID4
+    status: str  # pending, running, completed or failed
+    # Rows of each table still to be deleted, while the deletion is unfinished
+    remaining: Optional[Dict[str, int]] = None
+    error: Optional[str] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
@@ -17,12 +17,14 @@ class CategoryRead(CategoryBase):
     id: UUID4
     budget_id: UUID4
     created_at: datetime
+    version: int = 1
 
 
 class Category(CategoryBase):
     id: UUID4
     budget_id: UUID4
     created_at: datetime
+    version: int = 1
 
     class Config:
         from_attributes = True
@@ -24,6 +24,7 @@ class TransactionRead(TransactionBase):
     account_id: UUID4
     category_id: Optional[UUID4] = None
     created_at: datetime
+    version: int = 1
 
 
 class Transaction(TransactionBase):
@@ -32,6 +33,7 @@ class Transaction(TransactionBase):
     account_id: UUID4
     category_id: Optional[UUID4] = None
     created_at: datetime
+    version: int = 1
 
     class Config:
         from_attributes = True
@@ -1,34 +1,92 @@
-from datetime import datetime, timedelta
-from typing import Optional
-from uuid import UUID
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+from uuid import UUID, uuid4
 from jose import JWTError, jwt
-from fastapi import Depends, HTTPException, status
+from passlib.context import CryptContext
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from app.config.settings import settings
-from app.models.auth import TokenPayload
-from app.db.deps import get_supabase
-from supabase import Client
+from app.models.auth import Token, TokenPayload
+from app.db.deps import get_loader
+from app.db.loader import Loader
+from app.db.membership import membership_versions
+from app.db.reads import execute_read
+from app.db.revocation import revoked_tokens
+from app.db.rls import rls_enabled, user_clients
+from app.utils.rate_limit import limit_user
+from app.utils.timing import timed
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
-def create_access_token(subject: str) -> str:
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def get_password_hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def create_access_token(
+    subject: str,
+    budgets: Optional[Dict[str, int]] = None,
+    membership_version: Optional[int] = None,
+) -> str:
     """
     Create a JWT access token.
+
+    Args:
+        subject: ID of the user
+        budgets: The user's budget IDs and their currency exponents, so
+            requests can skip ownership lookups
+        membership_version: The user's membership_version when budgets was read
     """
     expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode = {"exp": expire, "sub": str(subject)}
+    to_encode = {
+        "exp": expire,
+        "sub": str(subject),
+        "typ": "access",
+        "jti": uuid4().hex,
+    }
+    if budgets is not None and membership_version is not None:
+        to_encode["bud"] = budgets
+        to_encode["mv"] = membership_version
     encoded_jwt = jwt.encode(
         to_encode, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM
     )
     return encoded_jwt
 
 
-async def get_current_user(
-    token: str = Depends(oauth2_scheme), db: Client = Depends(get_supabase)
-) -> str:
+def create_refresh_token(subject: str) -> str:
     """
-    Validate the JWT token and return the user ID.
+    Create a JWT refresh token, accepted only by the refresh endpoint.
+    """
+    expire = datetime.utcnow() + timedelta(
+        minutes=settings.REFRESH_TOKEN_EXPIRE_MINUTES
+    )
+    to_encode = {
+        "exp": expire,
+        "sub": str(subject),
+        "typ": "refresh",
+        "jti": uuid4().hex,
+    }
+    return jwt.encode(
+        to_encode, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM
+    )
+
+
+def decode_token(token: str, typ: Optional[str] = "access") -> TokenPayload:
+    """
+    Validate a token and return its payload.
+
+    Args:
+        token: The encoded JWT
+        typ: The token type required ("access" or "refresh"), or None for either
+
+    Raises:
+        HTTPException: 401 if the token is invalid, expired, revoked or of
+        another type
     """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -41,22 +99,130 @@ async def get_current_user(
             token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM]
         )
         token_data = TokenPayload(**payload)
+    except (JWTError, ValueError):
+        raise credentials_exception
 
-        # Verify user exists in database
-        result = db.table("users").select("id").eq("id", token_data.sub).execute()
+    if typ is not None and token_data.typ != typ:
+        raise credentials_exception
+
+    if revoked_tokens.is_revoked(token_data.jti):
+        raise credentials_exception
 
-        if not result.data:
-            raise credentials_exception
+    return token_data
 
-        return token_data.sub
 
-    except JWTError:
-        raise credentials_exception
-    except Exception as e:
+def revoke_token(token_data: TokenPayload) -> bool:
+    """
+    Revoke a token until it expires. Tokens without an ID cannot be revoked.
+
+    Returns:
+        bool: True if this call revoked the token, False if it had no ID or
+        was already revoked
+    """
+    if token_data.jti is None:
+        return False
+    return revoked_tokens.revoke(
+        token_data.jti,
+        token_data.sub,
+        datetime.fromtimestamp(token_data.exp, timezone.utc),
+    )
+
+
+async def issue_tokens(db, user_id: str) -> Token:
+    """
+    Create an access token carrying the user's budgets, and a refresh token.
+
+    The membership version is read before the budgets, so a budget created in
+    between leaves the claims outdated rather than wrong.
+
+    Raises:
+        HTTPException: 401 if the user no longer exists
+    """
+    if rls_enabled():
+        # The request's client is anonymous and would see no rows
+        db = user_clients.get(user_id)
+
+    stamp = membership_versions.stamp(user_id)
+    user = await execute_read(
+        db.table("users").select("id, membership_version").eq("id", user_id)
+    )
+
+    if not user.data:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
         )
 
+    membership_version = user.data[0]["membership_version"]
+    budgets = await execute_read(
+        db.table("budgets")
+        .select("id, currency_exponent")
+        .eq("user_id", user_id)
+        .is_("deleted_at", "null")
+    )
+    membership_versions.set(user_id, membership_version, stamp)
+
+    return Token(
+        access_token=create_access_token(
+            user_id,
+            {budget["id"]: budget["currency_exponent"] for budget in budgets.data},
+            membership_version,
+        ),
+        refresh_token=create_refresh_token(user_id),
+    )
+
+
+async def get_current_user(
+    request: Request,
+    token: str = Depends(oauth2_scheme),
+    loader: Loader = Depends(get_loader),
+) -> str:
+    """
+    Validate the JWT token and return the user ID.
+
+    The request is charged to the user's rate limit bucket before the user is
+    looked up.
+    """
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+    with timed("auth"):
+        try:
+            token_data = decode_token(token)
+            limit_user(request, token_data.sub)
+
+            membership_version = membership_versions.get(token_data.sub)
+
+            if membership_version is None:
+                stamp = membership_versions.stamp(token_data.sub)
+
+                # Verify user exists in database
+                user = await loader.load("users", token_data.sub)
+
+                if user is None:
+                    raise credentials_exception
+
+                membership_version = user.get("membership_version") or 0
+                membership_versions.set(token_data.sub, membership_version, stamp)
+
+            # Budgets listed in the token are current unless a budget was created
+            # or deleted since it was issued
+            if token_data.bud is not None and token_data.mv == membership_version:
+                loader.claims = token_data.bud
+
+            return token_data.sub
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)
+            )
+
 
 def verify_user_access(user_id: UUID, current_user_id: UUID) -> bool:
     """
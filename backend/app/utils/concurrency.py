@@ -0,0 +1,53 @@
+from typing import Optional
+from fastapi import HTTPException, Response, status
+
+
+def parse_if_match(if_match: Optional[str]) -> Optional[int]:
+    """
+    Parse the row version from an If-Match header.
+
+    Accepts strong and weak entity tags ("3", W/"3") as well as a bare number.
+    A missing header or the "*" wildcard means no version was supplied.
+
+    Args:
+        if_match: Raw If-Match header value
+
+    Returns:
+        Optional[int]: The expected row version, or None if not supplied
+
+    Raises:
+        HTTPException: If the header is not a valid version tag
+    """
+    if if_match is None or if_match.strip() == "*":
+        return None
+
+    value = if_match.strip()
+    if value.startswith("W/"):
+        value = value[2:]
+    value = value.strip('"')
+
+    try:
+        return int(value)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="If-Match must contain a version number",
+        )
+
+
+def set_etag(response: Response, version: int) -> None:
+    """
+    Expose a row version as the response ETag.
+    """
+    response.headers["ETag"] = f'"{version}"'
+
+
+def precondition_failed() -> HTTPException:
+    """
+    Error raised when a conditional update matched no row because the
+    version supplied by the client is no longer current.
+    """
+    return HTTPException(
+        status_code=status.HTTP_412_PRECONDITION_FAILED,
+        detail="Resource was modified by another request; fetch it and retry",
+    )
@@ -0,0 +1,180 @@
+import asyncio
+import time
+from typing import AsyncIterator, Callable, Dict, Sequence, Set
+import orjson
+from app.config.settings import settings
+from app.utils.metrics import Counter, Gauge, registry
+
+events_dropped = registry.register(
+    Counter(
+        "spenny_events_dropped_subscribers_total",
+        "Change stream subscribers disconnected for falling behind",
+    )
+)
+
+READY = b"event: ready\ndata: {}\n\n"
+OVERFLOW = b"event: overflow\ndata: {}\n\n"
+DELETED = b'event: closed\ndata: {"reason":"deleted"}\n\n'
+UNAUTHORIZED = b'event: closed\ndata: {"reason":"unauthorized"}\n\n'
+KEEP_ALIVE = b": keep-alive\n\n"
+
+
+class Subscriber:
+    def __init__(self, budget_id: str):
+        self.budget_id = budget_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=settings.EVENTS_BUFFER_SIZE)
+        self.dropped = False
+        self.closed = False
+
+
+class ChangeHub:
+    """
+    In-process fan-out of budget changes to the clients streaming them.
+
+    Write handlers publish the entity, ID and operation of each row they
+    change; every subscriber of the row's budget gets the event in a buffer
+    of EVENTS_BUFFER_SIZE. A subscriber whose buffer is full is dropped
+    rather than slowing down writers or holding events without bound, and its
+    stream ends with an overflow event so the client refetches.
+
+    Only changes made through this process are seen; with several workers a
+    client misses the writes handled by the others.
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[Subscriber]] = {}
+        self._count = 0
+
+    def subscribe(self, budget_id: str) -> Subscriber:
+        subscriber = Subscriber(budget_id)
+        self._subscribers.setdefault(budget_id, set()).add(subscriber)
+        self._count += 1
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        subscribers = self._subscribers.get(subscriber.budget_id)
+        if subscribers is None or subscriber not in subscribers:
+            return
+        subscribers.discard(subscriber)
+        self._count -= 1
+        if not subscribers:
+            del self._subscribers[subscriber.budget_id]
+
+    def publish(
+        self,
+        budget_id: str,
+        entity: str,
+        entity_id: str,
+        operation: str,
+        moved_from: Sequence[str] = (),
+    ) -> None:
+        """
+        Sends a change to the budget's subscribers.
+
+        Args:
+            budget_id: Budget the row belongs to
+            entity: "budget", "category", "account" or "transaction"
+            entity_id: ID of the row
+            operation: "insert", "update" or "delete"
+            moved_from: Budgets the row may have been in before an update;
+            those other than budget_id are sent a delete
+        """
+        self._send(budget_id, entity, entity_id, operation)
+        for previous_budget_id in moved_from:
+            if previous_budget_id != budget_id:
+                self._send(previous_budget_id, entity, entity_id, "delete")
+
+    def _send(self, budget_id: str, entity: str, entity_id: str, operation: str):
+        subscribers = self._subscribers.get(budget_id)
+        if not subscribers:
+            return
+
+        # Encoded once for every subscriber
+        data = orjson.dumps(
+            {"entity": entity, "id": str(entity_id), "operation": operation}
+        )
+        message = b"event: change\ndata: " + data + b"\n\n"
+        for subscriber in list(subscribers):
+            try:
+                subscriber.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                subscriber.dropped = True
+                self.unsubscribe(subscriber)
+                events_dropped.inc()
+
+    def close(self, budget_id: str) -> None:
+        """
+        Ends the streams of a deleted budget.
+        """
+        for subscriber in list(self._subscribers.get(budget_id, ())):
+            subscriber.closed = True
+            self.unsubscribe(subscriber)
+            try:
+                # Wakes the stream if it is waiting for a change
+                subscriber.queue.put_nowait(None)
+            except asyncio.QueueFull:
+                pass
+
+    def __len__(self) -> int:
+        return self._count
+
+
+changes = ChangeHub()
+
+registry.register(
+    Gauge(
+        "spenny_events_subscribers",
+        "Clients streaming budget changes",
+        lambda: {(): len(changes)},
+    )
+)
+
+
+async def stream_changes(
+    budget_id: str, authorized: Callable[[], bool]
+) -> AsyncIterator[bytes]:
+    """
+    Yields a budget's changes as server-sent events, starting with a ready
+    event once subscribed and sending a comment every
+    EVENTS_HEARTBEAT_SECONDS to keep idle connections open.
+
+    At every heartbeat authorized() is called, and the stream ends with a
+    closed event once it returns False, e.g. because the client's token has
+    expired or been revoked. The stream also ends when the budget is deleted.
+    """
+    subscriber = changes.subscribe(budget_id)
+    next_heartbeat = time.monotonic() + settings.EVENTS_HEARTBEAT_SECONDS
+    try:
+        yield READY
+        while True:
+            if subscriber.dropped:
+                yield OVERFLOW
+                return
+            if subscriber.closed:
+                # Send the changes still buffered, the budget's delete included
+                while not subscriber.queue.empty():
+                    message = subscriber.queue.get_nowait()
+                    if message is not None:
+                        yield message
+                yield DELETED
+                return
+
+            if time.monotonic() >= next_heartbeat:
+                if not authorized():
+                    yield UNAUTHORIZED
+                    return
+                next_heartbeat = time.monotonic() + settings.EVENTS_HEARTBEAT_SECONDS
+                yield KEEP_ALIVE
+
+            message = None
+            try:
+                message = await asyncio.wait_for(
+                    subscriber.queue.get(), next_heartbeat - time.monotonic()
+                )
+            except asyncio.TimeoutError:
+                pass
+            # None only wakes a closed stream
+            if message is not None:
+                yield message
+    finally:
+        changes.unsubscribe(subscriber)
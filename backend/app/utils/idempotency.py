@@ -0,0 +1,173 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import JSONResponse
+from app.config.settings import settings
+from app.utils.auth import decode_token
+from app.utils.metrics import record_cache
+
+# Responses that are not stored, so a retry runs the request again
+RETRYABLE_STATUSES = (408, 425, 429)
+MAX_KEY_LENGTH = 255
+
+
+class StoredResponse:
+    def __init__(self, status_code: int, headers: list, body: bytes):
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+
+    def replay(self) -> Response:
+        response = Response(content=self.body, status_code=self.status_code)
+        response.raw_headers = list(self.headers)
+        response.headers["Idempotent-Replayed"] = "true"
+        return response
+
+
+class IdempotencyEntry:
+    """
+    A request made with an Idempotency-Key: in progress until its future is
+    resolved with the stored response, or with None if it was not stored.
+    """
+
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.expires_at = time.monotonic() + settings.IDEMPOTENCY_TTL_SECONDS
+
+
+class IdempotencyStore:
+    """
+    Per-process store of the responses to requests sent with an
+    Idempotency-Key, kept for IDEMPOTENCY_TTL_SECONDS.
+
+    Keys are scoped to the user and route, and remember a fingerprint of the
+    request body, so a key reused for a different request is rejected rather
+    than answered with an unrelated response. At most IDEMPOTENCY_MAX_ENTRIES
+    keys are kept, least recently used evicted first.
+    """
+
+    def __init__(self):
+        self._entries: "OrderedDict[Tuple[str, ...], IdempotencyEntry]" = OrderedDict()
+
+    def get(self, key: Tuple[str, ...]) -> Optional[IdempotencyEntry]:
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at <= time.monotonic():
+            del self._entries[key]
+            entry = None
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def begin(self, key: Tuple[str, ...], fingerprint: str) -> IdempotencyEntry:
+        entry = self._entries[key] = IdempotencyEntry(fingerprint)
+        self._entries.move_to_end(key)
+        while len(self._entries) > settings.IDEMPOTENCY_MAX_ENTRIES:
+            _, evicted = self._entries.popitem(last=False)
+            if not evicted.future.done():
+                evicted.future.set_result(None)
+        return entry
+
+    def finish(
+        self,
+        key: Tuple[str, ...],
+        entry: IdempotencyEntry,
+        response: Optional[StoredResponse],
+    ) -> None:
+        """
+        Resolves the entry, dropping it if the response was not stored so the
+        next attempt runs the request again.
+        """
+        if response is None and self._entries.get(key) is entry:
+            del self._entries[key]
+        if not entry.future.done():
+            entry.future.set_result(response)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+idempotency_store = IdempotencyStore()
+
+
+def _request_user_id(request: Request) -> Optional[str]:
+    authorization = request.headers.get("Authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return decode_token(token).sub
+    except HTTPException:
+        return None
+
+
+def _error(detail: str, status_code: int = 409) -> JSONResponse:
+    return JSONResponse(status_code=status_code, content={"detail": detail})
+
+
+async def idempotent(request: Request, call_next) -> Response:
+    """
+    Runs a POST request carrying an Idempotency-Key at most once per user and
+    key. A repeat gets the stored response without reaching the handler,
+    waiting for the first request if it is still in progress. Requests
+    without a valid access token are passed through, to fail authentication
+    as usual.
+    """
+    idempotency_key = request.headers.get("Idempotency-Key")
+    if request.method != "POST" or not idempotency_key:
+        return await call_next(request)
+    user_id = _request_user_id(request)
+    if user_id is None:
+        return await call_next(request)
+    if len(idempotency_key) > MAX_KEY_LENGTH:
+        return _error(
+            f"Idempotency-Key must be at most {MAX_KEY_LENGTH} characters", 400
+        )
+
+    key = (user_id, request.url.path, idempotency_key)
+    body = await request.body()
+    fingerprint = hashlib.sha256(body).hexdigest()
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+
+    while True:
+        entry = idempotency_store.get(key)
+        if entry is None:
+            break
+        if entry.fingerprint != fingerprint:
+            return _error(
+                "Idempotency-Key was already used for a different request", 422
+            )
+        if entry.future.done() and entry.future.result() is not None:
+            record_cache("idempotency", True)
+            return entry.future.result().replay()
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return _error("A request with this Idempotency-Key is in progress")
+        try:
+            # The first request's outcome; None if it was not stored
+            await asyncio.wait_for(asyncio.shield(entry.future), remaining)
+        except asyncio.TimeoutError:
+            return _error("A request with this Idempotency-Key is in progress")
+
+    record_cache("idempotency", False)
+    entry = idempotency_store.begin(key, fingerprint)
+    stored = None
+    try:
+        response = await call_next(request)
+        if response.status_code >= 500 or response.status_code in RETRYABLE_STATUSES:
+            return response
+
+        content = b"".join([chunk async for chunk in response.body_iterator])
+        replayable = Response(content=content, status_code=response.status_code)
+        replayable.raw_headers = list(response.raw_headers)
+        if len(content) <= settings.IDEMPOTENCY_MAX_BODY_BYTES:
+            stored = StoredResponse(
+                response.status_code, list(response.raw_headers), content
+            )
+        return replayable
+    finally:
+        idempotency_store.finish(key, entry, stored)
@@ -0,0 +1,242 @@
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+from starlette.requests import Request
+from app.utils.timing import request_timings
+
+# Latency buckets in seconds, from a cache hit to a stalled query
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    Monotonic count per combination of label values.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = list(self._values.items())
+        for label_values, value in values:
+            yield f"{self.name}{_labels(self.labels, label_values)} {_number(value)}"
+
+
+class Histogram:
+    """
+    Distribution of observations per combination of label values, in fixed
+    cumulative buckets.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # Per label values: count per bucket (the last for +Inf), and the sum
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = (
+                    [0] * (len(self.buckets) + 1),
+                    [0.0],
+                )
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = [
+                (label_values, list(counts), total[0])
+                for label_values, (counts, total) in self._values.items()
+            ]
+        for label_values, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (None,), counts):
+                cumulative += count
+                le = "+Inf" if bound is None else _number(float(bound))
+                labels = _labels(self.labels, label_values, f'le="{le}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _labels(self.labels, label_values)
+            yield f"{self.name}_sum{labels} {_number(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Gauge:
+    """
+    Value read when metrics are collected.
+    """
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        collect: Callable[[], Dict[Tuple[str, ...], float]],
+        labels: Sequence[str] = (),
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.collect = collect
+
+    def samples(self) -> Iterable[str]:
+        for label_values, value in self.collect().items():
+            yield f"{self.name}{_labels(self.labels, label_values)} {_number(value)}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """
+        Returns every metric in the Prometheus text exposition format.
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_duration = registry.register(
+    Histogram(
+        "spenny_http_request_duration_seconds",
+        "Time to handle a request, by route template and status",
+        ("method", "route", "status"),
+    )
+)
+http_request_db_calls = registry.register(
+    Histogram(
+        "spenny_http_request_db_calls",
+        "Database calls made while handling a request",
+        ("method", "route"),
+        buckets=COUNT_BUCKETS,
+    )
+)
+db_query_duration = registry.register(
+    Histogram(
+        "spenny_db_query_duration_seconds",
+        "Time of a database call, by table and operation",
+        ("backend", "table", "operation"),
+    )
+)
+db_query_errors = registry.register(
+    Counter(
+        "spenny_db_query_errors_total",
+        "Database calls that failed, by table and operation",
+        ("backend", "table", "operation"),
+    )
+)
+cache_requests = registry.register(
+    Counter(
+        "spenny_cache_requests_total",
+        "Cache lookups by cache and result (hit or miss)",
+        ("cache", "result"),
+    )
+)
+
+rate_limited = registry.register(
+    Counter(
+        "spenny_rate_limited_total",
+        "Requests rejected with 429, by limiter (user or ip)",
+        ("limiter",),
+    )
+)
+
+
+def route_template(request: Request) -> str:
+    """
+    Returns the request path with path parameters replaced by their names, so
+    IDs in paths do not create new metric series.
+    """
+    if request.scope.get("route") is None:
+        return "unmatched"
+    names = {str(value): name for name, value in request.path_params.items()}
+    return "/".join(
+        "{" + names[segment] + "}" if segment in names else segment
+        for segment in request.url.path.split("/")
+    )
+
+
+def record_db_call(
+    backend: str, table: str, operation: str, seconds: float, failed: bool
+) -> None:
+    """
+    Records a database call, and counts it against the current request.
+    """
+    db_query_duration.observe(seconds, backend, table, operation)
+    if failed:
+        db_query_errors.inc(backend, table, operation)
+
+    timings = request_timings.get()
+    if timings is not None:
+        timings.db_calls += 1
+        timings.db_seconds += seconds
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    cache_requests.inc(cache, "hit" if hit else "miss")
@@ -0,0 +1,112 @@
+from decimal import Decimal
+from typing import Any, Dict, List, Sequence, Union
+from fastapi import HTTPException, status
+from app.config.settings import settings
+
+# Number of decimal places of a budget's currency, e.g. 2 for cents
+DEFAULT_CURRENCY_EXPONENT = 2
+
+
+def minor_units_enabled() -> bool:
+    """
+    Whether amounts are stored as integer minor units instead of NUMERIC.
+    """
+    return settings.MONEY_STORAGE == "minor_units"
+
+
+def to_minor(amount: Decimal, exponent: int) -> int:
+    """
+    Convert a decimal amount to integer minor units.
+
+    Args:
+        amount: Amount in major units, e.g. Decimal("12.34")
+        exponent: Decimal places of the currency
+
+    Returns:
+        int: Amount in minor units, e.g. 1234
+
+    Raises:
+        ValueError: If the amount has more decimal places than the currency
+    """
+    scaled = Decimal(amount).scaleb(exponent)
+    if scaled != scaled.to_integral_value():
+        raise ValueError(f"Amount {amount} has more than {exponent} decimal places")
+    return int(scaled)
+
+
+def from_minor(units: int, exponent: int) -> Decimal:
+    """
+    Convert integer minor units to a decimal amount with the currency's scale.
+    """
+    return Decimal(int(units)).scaleb(-exponent)
+
+
+def encode_amount(amount: Decimal, exponent: int) -> Union[int, str]:
+    """
+    Convert an amount received by the API into its stored representation.
+
+    Args:
+        amount: Validated amount from a request model
+        exponent: Decimal places of the budget's currency
+
+    Returns:
+        Union[int, str]: Minor units, or the decimal string for NUMERIC storage
+
+    Raises:
+        HTTPException: If the amount is more precise than the currency allows
+    """
+    if not minor_units_enabled():
+        return str(amount)
+
+    try:
+        return to_minor(amount, exponent)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+def stored_to_minor(value: Any, exponent: int) -> int:
+    """
+    Convert a stored amount of either representation to minor units.
+    """
+    if minor_units_enabled():
+        return int(value)
+    # NUMERIC columns already round to their own scale
+    amount = Decimal(str(value)).quantize(Decimal(1).scaleb(-exponent))
+    return to_minor(amount, exponent)
+
+
+def decode_row(row: dict, fields: Sequence[str], exponent: int) -> dict:
+    """
+    Convert the stored amounts of a row back to decimals, in place.
+
+    Rows stored as NUMERIC are left untouched.
+    """
+    if minor_units_enabled():
+        for field in fields:
+            if row.get(field) is not None:
+                row[field] = from_minor(row[field], exponent)
+    return row
+
+
+def decode_rows(
+    rows: List[dict], fields: Sequence[str], exponents: Dict[str, int]
+) -> List[dict]:
+    """
+    Convert the stored amounts of rows from several budgets back to decimals.
+
+    Args:
+        rows: Rows with a budget_id column
+        fields: Amount columns to convert
+        exponents: Currency exponent of each budget, keyed by budget ID
+
+    Returns:
+        List[dict]: The same rows, converted in place
+    """
+    if minor_units_enabled():
+        for row in rows:
+            decode_row(
+                row,
+                fields,
+                exponents.get(row["budget_id"], DEFAULT_CURRENCY_EXPONENT),
+            )
+    return rows
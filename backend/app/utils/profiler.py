@@ -0,0 +1,124 @@
+import hmac
+import os
+import sys
+import threading
+import uuid
+from collections import Counter, OrderedDict
+from typing import Optional, Tuple
+from app.config.settings import settings
+
+# Stacks without a frame from this package (idle workers, the event loop
+# waiting for I/O) are left out of profiles
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def profiling_requested(header: Optional[str]) -> bool:
+    """
+    Whether the request should be profiled, given its X-Profile header.
+    """
+    # Profiles can only be downloaded with the token, so none are kept without it
+    if settings.PROFILE_ALL_REQUESTS and settings.PROFILE_TOKEN:
+        return True
+    return profile_token_valid(header)
+
+
+def profile_token_valid(token: Optional[str]) -> bool:
+    if not token or not settings.PROFILE_TOKEN:
+        return False
+    return hmac.compare_digest(token, settings.PROFILE_TOKEN)
+
+
+def _frame_name(code) -> str:
+    path = os.path.splitext(code.co_filename)[0]
+    if path.startswith(APP_ROOT):
+        module = "app" + path[len(APP_ROOT) :].replace(os.sep, ".")
+    else:
+        # Package and module, e.g. starlette.routing
+        module = ".".join(path.split(os.sep)[-2:])
+    return f"{module}:{code.co_name}"
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of every thread at a fixed interval from a background
+    thread while a request is handled.
+
+    Requests run on the event loop thread and in executor threads, which other
+    requests share, so concurrent requests also show up in the samples.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples: "Counter[Tuple[str, ...]]" = Counter()
+        self.sample_count = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="request-profiler", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            self.sample_count += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+
+                stack = []
+                in_app = False
+                while frame is not None:
+                    code = frame.f_code
+                    in_app = in_app or code.co_filename.startswith(APP_ROOT)
+                    stack.append(_frame_name(code))
+                    frame = frame.f_back
+                if not in_app:
+                    continue
+
+                if thread_id not in names:
+                    names[thread_id] = next(
+                        (t.name for t in threading.enumerate() if t.ident == thread_id),
+                        str(thread_id),
+                    )
+                stack.append(names[thread_id])
+                self.samples[tuple(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        """
+        Returns the samples as collapsed stacks ("root;caller;callee count"),
+        the input format of flamegraph.pl and speedscope.
+        """
+        return "".join(
+            f"{';'.join(stack)} {count}\n" for stack, count in self.samples.items()
+        )
+
+
+class ProfileStore:
+    """
+    The most recent request profiles, kept in memory for download.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._profiles: "OrderedDict[str, str]" = OrderedDict()
+
+    def add(self, profiler: SamplingProfiler) -> str:
+        profile_id = uuid.uuid4().hex
+        with self._lock:
+            self._profiles[profile_id] = profiler.collapsed()
+            while len(self._profiles) > settings.PROFILE_STORE_SIZE:
+                self._profiles.popitem(last=False)
+        return profile_id
+
+    def get(self, profile_id: str) -> Optional[str]:
+        return self._profiles.get(profile_id)
+
+
+profiles = ProfileStore()
@@ -0,0 +1,146 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+from fastapi import HTTPException, Request, status
+from app.config.settings import settings
+from app.utils.metrics import rate_limited, route_template
+
+
+class TokenBuckets:
+    """
+    Per-process token buckets, one per key (a user or a client address).
+
+    A bucket holds up to capacity tokens and refills at refill_rate tokens per
+    second; a request spends its route's cost. A bucket idle long enough to
+    have refilled completely is no different from a new one, so such buckets
+    are evicted, and the least recently used go first beyond
+    RATE_LIMIT_MAX_BUCKETS.
+
+    Args:
+        name: Label of the limiter in metrics ("user" or "ip")
+        limits: Returns the current (capacity, refill_rate) from settings
+    """
+
+    def __init__(self, name: str, limits: Callable[[], Tuple[float, float]]):
+        self.name = name
+        self.limits = limits
+        self._lock = threading.Lock()
+        # Key to (tokens, time of last update), least recently used first
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def take(self, key: str, cost: float = 1.0) -> float:
+        """
+        Spends cost tokens from the key's bucket if it holds enough.
+
+        Returns:
+            float: 0 if the tokens were spent, otherwise the seconds until the
+            bucket will hold enough
+        """
+        capacity, refill_rate = self.limits()
+        # A cost over capacity could never be paid
+        cost = min(cost, capacity)
+        now = time.monotonic()
+
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * refill_rate)
+
+            if tokens >= cost:
+                tokens -= cost
+                wait = 0.0
+            else:
+                wait = (cost - tokens) / refill_rate
+
+            self._buckets[key] = (tokens, now)
+            self._evict(now, capacity / refill_rate)
+        return wait
+
+    def _evict(self, now: float, refill_seconds: float) -> None:
+        while self._buckets:
+            key, (_, updated) = next(iter(self._buckets.items()))
+            if (
+                len(self._buckets) <= settings.RATE_LIMIT_MAX_BUCKETS
+                and now - updated < refill_seconds
+            ):
+                break
+            del self._buckets[key]
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+user_buckets = TokenBuckets(
+    "user", lambda: (settings.RATE_LIMIT_USER_CAPACITY, settings.RATE_LIMIT_USER_RATE)
+)
+client_buckets = TokenBuckets(
+    "ip", lambda: (settings.RATE_LIMIT_IP_CAPACITY, settings.RATE_LIMIT_IP_RATE)
+)
+
+
+def route_cost(request: Request) -> float:
+    """
+    Returns the tokens a request spends, by "METHOD /route/template".
+    """
+    return settings.RATE_LIMIT_COSTS.get(
+        f"{request.method} {route_template(request)}", 1.0
+    )
+
+
+def _limit(buckets: TokenBuckets, key: str, request: Request) -> None:
+    wait = buckets.take(key, route_cost(request))
+    if wait > 0:
+        rate_limited.inc(buckets.name)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests",
+            headers={"Retry-After": str(math.ceil(wait))},
+        )
+
+
+def client_address(request: Request) -> Optional[str]:
+    """
+    Returns the client's IP address, taken from X-Forwarded-For when the API
+    runs behind RATE_LIMIT_TRUSTED_PROXIES proxies.
+
+    Each proxy appends the address it received the request from, so only the
+    last entries were written by trusted proxies; anything to their left was
+    sent by the client and is ignored.
+    """
+    hops = settings.RATE_LIMIT_TRUSTED_PROXIES
+    if hops > 0:
+        forwarded = [
+            address.strip()
+            for header in request.headers.getlist("X-Forwarded-For")
+            for address in header.split(",")
+            if address.strip()
+        ]
+        if len(forwarded) >= hops:
+            return forwarded[-hops]
+    return request.client.host if request.client else None
+
+
+def limit_user(request: Request, user_id: str) -> None:
+    """
+    Charges a request to the user's bucket.
+
+    Raises:
+        HTTPException: 429 with Retry-After if the bucket is empty
+    """
+    if settings.RATE_LIMIT_ENABLED:
+        _limit(user_buckets, user_id, request)
+
+
+def limit_client(request: Request) -> None:
+    """
+    FastAPI dependency charging a request to the client address's bucket, for
+    routes used before a user is known.
+
+    Raises:
+        HTTPException: 429 with Retry-After if the bucket is empty
+    """
+    if settings.RATE_LIMIT_ENABLED:
+        address = client_address(request)
+        if address is not None:
+            _limit(client_buckets, address, request)
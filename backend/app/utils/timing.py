@@ -0,0 +1,69 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+
+class RequestTimings:
+    """
+    Time spent in each phase of handling a request, reported in the
+    Server-Timing header. Phases may overlap, e.g. auth includes the query
+    loading the user.
+    """
+
+    __slots__ = ("db_calls", "db_seconds", "auth_seconds", "serialize_seconds")
+
+    def __init__(self):
+        self.db_calls = 0
+        self.db_seconds = 0.0
+        self.auth_seconds = 0.0
+        self.serialize_seconds = 0.0
+
+    def add(self, other: "RequestTimings") -> None:
+        """
+        Adds the timings of a request handled within this one, e.g. a batch
+        sub-request.
+        """
+        self.db_calls += other.db_calls
+        self.db_seconds += other.db_seconds
+        self.auth_seconds += other.auth_seconds
+        self.serialize_seconds += other.serialize_seconds
+
+    def server_timing(self, total_seconds: float) -> str:
+        """
+        Returns the value of the Server-Timing header, durations in milliseconds.
+        """
+        return ", ".join(
+            (
+                f'db;dur={self.db_seconds * 1000:.1f};desc="{self.db_calls} round trips"',
+                f"auth;dur={self.auth_seconds * 1000:.1f}",
+                f"ser;dur={self.serialize_seconds * 1000:.1f}",
+                f"total;dur={total_seconds * 1000:.1f}",
+            )
+        )
+
+
+# Timings of the request being handled, if any
+request_timings: ContextVar[Optional[RequestTimings]] = ContextVar(
+    "request_timings", default=None
+)
+
+
+@contextmanager
+def timed(phase: str) -> Iterator[None]:
+    """
+    Adds the time spent in the block to a phase ("auth" or "serialize") of the
+    current request's timings.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = request_timings.get()
+        if timings is not None:
+            attribute = f"{phase}_seconds"
+            setattr(
+                timings,
+                attribute,
+                getattr(timings, attribute) + time.perf_counter() - started,
+            )
@@ -0,0 +1,812 @@
+"""
+Throughput, latency and database round trips of every API route.
+
+Seeds a SQLite file with users, budgets, categories, accounts and
+transactions, serves it with benchmarks.standin in a separate process (so
+the stand-in does not compete with the app for the GIL), and drives the app
+in-process against it. Each route gets --requests requests, --concurrency at
+a time; the round trips of each request are read from its Server-Timing
+header. Results are printed as JSON, or written to --output, and --compare
+prints the change from an earlier run.
+
+Seeding the large scale takes a few minutes; pass --db to keep the file and
+reuse it on the next run.
+
+Usage:
+    python -m benchmarks.routes [--scale small|large] [--requests 200]
+        [--concurrency 10] [--latency-ms 5] [--jitter-ms 2] [--db bench.db]
+        [--routes budgets] [--output results.json] [--compare baseline.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from statistics import mean
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+from jose import jwt
+
+from app.config.settings import settings
+from app.db.sqlite import SqliteDatabase
+from app.utils.auth import (
+    create_access_token,
+    create_refresh_token,
+    get_password_hash,
+)
+from app.utils.money import minor_units_enabled
+
+# Rows seeded per user, budget or budget, at each scale
+SCALES = {
+    "small": {
+        "users": 50,
+        "budgets": 2,
+        "categories": 10,
+        "accounts": 3,
+        "transactions": 200,
+    },
+    # About two million transactions across three thousand budgets
+    "large": {
+        "users": 1000,
+        "budgets": 3,
+        "categories": 12,
+        "accounts": 4,
+        "transactions": 700,
+    },
+}
+PASSWORD = "benchmark-password"
+ACCOUNT_TYPES = ("checking", "savings", "credit")
+# Transaction IDs kept per budget for the routes that address one
+SAMPLED_TRANSACTIONS = 20
+ROUND_TRIPS = re.compile(r'desc="(\d+) round trips"')
+
+# A request: method, path, JSON body and headers
+Request = Tuple[str, str, Optional[dict], Dict[str, str]]
+
+
+def _id() -> str:
+    return str(uuid.uuid4())
+
+
+def _money(minor: int) -> Any:
+    # As the stand-in's SQLite dialect stores amounts, at two decimal places
+    if minor_units_enabled():
+        return minor
+    return str(Decimal(minor).scaleb(-2))
+
+
+def _timestamp() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def seed(path: str, scale: Dict[str, int], rng: random.Random) -> None:
+    """
+    Fill an empty database with users and their budgets.
+
+    Rows are written with executemany on a plain SQLite connection; going
+    through the API would take hours at the large scale.
+    """
+    SqliteDatabase(path)  # creates the tables, triggers and indexes
+    connection = sqlite3.connect(path)
+    password_hash = get_password_hash(PASSWORD)
+    start = date(2024, 1, 1)
+    now = _timestamp()
+
+    with connection:
+        for n in range(scale["users"]):
+            user_id = _id()
+            email = f"user{n}@bench.spenny"
+            connection.execute(
+                "INSERT INTO users (id, email, name, created_at) VALUES (?, ?, ?, ?)",
+                (user_id, email, f"User {n}", now),
+            )
+            connection.execute(
+                "INSERT INTO credentials (user_id, email, password_hash) "
+                "VALUES (?, ?, ?)",
+                (user_id, email, password_hash),
+            )
+
+            for b in range(scale["budgets"]):
+                budget_id = _id()
+                connection.execute(
+                    "INSERT INTO budgets (id, user_id, name, is_default, created_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (budget_id, user_id, f"Budget {b}", int(b == 0), now),
+                )
+
+                categories = [_id() for _ in range(scale["categories"])]
+                connection.executemany(
+                    "INSERT INTO categories (id, budget_id, name, allocated, "
+                    "created_at) VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (category_id, budget_id, f"Category {c}", _money(c * 5000), now)
+                        for c, category_id in enumerate(categories)
+                    ],
+                )
+
+                accounts = [_id() for _ in range(scale["accounts"])]
+                connection.executemany(
+                    "INSERT INTO accounts (id, budget_id, name, type, balance, "
+                    "created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (
+                            account_id,
+                            budget_id,
+                            f"Account {a}",
+                            ACCOUNT_TYPES[a % len(ACCOUNT_TYPES)],
+                            _money(rng.randint(0, 1_000_000)),
+                            now,
+                        )
+                        for a, account_id in enumerate(accounts)
+                    ],
+                )
+
+                connection.executemany(
+                    "INSERT INTO transactions (id, budget_id, account_id, "
+                    "category_id, date, payee, amount, note, cleared, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (
+                            _id(),
+                            budget_id,
+                            rng.choice(accounts),
+                            rng.choice(categories) if t % 5 else None,
+                            (start + timedelta(days=t % 365)).isoformat(),
+                            f"Payee {rng.randrange(250)}",
+                            _money(-rng.randint(100, 50_000)),
+                            "Weekly shop" if t % 3 == 0 else None,
+                            t % 2,
+                            now,
+                        )
+                        for t in range(scale["transactions"])
+                    ],
+                )
+
+        # Seeded rows are not changes for the outbox worker to replay
+        connection.execute("DELETE FROM outbox")
+    connection.close()
+
+
+class Bench:
+    """
+    The seeded data and helpers the route scenarios draw on.
+
+    Setup writes (rows for delete routes to remove) go straight to the
+    database and are not timed.
+    """
+
+    def __init__(self, path: str, rng: random.Random):
+        self.connection = sqlite3.connect(path, timeout=30.0)
+        self.connection.row_factory = sqlite3.Row
+        self.rng = rng
+        self.users = [
+            dict(row) for row in self.connection.execute("SELECT id, email FROM users")
+        ]
+        self.budgets: Dict[str, List[dict]] = {}
+        for row in self.connection.execute(
+            "SELECT id, user_id FROM budgets WHERE deleted_at IS NULL"
+        ):
+            self.budgets.setdefault(row["user_id"], []).append(
+                {
+                    "id": row["id"],
+                    "categories": self._ids("categories", row["id"]),
+                    "accounts": self._ids("accounts", row["id"]),
+                    "transactions": self._ids(
+                        "transactions", row["id"], SAMPLED_TRANSACTIONS
+                    ),
+                }
+            )
+        self.users = [user for user in self.users if user["id"] in self.budgets]
+        self._tokens: Dict[str, str] = {}
+
+    def _ids(self, table: str, budget_id: str, limit: int = -1) -> List[str]:
+        return [
+            row[0]
+            for row in self.connection.execute(
+                f"SELECT id FROM {table} WHERE budget_id = ? LIMIT ?",
+                (budget_id, limit),
+            )
+        ]
+
+    def pick(self) -> Tuple[dict, dict]:
+        """
+        Returns a random user and one of their budgets.
+        """
+        user = self.rng.choice(self.users)
+        return user, self.rng.choice(self.budgets[user["id"]])
+
+    def reset_tokens(self) -> None:
+        # Routes change budgets, so claims are re-read before each route
+        self._tokens.clear()
+
+    def token(self, user_id: str) -> str:
+        """
+        Returns an access token like login would issue, with current claims.
+        """
+        token = self._tokens.get(user_id)
+        if token is None:
+            version = self.connection.execute(
+                "SELECT membership_version FROM users WHERE id = ?", (user_id,)
+            ).fetchone()[0]
+            claims = {
+                row[0]: row[1]
+                for row in self.connection.execute(
+                    "SELECT id, currency_exponent FROM budgets "
+                    "WHERE user_id = ? AND deleted_at IS NULL",
+                    (user_id,),
+                )
+            }
+            token = self._tokens[user_id] = create_access_token(
+                user_id, claims, version
+            )
+        return token
+
+    def auth(self, user_id: str) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.token(user_id)}"}
+
+    def insert(self, table: str, **values: Any) -> str:
+        values = {"id": _id(), "created_at": _timestamp(), **values}
+        with self.connection:
+            self.connection.execute(
+                f"INSERT INTO {table} ({', '.join(values)}) "
+                f"VALUES ({', '.join('?' * len(values))})",
+                tuple(values.values()),
+            )
+        return values["id"]
+
+    def fresh_budget(self, user_id: str, deleted: bool = False) -> str:
+        """
+        Adds a budget with a few categories and accounts outside the seed.
+        """
+        budget_id = self.insert(
+            "budgets",
+            user_id=user_id,
+            name="Scratch",
+            deleted_at=_timestamp() if deleted else None,
+        )
+        for n in range(3):
+            self.insert("categories", budget_id=budget_id, name=f"Category {n}")
+            self.insert(
+                "accounts", budget_id=budget_id, name=f"Account {n}", type="checking"
+            )
+        return budget_id
+
+
+def _transaction(budget: dict, rng: random.Random) -> dict:
+    return {
+        "budget_id": budget["id"],
+        "account_id": rng.choice(budget["accounts"]),
+        "category_id": rng.choice(budget["categories"]),
+        "date": date(2024, 6, 1).isoformat(),
+        "payee": "Benchmark",
+        "amount": "-12.34",
+        "cleared": False,
+    }
+
+
+# Scenarios build one request per call; keyed by route template
+def _register(bench: Bench) -> Request:
+    email = f"new-{uuid.uuid4().hex}@bench.spenny"
+    body = {"email": email, "password": PASSWORD, "name": "New user"}
+    return "POST", "/api/auth/register", body, {}
+
+
+def _login(bench: Bench) -> Request:
+    user = bench.rng.choice(bench.users)
+    body = {"email": user["email"], "password": PASSWORD}
+    return "POST", "/api/auth/login", body, {}
+
+
+def _refresh(bench: Bench) -> Request:
+    user = bench.rng.choice(bench.users)
+    body = {"refresh_token": create_refresh_token(user["id"])}
+    return "POST", "/api/auth/refresh", body, {}
+
+
+def _logout(bench: Bench) -> Request:
+    user = bench.rng.choice(bench.users)
+    # A token of its own, as the shared one would stop working
+    headers = {"Authorization": f"Bearer {create_access_token(user['id'])}"}
+    body = {"refresh_token": create_refresh_token(user["id"])}
+    return "POST", "/api/auth/logout", body, headers
+
+
+def _revoke(bench: Bench) -> Request:
+    user = bench.rng.choice(bench.users)
+    body = {"token": create_refresh_token(user["id"])}
+    return "POST", "/api/auth/revoke", body, bench.auth(user["id"])
+
+
+def _create_budget(bench: Bench) -> Request:
+    user = bench.rng.choice(bench.users)
+    body = {"name": "Benchmark", "is_default": False}
+    return "POST", "/api/budgets/", body, bench.auth(user["id"])
+
+
+def _list_budgets(bench: Bench) -> Request:
+    user = bench.rng.choice(bench.users)
+    return "GET", "/api/budgets/", None, bench.auth(user["id"])
+
+
+def _get_budget(bench: Bench) -> Request:
+    user, budget = bench.pick()
+    return "GET", f"/api/budgets/{budget['id']}", None, bench.auth(user["id"])
+
+
+def _update_budget(bench: Bench) -> Request:
+    user, budget = bench.pick()
+    body = {"name": f"Budget {bench.rng.randrange(1000)}", "is_default": False}
+    return "PUT", f"/api/budgets/{budget['id']}", body, bench.auth(user["id"])
+
+
+def _budget_summary(bench: Bench) -> Request:
+    user, budget = bench.pick()
+    path = f"/api/budgets/{budget['id']}/summary"
+    return "GET", path, None, bench.auth(user["id"])
+
+
+def _clone_budget(bench: Bench) -> Request:
+    user, budget = bench.pick()
+    body = {"name": "Clone", "include_allocations": True}
+    path = f"/api/budgets/{budget['id']}/clone"
+    return "POST", path, body, bench.auth(user["id"])
+
+
+def _delete_budget(bench: Bench) -> Request:
+    user = bench.rng.choice(bench.users)
+    budget_id = bench.fresh_budget(user["id"])
+    return "DELETE", f"/api/budgets/{budget_id}", None, bench.auth(user["id"])
+
+
+def _budget_deletion(bench: Bench) -> Request:
+    user = bench.rng.choice(bench.users)
+    budget_id = bench.fresh_budget(user["id"], deleted=True)
+    path = f"/api/budgets/{budget_id}/deletion"
+    return "GET", path, None, bench.auth(user["id"])
+
+
+def _create_category(bench: Bench) -> Request:
+    user, budget = bench.pick()
+    body = {"budget_id": budget["id"], "name": "Benchmark", "allocated": "10.00"}
+    return "POST", "/api/categories/", body, bench.auth(user["id"])
+
+
+def _list_categories(bench: Bench) -> Request:
+    user, budget = bench.pick()
+    path = f"/api/categories/?budget_id={budget['id']}"
+    return "GET", path, None, bench.auth(user["id"])
+
+
+def _get_category(bench: Bench) -> Request:
+    user, budget = bench.pick()
+    path = f"/api/categories/{bench.rng.choice(budget['categories'])}"
+    return "GET", path, None, bench.auth(user["id"])
+
+
+def _update_category(bench: Bench) -> Request:
+    user, budget = bench.pick()
+    body = {
+        "budget_id": budget["id"],
+        "name": "Renamed",
+        "allocated": f"{bench.rng.randrange(1000)}.00",
+    }
+    path = f"/api/categories/{bench.rng.choice(budget['categories'])}"
+    return "PUT", path, body, bench.auth(user["id"])
+
+
+def _delete_category(bench: Bench) -> Request:
+    user, budget = bench.pick()
+    category_id = bench.insert("categories", budget_id=budget["id"], name="Scratch")
+    return "DELETE", f"/api/categories/{category_id}", None, bench.auth(user["id"])
+
+
+def _create_account(bench: Bench) -> Request:
+    user, budget = bench.pick()
+    body = {"budget_id": budget["id"], "name": "Benchmark", "type": "checking"}
+    return "POST", "/api/accounts/", body, bench.auth(user["id"])
+
+
+def _list_accounts(bench: Bench) -> Request:
+    user, budget = bench.pick()
+    path = f"/api/accounts/?budget_id={budget['id']}"
+    return "GET", path, None, bench.auth(user["id"])
+
+
+def _get_account(bench: Bench) -> Request:
+    user, budget = bench.pick()
+    path = f"/api/accounts/{bench.rng.choice(budget['accounts'])}"
+    return "GET", path, None, bench.auth(user["id"])
+
+
+def _update_account(bench: Bench) -> Request:
+    user, budget = bench.pick()
+    body = {"budget_id": budget["id"], "name": "Renamed", "type": "savings"}
+    path = f"/api/accounts/{bench.rng.choice(budget['accounts'])}"
+    return "PUT", path, body, bench.auth(user["id"])
+
+
+def _delete_account(bench: Bench) -> Request:
+    user, budget = bench.pick()
+    account_id = bench.insert(
+        "accounts", budget_id=budget["id"], name="Scratch", type="checking"
+    )
+    return "DELETE", f"/api/accounts/{account_id}", None, bench.auth(user["id"])
+
+
+def _create_transaction(bench: Bench) -> Request:
+    user, budget = bench.pick()
+    body = _transaction(budget, bench.rng)
+    return "POST", "/api/transactions/", body, bench.auth(user["id"])
+
+
+def _list_transactions(bench: Bench) -> Request:
+    user, budget = bench.pick()
+    path = f"/api/transactions/?budget_id={budget['id']}"
+    return "GET", path, None, bench.auth(user["id"])
+
+
+def _get_transaction(bench: Bench) -> Request:
+    user, budget = bench.pick()
+    path = f"/api/transactions/{bench.rng.choice(budget['transactions'])}"
+    return "GET", path, None, bench.auth(user["id"])
+
+
+def _update_transaction(bench: Bench) -> Request:
+    user, budget = bench.pick()
+    body = _transaction(budget, bench.rng)
+    body["amount"] = f"-{bench.rng.randrange(1, 100)}.00"
+    path = f"/api/transactions/{bench.rng.choice(budget['transactions'])}"
+    return "PUT", path, body, bench.auth(user["id"])
+
+
+def _delete_transaction(bench: Bench) -> Request:
+    user, budget = bench.pick()
+    values = _transaction(budget, bench.rng)
+    values["amount"] = _money(-1234)
+    transaction_id = bench.insert("transactions", **values)
+    path = f"/api/transactions/{transaction_id}"
+    return "DELETE", path, None, bench.auth(user["id"])
+
+
+def _batch(bench: Bench) -> Request:
+    # What a client loads when opening a budget
+    user, budget = bench.pick()
+    body = {
+        "requests": [
+            {"method": "GET", "path": f"/api/budgets/{budget['id']}"},
+            {"method": "GET", "path": f"/api/categories/?budget_id={budget['id']}"},
+            {"method": "GET", "path": f"/api/accounts/?budget_id={budget['id']}"},
+            {"method": "GET", "path": f"/api/budgets/{budget['id']}/summary"},
+        ]
+    }
+    return "POST", "/api/batch/", body, bench.auth(user["id"])
+
+
+SCENARIOS: Dict[str, Callable[[Bench], Request]] = {
+    "POST /api/auth/register": _register,
+    "POST /api/auth/login": _login,
+    "POST /api/auth/refresh": _refresh,
+    "POST /api/auth/logout": _logout,
+    "POST /api/auth/revoke": _revoke,
+    "POST /api/budgets/": _create_budget,
+    "GET /api/budgets/": _list_budgets,
+    "GET /api/budgets/{budget_id}": _get_budget,
+    "PUT /api/budgets/{budget_id}": _update_budget,
+    "GET /api/budgets/{budget_id}/summary": _budget_summary,
+    "POST /api/budgets/{budget_id}/clone": _clone_budget,
+    "DELETE /api/budgets/{budget_id}": _delete_budget,
+    "GET /api/budgets/{budget_id}/deletion": _budget_deletion,
+    "POST /api/categories/": _create_category,
+    "GET /api/categories/": _list_categories,
+    "GET /api/categories/{category_id}": _get_category,
+    "PUT /api/categories/{category_id}": _update_category,
+    "DELETE /api/categories/{category_id}": _delete_category,
+    "POST /api/accounts/": _create_account,
+    "GET /api/accounts/": _list_accounts,
+    "GET /api/accounts/{account_id}": _get_account,
+    "PUT /api/accounts/{account_id}": _update_account,
+    "DELETE /api/accounts/{account_id}": _delete_account,
+    "POST /api/transactions/": _create_transaction,
+    "GET /api/transactions/": _list_transactions,
+    "GET /api/transactions/{transaction_id}": _get_transaction,
+    "PUT /api/transactions/{transaction_id}": _update_transaction,
+    "DELETE /api/transactions/{transaction_id}": _delete_transaction,
+    "POST /api/batch/": _batch,
+}
+# Routes that are declared but not implemented yet
+UNIMPLEMENTED = {
+    "POST /api/users/",
+    "GET /api/users/{user_id}",
+    "DELETE /api/users/{user_id}",
+}
+
+
+def api_routes(app) -> List[str]:
+    """
+    Lists the API's routes as "METHOD /path/template".
+    """
+    return [
+        f"{method.upper()} {path}"
+        for path, operations in app.openapi()["paths"].items()
+        if path.startswith("/api/")
+        for method in operations
+    ]
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, round(percent / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+async def run_route(
+    client: httpx.AsyncClient,
+    bench: Bench,
+    scenario: Callable[[Bench], Request],
+    requests: int,
+    concurrency: int,
+) -> dict:
+    """
+    Sends a route's requests with a fixed number in flight.
+    """
+    bench.reset_tokens()
+    # Built up front so setup writes are not timed
+    pending = [scenario(bench) for _ in range(requests)]
+    latencies: List[float] = []
+    round_trips: List[int] = []
+    statuses: Dict[str, int] = {}
+
+    async def worker() -> None:
+        while pending:
+            method, path, body, headers = pending.pop()
+            started = time.perf_counter()
+            response = await client.request(method, path, json=body, headers=headers)
+            latencies.append(time.perf_counter() - started)
+
+            status = str(response.status_code)
+            statuses[status] = statuses.get(status, 0) + 1
+            match = ROUND_TRIPS.search(response.headers.get("Server-Timing", ""))
+            if match:
+                round_trips.append(int(match.group(1)))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": requests,
+        "errors": sum(n for status, n in statuses.items() if int(status) >= 400),
+        "statuses": statuses,
+        "throughput_rps": round(requests / elapsed, 1),
+        "latency_ms": {
+            "p50": round(_percentile(latencies, 50) * 1000, 2),
+            "p90": round(_percentile(latencies, 90) * 1000, 2),
+            "p99": round(_percentile(latencies, 99) * 1000, 2),
+            "max": round(max(latencies) * 1000, 2),
+            "mean": round(mean(latencies) * 1000, 2),
+        },
+        "round_trips": {
+            "mean": round(mean(round_trips), 2) if round_trips else None,
+            "max": max(round_trips) if round_trips else None,
+        },
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_standin(path: str, latency_ms: float, jitter_ms: float) -> Tuple[Any, str]:
+    port = _free_port()
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.standin",
+            "--port",
+            str(port),
+            "--db",
+            path,
+            "--latency-ms",
+            str(latency_ms),
+            "--jitter-ms",
+            str(jitter_ms),
+        ],
+        stdout=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("The stand-in exited during startup")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            return process, url
+        except OSError:
+            time.sleep(0.05)
+    process.terminate()
+    raise RuntimeError("The stand-in did not start within 30 seconds")
+
+
+def configure(url: str) -> None:
+    """
+    Point the app at the stand-in.
+    """
+    # The stand-in accepts any key, but the Supabase client wants a JWT
+    key = jwt.encode({"role": "anon"}, "standin", algorithm="HS256")
+    settings.DB_BACKEND = "supabase"
+    settings.SUPABASE_URL = url
+    settings.SUPABASE_KEY = key
+    settings.SUPABASE_SERVICE_KEY = key
+    settings.SUPABASE_REPLICA_URL = ""
+    settings.SUPABASE_RLS_MODE = False
+    # The stand-in speaks HTTP/1.1 only
+    settings.SUPABASE_HTTP2 = False
+    # Every request would come from one address and a few users
+    settings.RATE_LIMIT_ENABLED = False
+    if not settings.JWT_SECRET_KEY:
+        settings.JWT_SECRET_KEY = uuid.uuid4().hex
+
+
+async def run(args: argparse.Namespace, bench: Bench) -> dict:
+    from app.main import app
+
+    routes = api_routes(app)
+    results: Dict[str, Any] = {}
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench", timeout=60.0
+        ) as client:
+            for route in routes:
+                if args.routes and not any(r in route for r in args.routes):
+                    continue
+                scenario = SCENARIOS.get(route)
+                if scenario is None:
+                    reason = (
+                        "not implemented" if route in UNIMPLEMENTED else "no scenario"
+                    )
+                    results[route] = {"skipped": reason}
+                    continue
+
+                results[route] = await run_route(
+                    client, bench, scenario, args.requests, args.concurrency
+                )
+                print(f"{route}: {_summary(results[route])}", file=sys.stderr)
+    return results
+
+
+def _summary(result: dict) -> str:
+    latency = result["latency_ms"]
+    return (
+        f"{result['throughput_rps']} req/s, p50 {latency['p50']} ms, "
+        f"p99 {latency['p99']} ms, {result['round_trips']['mean']} round trips, "
+        f"{result['errors']} errors"
+    )
+
+
+def compare(results: dict, baseline: dict) -> Dict[str, dict]:
+    """
+    Change of each route's throughput, latency and round trips from a
+    baseline run, as new value minus old.
+    """
+    changes = {}
+    for route, result in results["routes"].items():
+        old = baseline["routes"].get(route)
+        if "skipped" in result or not old or "skipped" in old:
+            continue
+        changes[route] = {
+            "throughput_rps": round(
+                result["throughput_rps"] - old["throughput_rps"], 1
+            ),
+            "p50_ms": round(result["latency_ms"]["p50"] - old["latency_ms"]["p50"], 2),
+            "p99_ms": round(result["latency_ms"]["p99"] - old["latency_ms"]["p99"], 2),
+            "round_trips": (
+                round(result["round_trips"]["mean"] - old["round_trips"]["mean"], 2)
+                if result["round_trips"]["mean"] is not None
+                and old["round_trips"]["mean"] is not None
+                else None
+            ),
+        }
+    return changes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--users", type=int)
+    parser.add_argument("--budgets-per-user", type=int)
+    parser.add_argument("--transactions-per-budget", type=int)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--jitter-ms", type=float, default=2.0)
+    parser.add_argument("--db", help="SQLite file to seed, or reuse if it exists")
+    parser.add_argument(
+        "--routes", nargs="*", help="Only routes containing one of these strings"
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the results to this file")
+    parser.add_argument("--compare", help="Results of an earlier run to compare to")
+    args = parser.parse_args()
+
+    scale = dict(SCALES[args.scale])
+    for key, value in (
+        ("users", args.users),
+        ("budgets", args.budgets_per_user),
+        ("transactions", args.transactions_per_budget),
+    ):
+        if value is not None:
+            scale[key] = value
+
+    rng = random.Random(args.seed)
+    directory = None
+    path = args.db
+    if path is None:
+        directory = tempfile.TemporaryDirectory()
+        path = os.path.join(directory.name, "bench.db")
+    if not os.path.exists(path):
+        started = time.perf_counter()
+        seed(path, scale, rng)
+        print(f"Seeded {path} in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    process, url = start_standin(path, args.latency_ms, args.jitter_ms)
+    try:
+        configure(url)
+        bench = Bench(path, rng)
+        data = {
+            table: bench.connection.execute(f"SELECT count(*) FROM {table}").fetchone()[
+                0
+            ]
+            for table in ("users", "budgets", "transactions")
+        }
+        routes = asyncio.run(run(args, bench))
+        bench.connection.close()
+    finally:
+        process.terminate()
+        process.wait()
+        if directory is not None:
+            directory.cleanup()
+
+    results = {
+        "config": {
+            "scale": args.scale,
+            "data": data,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "latency_ms": args.latency_ms,
+            "jitter_ms": args.jitter_ms,
+            "python": sys.version.split()[0],
+            "run_at": _timestamp(),
+        },
+        "routes": routes,
+    }
+    if args.compare:
+        with open(args.compare) as f:
+            results["compared_to"] = args.compare
+            results["changes"] = compare(results, json.load(f))
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Per-row cost of serializing list responses.
+
+Compares the original path (validate each row into a *Read model, then let
+FastAPI validate and serialize it again through response_model) with the
+fast path in app.utils.responses.fast_list_response.
+
+Usage:
+    python -m benchmarks.serialization [--rows 10000] [--repeat 5]
+"""
+
+import argparse
+import json
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+from app.models.transaction import TransactionRead
+from app.utils.responses import fast_list_response
+
+
+def make_rows(count: int) -> List[dict]:
+    """
+    Build transaction rows shaped like PostgREST output.
+    """
+    budget_id = str(uuid.uuid4())
+    account_id = str(uuid.uuid4())
+    category_id = str(uuid.uuid4())
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    return [
+        {
+            "date": (date(2024, 1, 1) + timedelta(days=i % 365)).isoformat(),
+            "payee": f"Payee {i % 250}",
+            "amount": round(-((i * 37) % 10000) / 100, 2),
+            "note": "Weekly shop" if i % 3 == 0 else None,
+            "cleared": i % 2 == 0,
+            "id": str(uuid.uuid4()),
+            "budget_id": budget_id,
+            "account_id": account_id,
+            "category_id": category_id if i % 5 else None,
+            "created_at": (start + timedelta(minutes=i)).isoformat(),
+            "version": 1,
+        }
+        for i in range(count)
+    ]
+
+
+def model_path(rows: List[dict]) -> bytes:
+    # What the endpoints used to do: build models in the handler, then
+    # FastAPI re-validates them against response_model and encodes them.
+    models = [TransactionRead(**row) for row in rows]
+    adapter = TypeAdapter(List[TransactionRead])
+    validated = adapter.validate_python(models, from_attributes=True)
+    return JSONResponse(jsonable_encoder(validated)).body
+
+
+def fast_path(rows: List[dict]) -> bytes:
+    return fast_list_response(rows, decimal_fields=("amount",)).body
+
+
+def bench(fn, rows: List[dict], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        batch = [dict(row) for row in rows]
+        started = time.perf_counter()
+        fn(batch)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    results = {}
+    for name, fn in (("model", model_path), ("fast", fast_path)):
+        seconds = bench(fn, rows, args.repeat)
+        results[name] = {
+            "total_ms": round(seconds * 1000, 3),
+            "per_row_us": round(seconds / args.rows * 1e6, 3),
+        }
+    results["speedup"] = round(
+        results["model"]["total_ms"] / results["fast"]["total_ms"], 1
+    )
+
+    print(json.dumps({"rows": args.rows, **results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""
+Local stand-in for Supabase, for benchmarks.
+
+Answers the PostgREST requests the app makes (select, insert, update and
+delete with eq, neq, lt, gt, gte, is, in and not filters, order, limit and
+exact counts) and the Supabase Auth sign-up and password sign-in calls, on a
+SQLite file through app.db.sqlite. Every request can be delayed to model the
+network and database latency of a hosted project.
+
+Usage:
+    python -m benchmarks.standin [--port 54321] [--db bench.db] [--latency-ms 5]
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+from postgrest.exceptions import APIError
+
+from app.db.sqlite import SqliteDatabase
+
+# HTTP status PostgREST answers with for each SQLSTATE
+ERROR_STATUS = {"23505": 409, "23503": 409, "42P01": 404}
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot encode {type(value).__name__}")
+
+
+def _in_values(criteria: str) -> List[str]:
+    values = criteria[1:-1].split(",") if criteria.startswith("(") else []
+    return [value.strip().strip('"') for value in values if value != ""]
+
+
+def _user_json(user_id: str, email: str, name: Optional[str] = None) -> dict:
+    return {
+        "id": user_id,
+        "aud": "authenticated",
+        "role": "authenticated",
+        "email": email,
+        "app_metadata": {"provider": "email"},
+        "user_metadata": {"name": name} if name else {},
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+class StandIn:
+    """
+    Supabase stand-in serving a SqliteDatabase over HTTP on a background thread.
+
+    Args:
+        path: SQLite file to serve (":memory:" for an empty database)
+        latency: Seconds added to every request
+        jitter: Up to this many seconds are added at random on top of latency
+    """
+
+    def __init__(
+        self, path: str, port: int = 0, latency: float = 0.0, jitter: float = 0.0
+    ):
+        self.database = SqliteDatabase(path)
+        self.latency = latency
+        self.jitter = jitter
+        self.requests = 0
+
+        handler = type("Handler", (_Handler,), {"standin": self})
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StandIn":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def delay(self) -> None:
+        self.requests += 1
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Send the headers and body in one segment; with Nagle's algorithm and
+    # delayed ACKs a separate body write stalls each response by ~40 ms
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+    standin: StandIn
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        self._handle()
+
+    def do_HEAD(self) -> None:
+        self._handle()
+
+    def do_POST(self) -> None:
+        self._handle()
+
+    def do_PATCH(self) -> None:
+        self._handle()
+
+    def do_DELETE(self) -> None:
+        self._handle()
+
+    def _body(self) -> Any:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length)) if length else None
+
+    def _send(
+        self, status: int, payload: Any, headers: Tuple[Tuple[str, str], ...] = ()
+    ) -> None:
+        body = json.dumps(payload, default=_json_default).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _handle(self) -> None:
+        self.standin.delay()
+        url = urlsplit(self.path)
+        parts = url.path.strip("/").split("/")
+        params = parse_qsl(url.query, keep_blank_values=True)
+        body = self._body()
+
+        try:
+            if parts[:2] == ["rest", "v1"] and len(parts) == 3:
+                self._rest(parts[2], params, body)
+            elif parts[:2] == ["auth", "v1"] and len(parts) == 3:
+                self._auth(parts[2], body)
+            else:
+                self._send(404, {"message": f"No route for {url.path}"})
+        except APIError as e:
+            self._send(
+                ERROR_STATUS.get(e.code, 400),
+                {"code": e.code, "message": e.message, "details": None, "hint": None},
+            )
+
+    def _rest(self, table: str, params: List[Tuple[str, str]], body: Any) -> None:
+        prefer = self.headers.get("Prefer", "")
+        count = "exact" if "count=exact" in prefer else None
+        query = self.standin.database.table(table)
+
+        # For writes, select only chooses the columns returned
+        columns = next((value for key, value in params if key == "select"), "*")
+        query.select(columns, count=count)
+        if self.command == "POST":
+            query.insert(body)
+        elif self.command == "PATCH":
+            query.update(body)
+        elif self.command == "DELETE":
+            query.delete()
+
+        for key, value in params:
+            if key == "select":
+                continue
+            if key == "limit":
+                query.limit(int(value))
+                continue
+            if key == "order":
+                for term in value.split(","):
+                    column, *modifiers = term.split(".")
+                    query.order(column, desc="desc" in modifiers)
+                continue
+            if key in ("offset", "columns", "on_conflict"):
+                continue
+
+            if value.startswith("not."):
+                query.not_
+                value = value[4:]
+            operator, _, criteria = value.partition(".")
+            if operator == "in":
+                query.in_(key, _in_values(criteria))
+            elif operator in ("eq", "neq", "lt", "gt", "gte", "is"):
+                getattr(query, "is_" if operator == "is" else operator)(key, criteria)
+            else:
+                raise APIError(
+                    {"code": "PGRST100", "message": f"Unsupported operator {operator}"}
+                )
+
+        # Straight to the database, so the app's query metrics only count its own calls
+        result = self.standin.database.execute(query)
+        headers = ()
+        if result.count is not None:
+            end = max(len(result.data) - 1, 0)
+            headers = (("Content-Range", f"0-{end}/{result.count}"),)
+        self._send(201 if self.command == "POST" else 200, result.data, headers)
+
+    def _auth(self, endpoint: str, body: dict) -> None:
+        auth = self.standin.database.auth
+        credentials = {"email": body.get("email"), "password": body.get("password")}
+
+        if endpoint == "signup":
+            response = auth.sign_up(credentials)
+            name = (body.get("data") or {}).get("name")
+            self._send(200, _user_json(response.user.id, response.user.email, name))
+        elif endpoint == "token":
+            response = auth.sign_in_with_password(credentials)
+            if response.user is None:
+                self._send(
+                    400,
+                    {
+                        "error": "invalid_grant",
+                        "error_description": "Invalid login credentials",
+                    },
+                )
+                return
+            self._send(
+                200,
+                {
+                    "access_token": "standin",
+                    "refresh_token": "standin",
+                    "token_type": "bearer",
+                    "expires_in": 3600,
+                    "user": _user_json(response.user.id, response.user.email),
+                },
+            )
+        else:
+            self._send(404, {"message": f"No auth endpoint {endpoint}"})
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--port", type=int, default=54321)
+    parser.add_argument("--db", default="bench.db")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    standin = StandIn(
+        args.db, args.port, args.latency_ms / 1000, args.jitter_ms / 1000
+    ).start()
+    print(f"Serving {args.db} on {standin.url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        standin.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,4 @@
+import os
+
+# Settings are read on import; tokens need a key
+os.environ.setdefault("JWT_SECRET_KEY", "test-secret-key-" + "x" * 32)
@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.api.routers.budgets import clone_budget
+from app.db import purge
+from app.db.loader import Loader
+from app.db.purge import get_deletion
+from app.db.sqlite import SqliteDatabase
+from app.models.budget import BudgetClone
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    database = SqliteDatabase(str(tmp_path / "clone.db"))
+    monkeypatch.setattr(purge, "get_admin_db", lambda: database)
+    return database
+
+
+def test_a_failed_clone_is_deleted_and_purged(database, monkeypatch):
+    user = database.table("users").insert({"email": "a@example.com", "name": "A"})
+    user_id = user.execute().data[0]["id"]
+    source = (
+        database.table("budgets")
+        .insert({"user_id": user_id, "name": "Home"})
+        .execute()
+        .data[0]["id"]
+    )
+    database.table("categories").insert({"budget_id": source, "name": "Food"}).execute()
+    database.table("accounts").insert(
+        {"budget_id": source, "name": "Cash", "type": "cash"}
+    ).execute()
+
+    execute = database.execute
+
+    def failing_account_copies(query):
+        if query.table == "accounts" and query.operation == "insert":
+            raise RuntimeError("insert failed")
+        return execute(query)
+
+    monkeypatch.setattr(database, "execute", failing_account_copies)
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(
+            clone_budget(
+                source,
+                BudgetClone(name="Copy"),
+                user_id,
+                database,
+                Loader(database),
+            )
+        )
+    assert error.value.status_code == 500
+
+    clone = database.table("budgets").select("*").eq("name", "Copy").execute().data[0]
+    # Hidden from the user, with its copied categories left to the purger
+    assert clone["deleted_at"] is not None
+    assert get_deletion(clone["id"], user_id)["status"] == "pending"
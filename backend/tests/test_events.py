@@ -0,0 +1,89 @@
+import asyncio
+
+import orjson
+import pytest
+
+from app.api.routers.budgets import _write_default_budget
+from app.config.settings import settings
+from app.db.sqlite import SqliteDatabase
+from app.utils.events import (
+    DELETED,
+    KEEP_ALIVE,
+    READY,
+    UNAUTHORIZED,
+    changes,
+    stream_changes,
+)
+
+
+@pytest.fixture
+def database(tmp_path):
+    return SqliteDatabase(str(tmp_path / "events.db"))
+
+
+def _events(subscriber):
+    events = []
+    while not subscriber.queue.empty():
+        message = subscriber.queue.get_nowait()
+        events.append(orjson.loads(message.split(b"data: ", 1)[1]))
+    return events
+
+
+def test_clearing_the_default_budget_publishes_an_update(database):
+    user = database.table("users").insert({"email": "a@example.com", "name": "A"})
+    user_id = user.execute().data[0]["id"]
+
+    def create(name):
+        return (
+            database.table("budgets")
+            .insert({"user_id": user_id, "name": name, "is_default": True})
+            .execute()
+        )
+
+    first = create("First").data[0]["id"]
+    subscriber = changes.subscribe(first)
+    try:
+        second = _write_default_budget(database, user_id, lambda: create("Second"))
+
+        assert second.data[0]["is_default"] is True
+        assert _events(subscriber) == [
+            {"entity": "budget", "id": first, "operation": "update"}
+        ]
+    finally:
+        changes.unsubscribe(subscriber)
+
+
+def test_a_stream_ends_once_its_token_is_no_longer_valid(monkeypatch):
+    monkeypatch.setattr(settings, "EVENTS_HEARTBEAT_SECONDS", 0.01)
+    checks = []
+
+    def authorized():
+        checks.append(True)
+        # Revoked after the first heartbeat
+        return len(checks) < 2
+
+    async def run():
+        return [message async for message in stream_changes("budget", authorized)]
+
+    assert asyncio.run(run()) == [READY, KEEP_ALIVE, UNAUTHORIZED]
+    assert len(changes) == 0
+
+
+def test_deleting_a_budget_ends_its_streams():
+    async def run():
+        stream = stream_changes("budget", lambda: True)
+        assert await stream.__anext__() == READY
+
+        changes.publish("budget", "budget", "budget", "delete")
+        changes.close("budget")
+        return [message async for message in stream]
+
+    messages = asyncio.run(run())
+
+    assert orjson.loads(messages[0].split(b"data: ", 1)[1]) == {
+        "entity": "budget",
+        "id": "budget",
+        "operation": "delete",
+    }
+    assert messages[1:] == [DELETED]
+    assert len(changes) == 0
@@ -0,0 +1,172 @@
+import asyncio
+import time
+import uuid
+
+import pytest
+
+from app.config.settings import settings
+from app.db import outbox as outbox_module
+from app.db.outbox import Outbox
+from app.db.sqlite import SqliteDatabase
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    database = SqliteDatabase(str(tmp_path / "outbox.db"))
+    monkeypatch.setattr(outbox_module, "get_admin_db", lambda: database)
+    monkeypatch.setattr(settings, "OUTBOX_ENABLED", True)
+    monkeypatch.setattr(settings, "OUTBOX_POLL_SECONDS", 0.05)
+    return database
+
+
+def _lease(database):
+    return database.table("outbox_lease").select("*").execute().data
+
+
+def test_only_one_worker_holds_the_lease(database):
+    first, second = Outbox(), Outbox()
+
+    assert first._acquire_lease()
+    assert not second._acquire_lease()
+    # Renewed by its holder
+    assert first._acquire_lease()
+    assert _lease(database)[0]["holder"] == first.holder
+
+    first._release_lease()
+    assert second._acquire_lease()
+    assert not first._acquire_lease()
+    assert _lease(database)[0]["holder"] == second.holder
+
+
+def test_an_expired_lease_is_taken_over(database, monkeypatch):
+    first, second = Outbox(), Outbox()
+
+    monkeypatch.setattr(settings, "OUTBOX_LEASE_SECONDS", -1.0)
+    assert first._acquire_lease()
+
+    monkeypatch.setattr(settings, "OUTBOX_LEASE_SECONDS", 30.0)
+    assert second._acquire_lease()
+    assert not first._acquire_lease()
+    assert len(_lease(database)) == 1
+
+
+def test_events_are_applied_by_the_lease_holder_only(database):
+    budget_id = str(uuid.uuid4())
+    events = [
+        {
+            "budget_id": budget_id,
+            "table_name": "transactions",
+            "row_id": str(uuid.uuid4()),
+            "operation": "insert",
+        }
+        for _ in range(5)
+    ]
+
+    async def run():
+        workers = [Outbox(), Outbox()]
+        applied = {worker.holder: [] for worker in workers}
+        for worker in workers:
+
+            async def handler(run, holder=worker.holder):
+                applied[holder].extend(event["id"] for event in run)
+
+            worker.register("transactions", handler)
+            worker.start()
+
+        try:
+            for event in events:
+                database.table("outbox").insert(event).execute()
+                for worker in workers:
+                    worker.notify()
+                await asyncio.sleep(0.01)
+
+            for _ in range(200):
+                if not database.table("outbox").select("id").execute().data:
+                    break
+                await asyncio.sleep(0.01)
+            leaders = [worker.stats()["leader"] for worker in workers]
+        finally:
+            for worker in workers:
+                await worker.stop()
+        return applied, leaders
+
+    applied, leaders = asyncio.run(run())
+
+    assert sorted(leaders) == [False, True]
+    assert sorted(len(ids) for ids in applied.values()) == [0, len(events)]
+    ids = [event_id for ids in applied.values() for event_id in ids]
+    assert ids == sorted(ids)
+
+
+def _event(budget_id):
+    return {
+        "budget_id": budget_id,
+        "table_name": "transactions",
+        "row_id": str(uuid.uuid4()),
+        "operation": "insert",
+    }
+
+
+def test_a_worker_without_the_lease_applies_nothing(database):
+    database.table("outbox").insert(_event(str(uuid.uuid4()))).execute()
+    leader, follower = Outbox(), Outbox()
+    applied = []
+
+    async def handler(run):
+        applied.extend(run)
+
+    follower.register("transactions", handler)
+    assert leader._acquire_lease()
+
+    assert asyncio.run(follower.process_batch()) == 0
+    assert applied == []
+    assert len(database.table("outbox").select("id").execute().data) == 1
+
+
+def test_a_batch_outlasting_the_lease_is_cancelled_and_kept(database, monkeypatch):
+    monkeypatch.setattr(settings, "OUTBOX_LEASE_SECONDS", 0.5)
+    database.table("outbox").insert(_event(str(uuid.uuid4()))).execute()
+    worker = Outbox()
+    finished = []
+
+    async def handler(run):
+        await asyncio.sleep(2)
+        finished.extend(run)
+
+    worker.register("transactions", handler)
+
+    started = time.monotonic()
+    assert asyncio.run(worker.process_batch()) == 1
+    # Stopped before the lease lapsed, so no other worker could take over
+    assert time.monotonic() - started < 0.5
+    assert finished == []
+    assert len(database.table("outbox").select("id").execute().data) == 1
+
+
+def test_a_budget_is_blocked_after_its_events_fail(database, monkeypatch):
+    monkeypatch.setattr(settings, "OUTBOX_MAX_ATTEMPTS", 1)
+    blocked, other = str(uuid.uuid4()), str(uuid.uuid4())
+    database.table("outbox").insert([_event(blocked), _event(other)]).execute()
+    worker = Outbox()
+    applied = []
+
+    async def handler(run):
+        if any(event["budget_id"] == blocked for event in run):
+            raise RuntimeError("handler failed")
+        applied.extend(event["budget_id"] for event in run)
+
+    worker.register("transactions", handler)
+    asyncio.run(worker.process_batch())
+    assert applied == [other]
+
+    # Later events of the blocked budget wait behind the failed one
+    database.table("outbox").insert(_event(blocked)).execute()
+    asyncio.run(worker.process_batch())
+    assert applied == [other]
+    assert worker.stats()["blocked_budgets"] == 1
+
+    # Deleting the failed event unblocks it at the next lease check
+    database.table("outbox").delete().not_.is_("failed_at", "null").execute()
+    worker._lease_checked_at = None
+    assert asyncio.run(worker._hold_lease())
+    assert worker.stats()["blocked_budgets"] == 0
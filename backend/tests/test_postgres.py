@@ -0,0 +1,287 @@
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from uuid import UUID
+
+import pytest
+from postgrest.exceptions import APIError
+
+asyncpg = pytest.importorskip("asyncpg")
+
+from app.db.postgres import DIALECT, PostgresDatabase  # noqa: E402
+from app.db.sql import Dialect, Query  # noqa: E402
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+USER_ID = "6f1c2d3e-0000-4000-8000-000000000001"
+BUDGET_ID = "6f1c2d3e-0000-4000-8000-000000000002"
+
+# The tables the tests use, as in the Supabase schema
+DDL = """
+CREATE TABLE users (
+    id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+    email text NOT NULL UNIQUE,
+    name text,
+    membership_version integer NOT NULL DEFAULT 0,
+    created_at timestamptz NOT NULL DEFAULT now()
+);
+CREATE TABLE budgets (
+    id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+    user_id uuid NOT NULL REFERENCES users (id),
+    name text NOT NULL,
+    is_default boolean NOT NULL DEFAULT false,
+    currency_exponent integer NOT NULL DEFAULT 2,
+    deleted_at timestamptz,
+    created_at timestamptz NOT NULL DEFAULT now(),
+    version integer NOT NULL DEFAULT 1
+);
+CREATE UNIQUE INDEX budgets_one_default ON budgets (user_id) WHERE is_default;
+CREATE TABLE revoked_tokens (
+    jti text PRIMARY KEY,
+    user_id uuid NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    expires_at timestamp NOT NULL,
+    created_at timestamp NOT NULL DEFAULT now()
+);
+CREATE TABLE categories (
+    id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+    budget_id uuid NOT NULL REFERENCES budgets (id),
+    name text NOT NULL,
+    allocated numeric(10, 2) NOT NULL DEFAULT 0,
+    created_at timestamptz NOT NULL DEFAULT now(),
+    version integer NOT NULL DEFAULT 1
+);
+"""
+
+
+def test_dialect_must_implement_placeholders():
+    with pytest.raises(TypeError):
+        Dialect()
+
+
+def test_select_compiles_filters_order_and_limit():
+    query = (
+        Query(None, "budgets")
+        .select("id, name", count="exact")
+        .eq("user_id", USER_ID)
+        .is_("deleted_at", "null")
+        .not_.in_("id", [BUDGET_ID])
+        .order("created_at", desc=True)
+        .limit(5)
+    )
+
+    assert query.compile(DIALECT) == [
+        (
+            'SELECT "id", "name" FROM "budgets" WHERE "user_id" = $1 AND '
+            '"deleted_at" IS NULL AND NOT ("id" = ANY($2)) '
+            'ORDER BY "created_at" DESC LIMIT $3',
+            [UUID(USER_ID), [UUID(BUDGET_ID)], 5],
+        )
+    ]
+    assert query.compile_count(DIALECT) == (
+        'SELECT count(*) FROM "budgets" WHERE "user_id" = $1 AND '
+        '"deleted_at" IS NULL AND NOT ("id" = ANY($2))',
+        [UUID(USER_ID), [UUID(BUDGET_ID)]],
+    )
+
+
+def test_insert_groups_rows_by_columns():
+    query = Query(None, "categories").insert(
+        [
+            {"budget_id": BUDGET_ID, "name": "Rent", "allocated": "950.00"},
+            {"budget_id": BUDGET_ID, "name": "Food"},
+        ]
+    )
+
+    assert query.compile(DIALECT) == [
+        (
+            'INSERT INTO "categories" ("budget_id", "name", "allocated") '
+            "VALUES ($1, $2, $3) RETURNING *",
+            [UUID(BUDGET_ID), "Rent", Decimal("950.00")],
+        ),
+        (
+            'INSERT INTO "categories" ("budget_id", "name") VALUES ($1, $2) '
+            "RETURNING *",
+            [UUID(BUDGET_ID), "Food"],
+        ),
+    ]
+
+
+def test_update_and_delete_compile_with_returning():
+    update = (
+        Query(None, "budgets")
+        .update({"name": "Home", "version": 2})
+        .eq("id", BUDGET_ID)
+        .eq("version", 1)
+    )
+    assert update.compile(DIALECT) == [
+        (
+            'UPDATE "budgets" SET "name" = $1, "version" = $2 '
+            'WHERE "id" = $3 AND "version" = $4 RETURNING *',
+            ["Home", 2, UUID(BUDGET_ID), 1],
+        )
+    ]
+
+    delete = Query(None, "budgets").delete().neq("id", BUDGET_ID)
+    assert delete.compile(DIALECT) == [
+        ('DELETE FROM "budgets" WHERE "id" <> $1 RETURNING *', [UUID(BUDGET_ID)])
+    ]
+
+
+def test_unknown_columns_and_tables_are_rejected():
+    with pytest.raises(APIError) as error:
+        Query(None, "budgets").select("id, secret")
+    assert error.value.code == "42703"
+
+    with pytest.raises(APIError) as error:
+        Query(None, "pg_authid")
+    assert error.value.code == "42P01"
+
+
+def test_postgres_errors_become_api_errors():
+    # A database whose queries fail as the server would, without a pool
+    database = PostgresDatabase.__new__(PostgresDatabase)
+    database.breaker = None
+
+    def fail(coroutine):
+        coroutine.close()
+        raise asyncpg.exceptions.UniqueViolationError("duplicate key value")
+
+    database._run = fail
+
+    with pytest.raises(APIError) as error:
+        Query(database, "budgets").insert({"name": "Home"}).execute()
+    assert error.value.code == "23505"
+
+
+@pytest.fixture
+def database():
+    if not DATABASE_URL:
+        pytest.skip("DATABASE_URL is not set")
+
+    schema = f"spenny_test_{uuid.uuid4().hex[:12]}"
+
+    async def run(sql: str) -> None:
+        connection = await asyncpg.connect(DATABASE_URL)
+        try:
+            await connection.execute(sql)
+        finally:
+            await connection.close()
+
+    asyncio.run(run(f"CREATE SCHEMA {schema}; SET search_path TO {schema};" + DDL))
+    separator = "&" if "?" in DATABASE_URL else "?"
+    database = PostgresDatabase(f"{DATABASE_URL}{separator}search_path={schema}")
+    try:
+        yield database
+    finally:
+        database.close()
+        asyncio.run(run(f"DROP SCHEMA {schema} CASCADE"))
+
+
+def _user(database, email="a@example.com"):
+    return (
+        database.table("users").insert({"email": email, "name": "A"}).execute().data[0]
+    )
+
+
+def test_rows_round_trip_in_postgrest_shape(database):
+    user = _user(database)
+    budget = (
+        database.table("budgets")
+        .insert({"user_id": user["id"], "name": "Home", "is_default": True})
+        .execute()
+        .data[0]
+    )
+
+    assert isinstance(budget["id"], str) and UUID(budget["id"])
+    assert budget["is_default"] is True
+    assert isinstance(budget["created_at"], str)
+    assert budget["deleted_at"] is None
+
+    category = (
+        database.table("categories")
+        .insert({"budget_id": budget["id"], "name": "Rent", "allocated": "950.50"})
+        .execute()
+        .data[0]
+    )
+    assert category["allocated"] == Decimal("950.50")
+
+
+def test_filters_order_limit_and_count(database):
+    user = _user(database)
+    ids = [
+        database.table("budgets")
+        .insert({"user_id": user["id"], "name": name})
+        .execute()
+        .data[0]["id"]
+        for name in ("a", "b", "c")
+    ]
+
+    result = (
+        database.table("budgets")
+        .select("id, name", count="exact")
+        .eq("user_id", user["id"])
+        .not_.in_("id", ids[:1])
+        .order("name", desc=True)
+        .limit(1)
+        .execute()
+    )
+    assert result.data == [{"id": ids[2], "name": "c"}]
+    assert result.count == 2
+
+    updated = (
+        database.table("budgets")
+        .update({"name": "renamed", "version": 2})
+        .in_("id", ids[1:])
+        .eq("version", 1)
+        .execute()
+    )
+    assert sorted(row["id"] for row in updated.data) == sorted(ids[1:])
+
+    deleted = database.table("budgets").delete().eq("id", ids[0]).execute()
+    assert [row["id"] for row in deleted.data] == [ids[0]]
+    assert database.table("budgets").select("id").execute().count is None
+
+
+def test_aware_timestamps_are_stored_as_utc(database):
+    user = _user(database)
+    expires_at = datetime(2030, 1, 1, 12, tzinfo=timezone(timedelta(hours=2)))
+
+    database.table("revoked_tokens").insert(
+        {"jti": "a", "user_id": user["id"], "expires_at": expires_at.isoformat()}
+    ).execute()
+    before = (
+        database.table("revoked_tokens")
+        .select("jti")
+        .lt("expires_at", "2030-01-01T10:00:00Z")
+        .execute()
+    )
+    assert before.data == []
+    stored = (
+        database.table("revoked_tokens")
+        .select("expires_at")
+        .lt("expires_at", "2030-01-01T10:30:00+00:00")
+        .execute()
+    )
+    assert stored.data == [{"expires_at": "2030-01-01T10:00:00"}]
+
+
+@pytest.mark.parametrize(
+    "values, code",
+    [
+        # A second default budget for the same user
+        ({"name": "Second", "is_default": True}, "23505"),
+        ({"name": "Orphan", "user_id": USER_ID}, "23503"),
+        ({"name": None}, "23502"),
+    ],
+)
+def test_constraint_violations_keep_their_sqlstate(database, values, code):
+    user = _user(database)
+    database.table("budgets").insert(
+        {"user_id": user["id"], "name": "First", "is_default": True}
+    ).execute()
+
+    with pytest.raises(APIError) as error:
+        database.table("budgets").insert({"user_id": user["id"], **values}).execute()
+    assert error.value.code == code
@@ -0,0 +1,126 @@
+import asyncio
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+from app.config.settings import settings
+from app.db import purge
+from app.db.purge import BudgetPurger, PurgeLost, get_deletion, record_deletion
+from app.db.sql import QueryResult
+from app.db.sqlite import SqliteDatabase
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    database = SqliteDatabase(str(tmp_path / "purge.db"))
+    monkeypatch.setattr(purge, "get_admin_db", lambda: database)
+    monkeypatch.setattr(settings, "BUDGET_PURGE_BATCH_SIZE", 2)
+    monkeypatch.setattr(settings, "BUDGET_PURGE_BATCH_DELAY_SECONDS", 0)
+    return database
+
+
+@pytest.fixture
+def deleted_budget(database):
+    """
+    A soft-deleted budget with an account and a few transactions, recorded
+    for purging.
+    """
+    user = database.table("users").insert({"email": "a@example.com", "name": "A"})
+    user_id = user.execute().data[0]["id"]
+    budget = (
+        database.table("budgets")
+        .insert(
+            {
+                "user_id": user_id,
+                "name": "Home",
+                "deleted_at": datetime.now(timezone.utc).isoformat(),
+            }
+        )
+        .execute()
+        .data[0]
+    )
+    account = (
+        database.table("accounts")
+        .insert({"budget_id": budget["id"], "name": "Cash", "type": "cash"})
+        .execute()
+        .data[0]
+    )
+    database.table("transactions").insert(
+        [
+            {
+                "budget_id": budget["id"],
+                "account_id": account["id"],
+                "date": "2026-01-01",
+                "payee": f"Payee {i}",
+                "amount": "1.00",
+            }
+            for i in range(5)
+        ]
+    ).execute()
+
+    record_deletion(budget["id"], user_id)
+    # Recording it again leaves the one deletion
+    record_deletion(budget["id"], user_id)
+    return budget["id"], user_id
+
+
+def _rows(database, table, budget_id):
+    column = "id" if table == "budgets" else "budget_id"
+    return database.table(table).select("id").eq(column, budget_id).execute().data
+
+
+def test_a_deletion_is_purged_by_one_worker(database, deleted_budget):
+    budget_id, user_id = deleted_budget
+    first, second = BudgetPurger(), BudgetPurger()
+
+    async def run():
+        return await asyncio.gather(first.purge_next(), second.purge_next())
+
+    assert sorted(asyncio.run(run())) == [False, True]
+
+    deletion = get_deletion(budget_id, user_id)
+    assert deletion["status"] == "completed"
+    assert deletion["started_at"] is not None
+    for table in ("transactions", "accounts", "budgets"):
+        assert _rows(database, table, budget_id) == []
+    assert get_deletion(budget_id, str(uuid.uuid4())) is None
+
+
+def test_a_lapsed_claim_is_taken_over(database, deleted_budget, monkeypatch):
+    budget_id, user_id = deleted_budget
+    first, second = BudgetPurger(), BudgetPurger()
+
+    monkeypatch.setattr(settings, "BUDGET_PURGE_CLAIM_SECONDS", -1.0)
+    assert first._claim(budget_id)
+    monkeypatch.setattr(settings, "BUDGET_PURGE_CLAIM_SECONDS", 60.0)
+    assert second._claim(budget_id)
+    assert not first._claim(budget_id)
+
+    # The first worker stops at its next batch
+    with pytest.raises(PurgeLost):
+        first._renew(budget_id)
+    second._renew(budget_id)
+    assert get_deletion(budget_id, user_id)["claimed_by"] == second.holder
+
+
+def test_a_delete_that_removes_nothing_fails_the_deletion(
+    database, deleted_budget, monkeypatch
+):
+    budget_id, user_id = deleted_budget
+    execute = database.execute
+
+    def ignoring_deletes(query):
+        if query.table == "transactions" and query.operation == "delete":
+            return QueryResult([])
+        return execute(query)
+
+    monkeypatch.setattr(database, "execute", ignoring_deletes)
+
+    assert asyncio.run(BudgetPurger().purge_next())
+
+    deletion = get_deletion(budget_id, user_id)
+    assert deletion["status"] == "failed"
+    assert "could be deleted" in deletion["error"]
+    assert len(_rows(database, "transactions", budget_id)) == 5
+    assert _rows(database, "budgets", budget_id)
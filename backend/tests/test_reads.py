@@ -0,0 +1,67 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.config.settings import settings
+from app.db import reads
+from app.db.reads import execute_read
+
+
+class HeldQuery:
+    """
+    A read whose executions block until released, the first (the primary)
+    then failing or succeeding as told and the second (the hedge) succeeding.
+    """
+
+    table = "budgets"
+
+    def __init__(self, primary_fails: bool = True, hedge_fails: bool = False):
+        self.release = threading.Event()
+        self.outcomes = [primary_fails, hedge_fails]
+        self.started = 0
+        self._lock = threading.Lock()
+
+    def execute(self):
+        with self._lock:
+            index = self.started
+            self.started += 1
+        self.release.wait(5)
+        if self.outcomes[index]:
+            raise RuntimeError(f"read {index} failed")
+        return f"read {index}"
+
+
+@pytest.fixture(autouse=True)
+def hedging(monkeypatch):
+    monkeypatch.setattr(settings, "READ_HEDGE_ENABLED", True)
+    monkeypatch.setattr(reads.latencies, "hedge_delay", lambda table: 0.01)
+
+
+async def _finish_together(query: HeldQuery):
+    """
+    Runs the read until both executions are in flight, then lets them finish
+    while the event loop is blocked, so one wait sees both done.
+    """
+    task = asyncio.create_task(execute_read(query))
+    while query.started < 2:
+        await asyncio.sleep(0.005)
+    query.release.set()
+    time.sleep(0.1)
+    return await task
+
+
+def test_a_successful_hedge_beats_a_failed_primary_finishing_with_it():
+    assert asyncio.run(_finish_together(HeldQuery())) == "read 1"
+
+
+def test_the_primary_is_preferred_when_both_succeed():
+    query = HeldQuery(primary_fails=False)
+    assert asyncio.run(_finish_together(query)) == "read 0"
+
+
+def test_the_primary_error_is_raised_when_every_read_fails():
+    query = HeldQuery(hedge_fails=True)
+    with pytest.raises(RuntimeError, match="read 0 failed"):
+        asyncio.run(_finish_together(query))
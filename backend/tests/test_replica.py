@@ -0,0 +1,123 @@
+import time
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+from jose import jwt
+
+from app.config.settings import settings
+from app.db import client as db_client
+from app.db.breaker import CircuitBreaker, breakers
+from app.db.replica import recent_writers
+from app.main import app
+from app.utils.auth import create_access_token
+from benchmarks.standin import StandIn
+
+USER_ID = str(uuid.uuid4())
+WINDOW = 0.5
+
+
+def _seed(standin: StandIn, budget_name: str) -> None:
+    database = standin.database
+    database.table("users").insert(
+        {"id": USER_ID, "email": "a@example.com", "name": "A"}
+    ).execute()
+    database.table("budgets").insert(
+        {"user_id": USER_ID, "name": budget_name}
+    ).execute()
+
+
+@pytest.fixture
+def standins(tmp_path, monkeypatch):
+    """
+    A primary and a replica, each a stand-in with its own database. Nothing
+    is replicated, so a read shows which of them served it.
+    """
+    primary = StandIn(str(tmp_path / "primary.db")).start()
+    replica = StandIn(str(tmp_path / "replica.db")).start()
+    _seed(primary, "On the primary")
+    _seed(replica, "On the replica")
+
+    # The stand-in accepts any key, but the Supabase client wants a JWT
+    key = jwt.encode({"role": "anon"}, "standin", algorithm="HS256")
+    for name, value in {
+        "DB_BACKEND": "supabase",
+        "SUPABASE_URL": primary.url,
+        "SUPABASE_KEY": key,
+        "SUPABASE_SERVICE_KEY": key,
+        "SUPABASE_REPLICA_URL": replica.url,
+        "SUPABASE_REPLICA_KEY": "",
+        "SUPABASE_RLS_MODE": False,
+        "SUPABASE_HTTP2": False,
+        "SHARED_CACHE_PATH": None,
+        "RATE_LIMIT_ENABLED": False,
+        "READ_YOUR_WRITES_WINDOW": WINDOW,
+    }.items():
+        monkeypatch.setattr(settings, name, value)
+
+    # Clients and breakers of earlier tests would point elsewhere
+    monkeypatch.setattr(db_client, "_clients", {})
+    for name in ("supabase", "supabase_admin", "supabase_replica"):
+        monkeypatch.setattr(db_client, name, None)
+    for name in breakers:
+        monkeypatch.setitem(breakers, name, CircuitBreaker(name))
+    monkeypatch.setattr(recent_writers, "_until", {})
+
+    try:
+        yield primary, replica
+    finally:
+        for client in db_client._clients.values():
+            client.postgrest.session.close()
+        primary.stop()
+        replica.stop()
+
+
+@pytest.fixture
+def client():
+    client = TestClient(app)
+    client.headers["Authorization"] = f"Bearer {create_access_token(USER_ID)}"
+    return client
+
+
+def _budget_names(client) -> list:
+    response = client.get("/api/budgets/")
+    assert response.status_code == 200, response.text
+    return sorted(budget["name"] for budget in response.json())
+
+
+def test_reads_are_served_by_the_replica(standins, client):
+    primary, replica = standins
+
+    assert _budget_names(client) == ["On the replica"]
+    assert replica.requests > 0
+
+
+def test_writes_go_to_the_primary_and_its_reads_follow_for_a_window(standins, client):
+    primary, replica = standins
+
+    response = client.post("/api/budgets/", json={"name": "New"})
+    assert response.status_code == 201, response.text
+    assert (
+        not replica.database.table("budgets")
+        .select("id")
+        .eq("name", "New")
+        .execute()
+        .data
+    )
+
+    # Read your writes: the replica has not seen the new budget
+    replica_requests = replica.requests
+    assert _budget_names(client) == ["New", "On the primary"]
+    assert replica.requests == replica_requests
+
+    time.sleep(WINDOW + 0.1)
+    assert _budget_names(client) == ["On the replica"]
+
+
+def test_reads_fall_back_to_the_primary_without_the_replica(standins, client):
+    primary, replica = standins
+    replica.stop()
+
+    assert _budget_names(client) == ["On the primary"]
+    # The breaker is open, so the next read does not try the replica again
+    assert _budget_names(client) == ["On the primary"]
@@ -0,0 +1,97 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.config.settings import settings
+from app.db import revocation
+from app.db.revocation import RevocationList
+from app.db.sqlite import SqliteDatabase
+
+PAGE_SIZE = 3
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    database = SqliteDatabase(str(tmp_path / "revocation.db"))
+    monkeypatch.setattr(revocation, "get_admin_db", lambda: database)
+    monkeypatch.setattr(settings, "TOKEN_REVOCATION_PAGE_SIZE", PAGE_SIZE)
+    return database
+
+
+@pytest.fixture
+def user_id(database):
+    user = database.table("users").insert({"email": "a@example.com", "name": "A"})
+    return user.execute().data[0]["id"]
+
+
+def _store(database, user_id, jtis, expires_in=timedelta(hours=1)):
+    expires_at = (datetime.now(timezone.utc) + expires_in).isoformat()
+    database.table("revoked_tokens").insert(
+        [{"jti": jti, "user_id": user_id, "expires_at": expires_at} for jti in jtis]
+    ).execute()
+
+
+def _queries(database, monkeypatch):
+    """
+    Counts the rows each select on revoked_tokens returns.
+    """
+    pages = []
+    execute = database.execute
+
+    def counting(query):
+        result = execute(query)
+        if query.table == "revoked_tokens" and query.operation == "select":
+            pages.append(len(result.data))
+        return result
+
+    monkeypatch.setattr(database, "execute", counting)
+    return pages
+
+
+def test_sync_reads_every_page(database, user_id, monkeypatch):
+    revoked = [f"token-{i:02}" for i in range(3 * PAGE_SIZE + 1)]
+    _store(database, user_id, revoked)
+    _store(database, user_id, ["expired"], expires_in=timedelta(hours=-1))
+    pages = _queries(database, monkeypatch)
+
+    tokens = RevocationList()
+    tokens.sync()
+
+    assert pages == [PAGE_SIZE, PAGE_SIZE, PAGE_SIZE, 1]
+    assert all(tokens.is_revoked(jti) for jti in revoked)
+    assert not tokens.is_revoked("expired")
+    assert not tokens.is_revoked("never-revoked")
+    # Expired rows are deleted
+    jtis = database.table("revoked_tokens").select("jti").execute().data
+    assert sorted(row["jti"] for row in jtis) == revoked
+
+
+def test_later_syncs_only_read_new_rows(database, user_id, monkeypatch):
+    _store(database, user_id, [f"old-{i}" for i in range(2 * PAGE_SIZE)])
+    tokens = RevocationList()
+    tokens.sync()
+
+    # Revoked through another worker, after the rows already read
+    time.sleep(0.01)
+    _store(database, user_id, ["new"])
+    pages = _queries(database, monkeypatch)
+    monkeypatch.setattr(revocation, "SYNC_OVERLAP", timedelta(0))
+    tokens.sync()
+
+    assert tokens.is_revoked("new")
+    assert tokens.is_revoked("old-0")
+    # Only rows created at or after the newest one seen are read again
+    assert sum(pages) < 2 * PAGE_SIZE + 1
+
+
+def test_sync_keeps_revocations_made_meanwhile(database, user_id):
+    tokens = RevocationList()
+    tokens.sync()
+
+    expires_at = datetime.now(timezone.utc) + timedelta(hours=1)
+    assert tokens.revoke("local", user_id, expires_at)
+    assert not tokens.revoke("local", user_id, expires_at)
+    tokens.sync()
+
+    assert tokens.is_revoked("local")
@@ -0,0 +1,112 @@
+import multiprocessing
+
+import pytest
+
+from app.config.settings import settings
+from app.db.membership import MembershipVersions
+from app.db.shared_cache import SharedCache
+
+SLOTS = 64
+
+# Forked workers open the table themselves, like uvicorn workers do
+context = multiprocessing.get_context("fork")
+
+
+def _run(target, *args):
+    process = context.Process(target=target, args=args)
+    process.start()
+    process.join(30)
+    assert process.exitcode == 0
+
+
+def _set(path, key, value):
+    SharedCache(path, SLOTS).set(key, value, 60)
+
+
+def _invalidate(path, key):
+    SharedCache(path, SLOTS).invalidate(key)
+
+
+def _hammer(path, worker, rounds, errors):
+    cache = SharedCache(path, SLOTS)
+    for i in range(rounds):
+        # Values repeat one byte, so a torn read shows as mixed bytes
+        value = bytes([(worker * 31 + i) % 251 + 1]) * (1 + i % 100)
+        cache.set("shared", value, 60)
+        cache.set(f"own:{worker}", value, 60)
+        seen = cache.get("shared")
+        if seen is not None and len(set(seen)) > 1:
+            errors.put(f"torn read of {seen!r}")
+        if i % 10 == 0:
+            cache.invalidate(f"own:{worker}")
+            if cache.get(f"own:{worker}") is not None:
+                errors.put("invalidated key still readable")
+        elif cache.get(f"own:{worker}") != value:
+            errors.put("lost own write")
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "cache")
+
+
+def test_set_and_invalidate_are_seen_by_other_processes(path):
+    cache = SharedCache(path, SLOTS)
+
+    _run(_set, path, "membership:u1", b"7")
+    assert cache.get("membership:u1") == b"7"
+
+    cache.set("membership:u2", b"3", 60)
+    _run(_invalidate, path, "membership:u2")
+    assert cache.get("membership:u2") is None
+
+
+def test_expired_values_are_not_returned(path):
+    cache = SharedCache(path, SLOTS)
+    cache.set("key", b"value", -1)
+    assert cache.get("key") is None
+
+
+def test_conditional_set_loses_to_invalidation_in_another_process(path):
+    cache = SharedCache(path, SLOTS)
+
+    # Unknown key: the invalidation still leaves a version behind
+    stamp = cache.version("membership:u1")
+    _run(_invalidate, path, "membership:u1")
+    assert cache.set("membership:u1", b"1", 60, expected_version=stamp) == 0
+    assert cache.get("membership:u1") is None
+
+    stamp = cache.version("membership:u1")
+    assert cache.set("membership:u1", b"2", 60, expected_version=stamp) > stamp
+    assert cache.get("membership:u1") == b"2"
+
+
+def test_concurrent_writers_and_readers(path):
+    SharedCache(path, SLOTS)
+    errors = context.Queue()
+    workers = [
+        context.Process(target=_hammer, args=(path, worker, 500, errors))
+        for worker in range(4)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(60)
+        assert worker.exitcode == 0
+
+    assert errors.empty(), errors.get()
+
+
+@pytest.mark.parametrize("shared", [False, True])
+def test_membership_forget_during_read_is_not_undone(path, monkeypatch, shared):
+    monkeypatch.setattr(settings, "SHARED_CACHE_PATH", path if shared else None)
+    versions = MembershipVersions()
+
+    stamp = versions.stamp("u1")
+    # A budget is created by another request while version 4 is being read
+    versions.forget("u1")
+    versions.set("u1", 4, stamp)
+    assert versions.get("u1") is None
+
+    versions.set("u1", 5, versions.stamp("u1"))
+    assert versions.get("u1") == 5